@@ -0,0 +1,133 @@
+import os
+import json
+import random
+import sqlite3
+
+FIXTURE_VERSION = 1
+
+COLUMN_NAMES = ["name", "city", "country", "title", "genre", "status", "category", "label"]
+NUMERIC_COLUMNS = ["age", "year", "price", "capacity", "rank", "score", "amount", "quantity"]
+WORDS = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliet"]
+
+def _database_tables(rng: random.Random, db_index: int) -> list[dict]:
+    tables = []
+    for t in range(rng.randint(3, 6)):
+        tables.append({
+            "name": f"table{db_index}_{t}",
+            "text": rng.sample(COLUMN_NAMES, rng.randint(1, 3)),
+            "numeric": rng.sample(NUMERIC_COLUMNS, rng.randint(1, 3)),
+            # Every table after the first references the previous one.
+            "parent": f"table{db_index}_{t - 1}" if t else None,
+        })
+    return tables
+
+def _create_database(path: str, tables: list[dict], rows: int, rng: random.Random):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    con = sqlite3.connect(path)
+    for table in tables:
+        columns = ["id INTEGER PRIMARY KEY"]
+        columns += [f"{c} TEXT" for c in table["text"]]
+        columns += [f"{c} INTEGER" for c in table["numeric"]]
+        if table["parent"]:
+            columns.append(f"parent_id INTEGER REFERENCES {table['parent']}(id)")
+        con.execute(f"CREATE TABLE {table['name']} ({', '.join(columns)})")
+
+        placeholders = ", ".join("?" * (1 + len(table["text"]) + len(table["numeric"]) + bool(table["parent"])))
+        con.executemany(
+            f"INSERT INTO {table['name']} VALUES ({placeholders})",
+            [
+                (i, *(rng.choice(WORDS) for _ in table["text"]), *(rng.randint(0, 1000) for _ in table["numeric"]),
+                 *((rng.randint(0, rows - 1),) if table["parent"] else ()))
+                for i in range(rows)
+            ],
+        )
+    con.commit()
+    con.close()
+
+def _question(rng: random.Random, tables: list[dict]) -> tuple[str, str]:
+    table = rng.choice(tables)
+    text = rng.choice(table["text"])
+    number = rng.choice(table["numeric"])
+    kind = rng.randrange(4)
+    if kind == 0:
+        return f"List the {text} of every {table['name']} with {number} above {rng.randint(0, 1000)}.", \
+            f"SELECT {text} FROM {table['name']} WHERE {number} > {rng.randint(0, 1000)}"
+    if kind == 1:
+        return f"How many {table['name']} have {text} {rng.choice(WORDS)}?", \
+            f"SELECT count(*) FROM {table['name']} WHERE {text} = '{rng.choice(WORDS)}'"
+    if kind == 2:
+        return f"What is the average {number} per {text} in {table['name']}?", \
+            f"SELECT {text}, avg({number}) FROM {table['name']} GROUP BY {text} ORDER BY {text}"
+    if table["parent"]:
+        parent = next(t for t in tables if t["name"] == table["parent"])
+        return f"Show the {text} of each {table['name']} and the {parent['text'][0]} of its parent.", \
+            f"SELECT T1.{text}, T2.{parent['text'][0]} FROM {table['name']} AS T1 JOIN {parent['name']} AS T2 ON T1.parent_id = T2.id"
+    return f"Which {table['name']} has the highest {number}?", \
+        f"SELECT {text} FROM {table['name']} ORDER BY {number} DESC LIMIT 1"
+
+def generate_fixtures(root: str, databases: int, questions: int, rows: int = 200, seed: int = 0) -> dict:
+    """
+    Writes a synthetic dataset in both the Spider and the BIRD directory layouts.
+
+    `root/spider` holds `dev.json` and `database/<db_id>/<db_id>.sqlite`; `root/bird`
+    holds `dev_synthetic/dev.json` with symlinks to the same databases. Questions are
+    spread round-robin over the databases. The same arguments always produce the
+    same files, and existing fixtures with matching arguments are reused.
+
+    Args:
+        root: The output directory.
+        databases: The number of databases.
+        questions: The number of questions.
+        rows: The number of rows per table.
+        seed: The random seed.
+
+    Returns:
+        The fixture manifest: the arguments and the paths of both layouts.
+    """
+    manifest_path = os.path.join(root, "manifest.json")
+    manifest = {
+        "version": FIXTURE_VERSION,
+        "databases": databases,
+        "questions": questions,
+        "rows": rows,
+        "seed": seed,
+        "spider": os.path.join(root, "spider"),
+        "bird": os.path.join(root, "bird"),
+    }
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            if json.load(f) == manifest:
+                return manifest
+
+    rng = random.Random(seed)
+    schemas = {}
+    for db_index in range(databases):
+        db_id = f"db_{db_index:04d}"
+        schemas[db_id] = _database_tables(rng, db_index)
+        _create_database(os.path.join(root, "spider", "database", db_id, f"{db_id}.sqlite"), schemas[db_id], rows, rng)
+
+    db_ids = sorted(schemas)
+    items = []
+    for index in range(questions):
+        db_id = db_ids[index % len(db_ids)]
+        question, sql = _question(rng, schemas[db_id])
+        items.append({"db_id": db_id, "question": question, "query": sql})
+
+    with open(os.path.join(root, "spider", "dev.json"), "w") as f:
+        json.dump(items, f)
+
+    bird_dir = os.path.join(root, "bird", "dev_synthetic")
+    os.makedirs(os.path.join(bird_dir, "dev_databases"), exist_ok=True)
+    for db_id in db_ids:
+        link = os.path.join(bird_dir, "dev_databases", db_id)
+        if not os.path.lexists(link):
+            os.symlink(os.path.abspath(os.path.join(root, "spider", "database", db_id)), link)
+    with open(os.path.join(bird_dir, "dev.json"), "w") as f:
+        json.dump([
+            {"db_id": item["db_id"], "question": item["question"], "SQL": item["query"], "evidence": "", "difficulty": "simple"}
+            for item in items
+        ], f)
+
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
@@ -0,0 +1,103 @@
+import gc
+import os
+import sys
+import time
+import platform
+import statistics
+import subprocess
+from dataclasses import dataclass, field, asdict
+from importlib.metadata import version, PackageNotFoundError
+from typing import Callable, Optional
+
+@dataclass
+class StageResult:
+    """
+    The timings of one benchmark stage, in seconds per run.
+    """
+    name: str
+    items: int
+    runs: list[float] = field(default_factory=list)
+
+    def summary(self) -> dict:
+        runs = sorted(self.runs)
+        median = statistics.median(runs)
+        return {
+            **asdict(self),
+            "min": runs[0],
+            "median": median,
+            "mean": statistics.fmean(runs),
+            "stdev": statistics.stdev(runs) if len(runs) > 1 else 0.0,
+            "max": runs[-1],
+            "items_per_second": self.items / median if median else None,
+        }
+
+def time_stage(name: str, items: int, run: Callable[[], None], repeats: int = 5, warmup: int = 1, setup: Optional[Callable[[], None]] = None) -> StageResult:
+    """
+    Times `run` `repeats` times after `warmup` untimed runs.
+
+    Args:
+        name: The stage name.
+        items: The number of items one run processes, used for throughput.
+        run: The code being measured.
+        repeats: The number of timed runs.
+        warmup: The number of untimed runs before the timed ones.
+        setup: Called before every run, outside the timed region.
+
+    Returns:
+        The stage timings.
+    """
+    result = StageResult(name, items)
+    for iteration in range(warmup + repeats):
+        if setup is not None:
+            setup()
+        # Collect garbage up front so a collection does not land inside a single run.
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        if iteration >= warmup:
+            result.runs.append(elapsed)
+    return result
+
+def _package_version(name: str) -> Optional[str]:
+    try:
+        return version(name)
+    except PackageNotFoundError:
+        return None
+
+def environment() -> dict:
+    """
+    Describes where a benchmark ran, so results from different machines and
+    dependency versions are not compared by mistake.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "sqlite": __import__("sqlite3").sqlite_version,
+        "git_commit": commit,
+        "packages": {name: _package_version(name) for name in ("d-schema", "torch", "transformers", "trl", "openai")},
+    }
+
+def compare(current: dict, baseline: dict) -> list[str]:
+    """
+    Formats the median time of each stage relative to a baseline run.
+    """
+    baseline_stages = {stage["name"]: stage for stage in baseline["stages"]}
+    lines = []
+    for stage in current["stages"]:
+        before = baseline_stages.get(stage["name"])
+        if before is None:
+            lines.append(f"{stage['name']:<28} {stage['median']:>10.4f}s  (new)")
+            continue
+        ratio = stage["median"] / before["median"] if before["median"] else float("inf")
+        lines.append(f"{stage['name']:<28} {before['median']:>10.4f}s -> {stage['median']:>10.4f}s  x{ratio:.2f}")
+    return lines
@@ -0,0 +1,153 @@
+"""
+Times the hot paths of sudo-SQL on synthetic Spider/BIRD-style fixtures.
+
+Usage:
+    python -m benchmarks.run --databases 200 --questions 10000 --output bench.json
+    python -m benchmarks.run --baseline bench.json
+"""
+import os
+import re
+import json
+import shutil
+import argparse
+from datetime import datetime
+from loguru import logger
+from benchmarks.fixtures import generate_fixtures
+from benchmarks.harness import time_stage, environment, compare
+from sudo_sql.data_loaders import get_data_loader
+from sudo_sql.environments.sql_execution import SQLExecutionEnvironment
+from sudo_sql.evaluation.metrics import normalize_sql, execution_accuracy
+from sudo_sql.pipeline.inference import InferencePipeline
+from sudo_sql.results import ResultsStore, make_item_id
+
+SCHEMA_TYPE = "ddl-schema"
+
+def _stages(fixtures: dict, work_dir: str, sample: int, workers: int) -> list[tuple]:
+    """
+    Returns (name, items, run, setup) for every stage.
+    """
+    schema_cache = os.path.join(work_dir, "schemas.sqlite")
+    cold_cache = os.path.join(work_dir, "schemas-cold.sqlite")
+
+    def loader(dataset: str, cache_path: str = schema_cache):
+        return get_data_loader(dataset, fixtures[dataset], num_workers=workers, schema_cache_path=cache_path)
+
+    # Warm the shared cache once so the loading stages measure cache hits.
+    items = loader("spider").load_data("dev", SCHEMA_TYPE, True)
+    databases = sorted({(item["db_id"], item["db_path"]) for item in items})
+    sampled = items[:sample]
+    gold = [item["sql"] for item in items]
+
+    def clear_cold_cache():
+        if os.path.exists(cold_cache):
+            os.remove(cold_cache)
+
+    def get_schemas():
+        warm = loader("spider")
+        for db_id, db_path in databases:
+            warm._get_schema(db_path, SCHEMA_TYPE, True, "spider", db_id)
+
+    def execution():
+        for item in sampled:
+            execution_accuracy(item["sql"], item["sql"], item["db_path"])
+
+    # A runaway prediction: the gold query's table joined with itself, compared against the gold result.
+    wide = [(f"SELECT * FROM {table} AS a, {table} AS b", item) for item in sampled for table in re.findall(r"FROM (\w+)", item["sql"])[:1]]
+
+    def execution_wide():
+        for predicted_sql, item in wide:
+            execution_accuracy(predicted_sql, item["sql"], item["db_path"])
+
+    env = SQLExecutionEnvironment()
+
+    def step():
+        for item in sampled:
+            env.reset(item)
+            env.step(item["sql"])
+
+    def step_batch():
+        env.step_batch([(item["sql"], item["db_path"], item["sql"]) for item in sampled])
+
+    results_path = os.path.join(work_dir, "results.jsonl")
+    pipeline = InferencePipeline({"mode": "infer", "model": {}})
+
+    def clear_results():
+        for path in (results_path, results_path + ".idx"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def write_results():
+        store = ResultsStore(results_path)
+        store.open()
+        for index, item in enumerate(items):
+            pipeline._record_result(make_item_id(item["db_id"], item["question"], index), item, item["sql"], store)
+        store.close()
+
+    return [
+        ("schema.generate_cold", len(databases), lambda: loader("spider", cold_cache).warm_cache("dev", SCHEMA_TYPE), clear_cold_cache),
+        ("schema.get_schema_warm", len(databases), get_schemas, None),
+        ("spider.load_data", len(items), lambda: loader("spider").load_data("dev", SCHEMA_TYPE, True), None),
+        ("spider.iter_data", len(items), lambda: sum(1 for _ in loader("spider").iter_data("dev", SCHEMA_TYPE, True)), None),
+        ("bird.load_data", len(items), lambda: loader("bird").load_data("dev", SCHEMA_TYPE, True), None),
+        ("metrics.normalize_sql", len(gold), lambda: [normalize_sql(sql) for sql in gold], None),
+        ("metrics.execution_accuracy", len(sampled), execution, None),
+        ("metrics.execution_accuracy_wide", len(wide), execution_wide, None),
+        ("environment.step", len(sampled), step, None),
+        ("environment.step_batch", len(sampled), step_batch, None),
+        ("inference.write_results", len(items), write_results, clear_results),
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sudo-SQL hot paths on synthetic fixtures.")
+    parser.add_argument("--databases", type=int, default=20, help="Number of synthetic databases.")
+    parser.add_argument("--questions", type=int, default=1000, help="Number of synthetic questions.")
+    parser.add_argument("--rows", type=int, default=200, help="Rows per table.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the fixtures.")
+    parser.add_argument("--sample", type=int, default=500, help="Questions executed by the execution stages.")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per stage.")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed runs per stage.")
+    parser.add_argument("--workers", type=int, default=None, help="Schema generation workers. Defaults to the number of CPUs.")
+    parser.add_argument("--stages", nargs="*", help="Only run stages whose name starts with one of these prefixes.")
+    parser.add_argument("--fixtures-dir", default=os.path.join("benchmarks", ".fixtures"), help="Where fixtures are generated and reused.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--baseline", help="A previous results file to compare against.")
+    args = parser.parse_args()
+
+    # The pipeline logs every result; keep log I/O out of the measurements.
+    logger.disable("sudo_sql")
+
+    root = os.path.join(args.fixtures_dir, f"{args.databases}x{args.questions}-r{args.rows}-s{args.seed}")
+    fixtures = generate_fixtures(root, args.databases, args.questions, rows=args.rows, seed=args.seed)
+    work_dir = os.path.join(root, "work")
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+
+    results = []
+    for name, items, run, setup in _stages(fixtures, work_dir, args.sample, args.workers):
+        if args.stages and not any(name.startswith(prefix) for prefix in args.stages):
+            continue
+        summary = time_stage(name, items, run, repeats=args.repeats, warmup=args.warmup, setup=setup).summary()
+        results.append(summary)
+        print(f"{name:<28} median {summary['median']:.4f}s  stdev {summary['stdev']:.4f}s  {summary['items_per_second']:.0f} items/s")
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "fixtures": {key: fixtures[key] for key in ("databases", "questions", "rows", "seed")},
+        "settings": {"repeats": args.repeats, "warmup": args.warmup, "sample": args.sample, "workers": args.workers},
+        "environment": environment(),
+        "stages": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print("\nCompared to", args.baseline)
+        for line in compare(report, baseline):
+            print(line)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,19 @@
 import typer
+from typing import Optional
 from sudo_sql.pipeline import get_pipeline
+from sudo_sql.data_loaders import get_data_loader
+from sudo_sql.evaluation.runner import evaluate_results
+from sudo_sql.results import merge_results
+from sudo_sql.logger_config import enable_file_logging
 
 app = typer.Typer()
+cache_app = typer.Typer(help="Manage the schema and dataset caches.")
+app.add_typer(cache_app, name="cache")
+
+@app.callback()
+def main():
+    """sudo-SQL: train, run and evaluate text-to-SQL models."""
+    enable_file_logging()
 
 @app.command()
 def train(config: str = typer.Option(..., "--config", help="Path to the training configuration file.")):
@@ -10,10 +22,79 @@ def train(config: str = typer.Option(..., "--config", help="Path to the training
     pipeline.run()
 
 @app.command()
-def infer(config: str = typer.Option(..., "--config", help="Path to the inference configuration file.")):
+def infer(
+    config: str = typer.Option(..., "--config", help="Path to the inference configuration file."),
+    shard_index: Optional[int] = typer.Option(None, "--shard-index", help="The shard this process runs, from 0. Overrides inference.shard.index."),
+    num_shards: Optional[int] = typer.Option(None, "--num-shards", help="The number of shards the split is divided into. Overrides inference.shard.num_shards."),
+):
     """Run inference with a model."""
-    pipeline = get_pipeline(config_path=config)
+    shard = {}
+    if shard_index is not None:
+        shard['index'] = shard_index
+    if num_shards is not None:
+        shard['num_shards'] = num_shards
+    pipeline = get_pipeline(config_path=config, overrides={'inference': {'shard': shard}} if shard else None)
     pipeline.run()
 
+@app.command()
+def merge(
+    shards: list[str] = typer.Argument(..., help="The results files of the shards."),
+    output: str = typer.Option(..., "--output", help="Where to write the merged results file."),
+):
+    """Merge the results files of sharded inference runs into one file, in split order."""
+    stats = merge_results(shards, output)
+    typer.echo(
+        f"Merged {stats['written']} results from {stats['files']} files into {output} "
+        f"({stats['duplicates']} duplicates, {stats['conflicts']} conflicting, {stats['missing']} missing)."
+    )
+
+@app.command()
+def evaluate(
+    results: str = typer.Option(..., "--results", help="Path to the inference results file (.jsonl)."),
+    output: Optional[str] = typer.Option(None, "--output", help="Where to write per-item scores. Defaults to <results>.scored.jsonl."),
+    summary: Optional[str] = typer.Option(None, "--summary", help="Where to write the summary. Defaults to <results>.summary.json."),
+    workers: Optional[int] = typer.Option(None, "--workers", help="Number of worker processes. Defaults to all cores."),
+    db_dir: Optional[str] = typer.Option(None, "--db-dir", help="Database directory (<db_dir>/<db_id>/<db_id>.sqlite), overriding db_path in the results."),
+    timeout: float = typer.Option(30.0, "--timeout", help="Time limit per query, in seconds."),
+    replica_bytes: Optional[int] = typer.Option(None, "--replica-bytes", help="Copy databases into memory, up to this many bytes per worker."),
+):
+    """Score inference results with exact match (EM) and execution accuracy (EX)."""
+    scores = evaluate_results(
+        results,
+        output_path=output,
+        summary_path=summary,
+        num_workers=workers,
+        db_dir=db_dir,
+        execution_config={"timeout": timeout, "replica_bytes": replica_bytes},
+    )
+    typer.echo(f"EM: {scores['em']:.4f} | EX: {scores['ex']:.4f} | Items: {scores['count']}")
+
+@cache_app.command("warm")
+def cache_warm(
+    dataset: str = typer.Option(..., "--dataset", help="Name of the dataset (e.g. spider, bird)."),
+    data_path: str = typer.Option(..., "--data-path", help="Root directory of the dataset."),
+    split: str = typer.Option("dev", "--split", help="Dataset split whose databases are cached."),
+    schema_type: str = typer.Option("ddl-schema", "--schema-type", help="Type of schema to generate."),
+    workers: Optional[int] = typer.Option(None, "--workers", help="Number of worker processes. Defaults to all cores."),
+):
+    """Prebuild the cached schema of every database in a dataset split."""
+    loader = get_data_loader(dataset, data_path, num_workers=workers)
+    schemas = loader.warm_cache(split, schema_type)
+    typer.echo(f"Cached {len(schemas)} '{schema_type}' schemas for {dataset}/{split}.")
+
+@cache_app.command("dataset")
+def cache_dataset(
+    dataset: str = typer.Option(..., "--dataset", help="Name of the dataset (e.g. spider, bird)."),
+    data_path: str = typer.Option(..., "--data-path", help="Root directory of the dataset."),
+    split: str = typer.Option("dev", "--split", help="Dataset split to preprocess."),
+    schema_type: str = typer.Option("ddl-schema", "--schema-type", help="Type of schema attached to the items."),
+    workers: Optional[int] = typer.Option(None, "--workers", help="Number of worker processes. Defaults to all cores."),
+    output_dir: str = typer.Option("cache/datasets", "--output-dir", help="Directory of the preprocessed splits."),
+):
+    """Preprocess a dataset split into memory-mapped Arrow files."""
+    loader = get_data_loader(dataset, data_path, num_workers=workers, dataset_cache_dir=output_dir)
+    preprocessed = loader.preprocessed(split, schema_type, True)
+    typer.echo(f"{len(preprocessed)} items of {dataset}/{split} in {preprocessed.directory}.")
+
 if __name__ == "__main__":
     app()
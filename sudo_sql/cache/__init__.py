@@ -0,0 +1,4 @@
+from .store import SQLiteCacheStore
+from .fingerprint import file_fingerprint
+
+__all__ = ["SQLiteCacheStore", "file_fingerprint"]
@@ -0,0 +1,38 @@
+import os
+import hashlib
+from typing import Optional
+from .store import SQLiteCacheStore
+
+CHUNK_SIZE = 1 << 20
+
+def file_fingerprint(path: str, store: Optional[SQLiteCacheStore] = None) -> str:
+    """
+    Returns a digest of a file's contents.
+
+    Hashing is the expensive part, so when a `store` is given the digest is memoized
+    under the file's (path, size, mtime, inode). A copied or freshly checked out file
+    is hashed once and then maps to the same digest as the original.
+
+    Args:
+        path: The file to fingerprint.
+        store: An optional cache used to memoize digests.
+
+    Returns:
+        The hex digest of the file's contents.
+    """
+    stat = os.stat(path)
+    stat_key = f"fingerprint:{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}:{stat.st_ino}"
+    if store is not None:
+        digest = store.get_text(stat_key)
+        if digest is not None:
+            return digest
+
+    hasher = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    digest = hasher.hexdigest()
+
+    if store is not None:
+        store.put_text(stat_key, digest)
+    return digest
@@ -0,0 +1,102 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import Optional
+
+class SQLiteCacheStore:
+    """
+    A size-bounded key/value cache stored in a single SQLite file.
+
+    Entries are evicted least-recently-used first once the total size of all values
+    exceeds `max_bytes`. Access times are only kept to `access_resolution` seconds,
+    so repeated hits on an entry read the file without writing to it. The file uses
+    SQLite's default rollback journal rather than WAL, so it can live on a shared
+    (e.g. NFS) filesystem and be used by several processes and nodes at once.
+    """
+    def __init__(self, path: str, max_bytes: Optional[int] = None, timeout: float = 30.0, access_resolution: float = 60.0):
+        """
+        Initializes the store, creating the file if needed.
+
+        Args:
+            path: The path of the SQLite cache file.
+            max_bytes: The maximum total size of cached values. None means unbounded.
+            timeout: Seconds to wait for another process holding the write lock.
+            access_resolution: Seconds after which a hit refreshes an entry's access time.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.access_resolution = access_resolution
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._con = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._con.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Returns the value stored under `key`, or None, and marks the entry as recently used.
+        """
+        with self._lock:
+            row = self._con.execute("SELECT value, accessed FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            value, accessed = row
+            now = time.time()
+            # Each write takes the file's write lock and commits; a recent access time is close enough for eviction.
+            if now - accessed >= self.access_resolution:
+                self._con.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            return value
+
+    def put(self, key: str, value: bytes):
+        """
+        Stores `value` under `key`, evicting old entries if the size budget is exceeded.
+        """
+        with self._lock:
+            self._con.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time()),
+            )
+            if self.max_bytes is not None:
+                self._evict()
+
+    def get_text(self, key: str) -> Optional[str]:
+        value = self.get(key)
+        return None if value is None else bytes(value).decode("utf-8")
+
+    def put_text(self, key: str, value: str):
+        self.put(key, value.encode("utf-8"))
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._con.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._con.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _evict(self):
+        total = self._con.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted = []
+        for key, size in self._con.execute("SELECT key, size FROM entries ORDER BY accessed ASC"):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._con.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+    def close(self):
+        self._con.close()
@@ -1,11 +1,13 @@
 from .base import BaseDataLoader
 from .spider import SpiderLoader
 from .bird import BirdLoader
+from .streaming import StreamingDataset, iter_json_array
+from .preprocessed import PreprocessedSplit, open_preprocessed_split
 
-def get_data_loader(dataset_name: str, data_path: str) -> BaseDataLoader:
+def get_data_loader(dataset_name: str, data_path: str, **loader_options) -> BaseDataLoader:
     if dataset_name.lower() == "spider":
-        return SpiderLoader(data_path)
+        return SpiderLoader(data_path, **loader_options)
     elif dataset_name.lower() == "bird":
-        return BirdLoader(data_path)
+        return BirdLoader(data_path, **loader_options)
     else:
         raise ValueError(f"Unknown dataset: {dataset_name}")
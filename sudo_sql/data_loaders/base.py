@@ -1,9 +1,16 @@
 from abc import ABC, abstractmethod
-from typing import TypedDict, Optional
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Iterator, TypedDict, Optional
 import os
-import sqlite3
-from d_schema.db_parser import DatabaseParser
-from d_schema.generators.ddl_schema.generator import DDLSchemaGenerator
+import json
+import hashlib
+from sudo_sql.logger_config import logger
+from sudo_sql.telemetry import telemetry
+from sudo_sql.cache import file_fingerprint
+from .schema_cache import SchemaCache
+
+if TYPE_CHECKING:
+    from .preprocessed import PreprocessedSplit
 
 class StandardizedDataFormat(TypedDict):
     question: str
@@ -14,42 +21,177 @@ class StandardizedDataFormat(TypedDict):
     evidence: Optional[str]
     difficulty: Optional[str]
 
+# d-schema is bound on first use: most runs read every schema from the cache.
+DatabaseParser = None
+DDLSchemaGenerator = None
+
+def _load_d_schema():
+    global DatabaseParser, DDLSchemaGenerator
+    if DatabaseParser is None:
+        from d_schema.db_parser import DatabaseParser
+    if DDLSchemaGenerator is None:
+        from d_schema.generators.ddl_schema.generator import DDLSchemaGenerator
+
+def generate_schema(db_path: str, schema_type: str) -> str:
+    """
+    Generates the schema of a database with d-schema.
+
+    This is a module-level function so it can be sent to worker processes.
+    """
+    _load_d_schema()
+    db_url = f"sqlite:///{db_path}"
+    db_parser = DatabaseParser(db_url=db_url)
+    database_schema = db_parser.parse()
+
+    # Simple factory for now
+    if schema_type == "ddl-schema":
+        generator = DDLSchemaGenerator(schema=database_schema)
+    else:
+        raise ValueError(f"Unsupported schema type: {schema_type}")
+
+    return generator.generate_schema()
+
 class BaseDataLoader(ABC):
-    def __init__(self, data_path: str):
+    dataset_name: str = ""
+
+    def __init__(self, data_path: str, num_workers: Optional[int] = None, schema_cache_path: Optional[str] = None, schema_cache_max_bytes: Optional[int] = None, dataset_cache_dir: Optional[str] = None):
+        """
+        Args:
+            data_path: The root directory of the dataset.
+            num_workers: The number of processes used to generate missing schemas.
+                         Defaults to the number of CPUs.
+            schema_cache_path: The schema cache file. Defaults to `cache/schemas.sqlite`.
+            schema_cache_max_bytes: The size budget of the schema cache. None means unbounded.
+            dataset_cache_dir: The directory of preprocessed splits (see `preprocessed`). When set,
+                               `StreamingDataset` reads splits from their preprocessed copy.
+        """
         self.data_path = data_path
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.schema_cache_path = schema_cache_path
+        self.schema_cache_max_bytes = schema_cache_max_bytes
+        self.dataset_cache_dir = dataset_cache_dir
+        self._schema_cache = None
+        self._schema_memo = {}
+
+    @property
+    def schema_cache(self) -> SchemaCache:
+        if self._schema_cache is None:
+            self._schema_cache = SchemaCache(self.schema_cache_path, max_bytes=self.schema_cache_max_bytes)
+        return self._schema_cache
 
     @abstractmethod
     def load_data(self, split: str, schema_type: str, use_cache: bool) -> list[StandardizedDataFormat]:
         pass
 
-    def _generate_schema_with_d_schema(self, db_path: str, schema_type: str) -> str:
-        db_url = f"sqlite:///{db_path}"
-        db_parser = DatabaseParser(db_url=db_url)
-        database_schema = db_parser.parse()
+    @abstractmethod
+    def iter_data(self, split: str, schema_type: str, use_cache: bool) -> Iterator[StandardizedDataFormat]:
+        """
+        Streams the items of a split without loading the whole split into memory.
+        Schemas are resolved the first time a database is encountered.
+        """
+        pass
 
-        # Simple factory for now
-        if schema_type == "ddl-schema":
-            generator = DDLSchemaGenerator(schema=database_schema)
-        else:
-            raise ValueError(f"Unsupported schema type: {schema_type}")
+    @abstractmethod
+    def list_databases(self, split: str) -> dict[str, str]:
+        """
+        Returns a mapping of db_id to database path for every database used by a split.
+        """
+        pass
 
-        return generator.generate_schema()
+    def source_files(self, split: str) -> list[str]:
+        """
+        Returns the files a split's items are read from, not counting its databases.
+        """
+        return []
+
+    def fingerprint(self, split: str, schema_type: str) -> str:
+        """
+        Returns a digest of everything a split's standardized items are built from:
+        its source files, its databases and the schema generator. Anything derived
+        from the items (e.g. tokenized prompts) can be cached under it.
+        """
+        store = self.schema_cache.store
+        parts = [self.dataset_name, split, schema_type, self.schema_cache.generator_version]
+        parts += [file_fingerprint(path, store) for path in self.source_files(split)]
+        for db_id, db_path in sorted(self.list_databases(split).items()):
+            parts.append([db_id, file_fingerprint(db_path, store) if os.path.exists(db_path) else None])
+        return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+    def preprocessed(self, split: str, schema_type: str, use_cache: bool) -> "PreprocessedSplit":
+        """
+        Returns the split as memory-mapped Arrow files under `dataset_cache_dir`,
+        standardizing it first if the cached copy is missing or stale.
+        """
+        from .preprocessed import open_preprocessed_split
+        return open_preprocessed_split(self, split, schema_type, use_cache, self.dataset_cache_dir)
+
+    def warm_cache(self, split: str, schema_type: str) -> dict[str, str]:
+        """
+        Builds the cached schema of every database used by a split.
+        """
+        return self._resolve_schemas(self.list_databases(split), schema_type, True)
+
+    def _generate_schema_with_d_schema(self, db_path: str, schema_type: str) -> str:
+        return generate_schema(db_path, schema_type)
 
     def _get_schema(self, db_path: str, schema_type: str, use_cache: bool, dataset_name: str, db_id: str) -> str:
-        if not use_cache:
-            return self._generate_schema_with_d_schema(db_path, schema_type)
-
-        cache_path = os.path.join(os.getcwd(), "cache", "schemas", dataset_name, db_id, f"{schema_type}.txt")
-
-        if os.path.exists(cache_path):
-            db_mod_time = os.path.getmtime(db_path)
-            cache_mod_time = os.path.getmtime(cache_path)
-            if cache_mod_time > db_mod_time:
-                with open(cache_path, 'r') as f:
-                    return f.read()
-
-        new_schema = self._generate_schema_with_d_schema(db_path, schema_type)
-        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
-        with open(cache_path, 'w') as f:
-            f.write(new_schema)
-        return new_schema
\ No newline at end of file
+        return self._resolve_schemas({db_id: db_path}, schema_type, use_cache)[db_id]
+
+    def _lazy_schema(self, db_id: str, db_path: str, schema_type: str, use_cache: bool) -> str:
+        """
+        Resolves a schema on first use and memoizes it for the lifetime of the loader.
+        """
+        memo_key = (db_path, schema_type, use_cache)
+        if memo_key not in self._schema_memo:
+            self._schema_memo[memo_key] = self._resolve_schemas({db_id: db_path}, schema_type, use_cache)[db_id]
+        return self._schema_memo[memo_key]
+
+    def _resolve_schemas(self, databases: dict[str, str], schema_type: str, use_cache: bool) -> dict[str, str]:
+        """
+        Resolves the schema of each distinct database once.
+
+        Each database costs a single indexed lookup in the schema cache. The missing
+        schemas are generated in parallel across a process pool and written back.
+
+        Args:
+            databases: A mapping of db_id to database path.
+            schema_type: The type of schema to generate.
+            use_cache: Whether to read and write the schema cache.
+
+        Returns:
+            A mapping of db_id to schema.
+        """
+        schemas = {}
+        missing = {}
+        cache_keys = {}
+        with telemetry.span("schema.cache_lookup"):
+            for db_id, db_path in databases.items():
+                schema = None
+                if use_cache:
+                    cache_keys[db_id] = self.schema_cache.key(db_path, schema_type)
+                    schema = self.schema_cache.get(cache_keys[db_id])
+                if schema is None:
+                    missing[db_id] = db_path
+                else:
+                    schemas[db_id] = schema
+        telemetry.count("schema.cache_hits", len(schemas))
+
+        if not missing:
+            return schemas
+
+        num_workers = min(self.num_workers, len(missing))
+        logger.info(f"Generating {len(missing)} schemas ({len(schemas)} cached) with {num_workers} workers...")
+        with telemetry.span("schema.generate"):
+            if num_workers > 1:
+                with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                    generated = executor.map(generate_schema, missing.values(), [schema_type] * len(missing))
+                    generated = dict(zip(missing.keys(), generated))
+            else:
+                generated = {db_id: self._generate_schema_with_d_schema(db_path, schema_type) for db_id, db_path in missing.items()}
+        telemetry.count("schema.generated", len(missing))
+
+        for db_id, schema in generated.items():
+            if use_cache:
+                self.schema_cache.put(cache_keys[db_id], schema)
+            schemas[db_id] = schema
+        return schemas
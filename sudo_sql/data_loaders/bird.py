@@ -1,38 +1,62 @@
 import os
 import json
+from typing import Iterator
 from .base import BaseDataLoader, StandardizedDataFormat
+from .streaming import iter_json_array
 
 class BirdLoader(BaseDataLoader):
-    def load_data(self, split: str, schema_type: str, use_cache: bool) -> list[StandardizedDataFormat]:
+    dataset_name = "bird"
+
+    def _split_dir(self, split: str) -> str:
         # BIRD has a nested structure, so we need to find the correct subdirectory
         # For simplicity, we'll assume the first subdirectory found is the correct one.
         # A more robust solution might involve configuration.
-        split_dir = ""
         for d in os.listdir(self.data_path):
             if d.startswith(split):
-                split_dir = os.path.join(self.data_path, d)
-                break
-        
-        if not split_dir:
-            raise FileNotFoundError(f"Could not find data directory for split: {split}")
-
-        json_path = os.path.join(split_dir, f'{split}.json')
-        with open(json_path, 'r') as f:
-            data = json.load(f)
-
-        processed_data = []
-        for item in data:
-            db_id = item['db_id']
-            db_path = os.path.join(split_dir, 'dev_databases', db_id, f'{db_id}.sqlite')
-            schema = self._get_schema(db_path, schema_type, use_cache, "bird", db_id)
-
-            processed_data.append({
-                'question': item['question'],
-                'sql': item['SQL'],
-                'db_id': db_id,
-                'db_path': db_path,
-                'schema': schema,
-                'evidence': item.get('evidence'),
-                'difficulty': item.get('difficulty')
-            })
-        return processed_data
+                return os.path.join(self.data_path, d)
+
+        raise FileNotFoundError(f"Could not find data directory for split: {split}")
+
+    def _json_path(self, split_dir: str, split: str) -> str:
+        return os.path.join(split_dir, f'{split}.json')
+
+    def _read_split(self, split_dir: str, split: str) -> list[dict]:
+        with open(self._json_path(split_dir, split), 'r') as f:
+            return json.load(f)
+
+    def _db_path(self, split_dir: str, db_id: str) -> str:
+        return os.path.join(split_dir, 'dev_databases', db_id, f'{db_id}.sqlite')
+
+    def _standardize(self, item: dict, db_path: str, schema: str) -> StandardizedDataFormat:
+        return {
+            'question': item['question'],
+            'sql': item['SQL'],
+            'db_id': item['db_id'],
+            'db_path': db_path,
+            'schema': schema,
+            'evidence': item.get('evidence'),
+            'difficulty': item.get('difficulty')
+        }
+
+    def source_files(self, split: str) -> list[str]:
+        return [self._json_path(self._split_dir(split), split)]
+
+    def list_databases(self, split: str) -> dict[str, str]:
+        split_dir = self._split_dir(split)
+        items = iter_json_array(self._json_path(split_dir, split))
+        return {item['db_id']: self._db_path(split_dir, item['db_id']) for item in items}
+
+    def load_data(self, split: str, schema_type: str, use_cache: bool) -> list[StandardizedDataFormat]:
+        split_dir = self._split_dir(split)
+        data = self._read_split(split_dir, split)
+        databases = {item['db_id']: self._db_path(split_dir, item['db_id']) for item in data}
+        schemas = self._resolve_schemas(databases, schema_type, use_cache)
+
+        return [self._standardize(item, databases[item['db_id']], schemas[item['db_id']]) for item in data]
+
+    def iter_data(self, split: str, schema_type: str, use_cache: bool) -> Iterator[StandardizedDataFormat]:
+        split_dir = self._split_dir(split)
+        for item in iter_json_array(self._json_path(split_dir, split)):
+            db_path = self._db_path(split_dir, item['db_id'])
+            schema = self._lazy_schema(item['db_id'], db_path, schema_type, use_cache)
+            yield self._standardize(item, db_path, schema)
@@ -0,0 +1,208 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+from typing import TYPE_CHECKING, Iterator, Optional
+from sudo_sql.logger_config import logger
+from sudo_sql.telemetry import telemetry
+from .schema_cache import _generator_version
+
+if TYPE_CHECKING:
+    import pyarrow
+    from .base import BaseDataLoader, StandardizedDataFormat
+
+DEFAULT_CACHE_DIR = os.path.join("cache", "datasets")
+WRITE_BATCH_SIZE = 1024
+ITEM_COLUMNS = ("question", "sql", "db_id", "db_path", "evidence", "difficulty")
+
+def _stat(path: str) -> Optional[list]:
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+def _read_table(path: str) -> "pyarrow.Table":
+    import pyarrow as pa
+
+    # The table's buffers point into the mapping: nothing is copied, and processes
+    # opening the same file share its pages.
+    with pa.memory_map(path, "r") as source:
+        return pa.ipc.open_stream(source).read_all()
+
+class PreprocessedSplit:
+    """
+    The standardized items of a split, memory-mapped from Arrow files.
+
+    `items.arrow` holds one row per question and `schemas.arrow` one row per
+    database, so a schema is stored once however many questions use it. Both are
+    Arrow IPC streams, the format `datasets` caches in: `to_dataset()` opens the
+    items as a `datasets.Dataset` without copying them.
+    """
+    def __init__(self, directory: str):
+        """
+        Args:
+            directory: A directory written by `build_preprocessed_split`.
+        """
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        self.items = _read_table(os.path.join(directory, "items.arrow"))
+        schemas = _read_table(os.path.join(directory, "schemas.arrow"))
+        self._schemas = dict(zip(schemas.column("db_id").to_pylist(), schemas.column("schema").to_pylist()))
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        The loader fingerprint of the source files the split was built from.
+        """
+        return self.meta["fingerprint"]
+
+    def __len__(self) -> int:
+        return self.items.num_rows
+
+    def _item(self, values: tuple) -> "StandardizedDataFormat":
+        item = dict(zip(ITEM_COLUMNS, values))
+        item["schema"] = self._schemas.get(item["db_id"])
+        return item
+
+    def __getitem__(self, index: int) -> "StandardizedDataFormat":
+        row = self.items.slice(index, 1).to_pylist()[0]
+        return self._item(tuple(row[column] for column in ITEM_COLUMNS))
+
+    def __iter__(self) -> Iterator["StandardizedDataFormat"]:
+        for batch in self.items.to_batches(max_chunksize=WRITE_BATCH_SIZE):
+            columns = [batch.column(column).to_pylist() for column in ITEM_COLUMNS]
+            for values in zip(*columns):
+                yield self._item(values)
+
+    def to_dataset(self):
+        """
+        Opens the items (without schemas) as a memory-mapped `datasets.Dataset`.
+        """
+        from datasets import Dataset
+        return Dataset.from_file(os.path.join(self.directory, "items.arrow"))
+
+def build_preprocessed_split(directory: str, loader: "BaseDataLoader", split: str, schema_type: str, use_cache: bool) -> PreprocessedSplit:
+    """
+    Standardizes a split with `loader` and writes it to `directory` as Arrow files.
+
+    Items are streamed from the loader and written in record batches. Like the
+    tokenized prompts, the files are written to a temporary directory that replaces
+    `directory` once complete, so readers never see a partial split.
+
+    Returns:
+        The preprocessed split, memory-mapped from `directory`.
+    """
+    import pyarrow as pa
+
+    item_schema = pa.schema([(column, pa.string()) for column in ITEM_COLUMNS])
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=parent, prefix=".preprocessing-")
+    try:
+        databases = {}
+        schemas = {}
+        count = 0
+        with pa.OSFile(os.path.join(staging, "items.arrow"), "wb") as sink, pa.ipc.new_stream(sink, item_schema) as writer:
+            batch = []
+            for item in loader.iter_data(split, schema_type, use_cache):
+                databases[item["db_id"]] = item["db_path"]
+                schemas[item["db_id"]] = item["schema"]
+                batch.append(item)
+                if len(batch) == WRITE_BATCH_SIZE:
+                    writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=item_schema))
+                    count += len(batch)
+                    batch = []
+            if batch:
+                writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=item_schema))
+                count += len(batch)
+
+        schema_table = pa.table({"db_id": list(schemas), "schema": list(schemas.values())})
+        with pa.OSFile(os.path.join(staging, "schemas.arrow"), "wb") as sink, pa.ipc.new_stream(sink, schema_table.schema) as writer:
+            writer.write_table(schema_table)
+
+        paths = loader.source_files(split) + sorted(databases.values())
+        meta = {
+            "dataset": loader.dataset_name,
+            "split": split,
+            "schema_type": schema_type,
+            "generator_version": _generator_version(),
+            "fingerprint": loader.fingerprint(split, schema_type),
+            "count": count,
+            "databases": len(databases),
+            "files": {path: _stat(path) for path in paths},
+        }
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+
+        if os.path.exists(directory):
+            # Open readers keep their mappings of the replaced files.
+            stale = tempfile.mkdtemp(dir=parent, prefix=".stale-")
+            os.replace(directory, os.path.join(stale, "split"))
+            shutil.rmtree(stale, ignore_errors=True)
+        try:
+            os.replace(staging, directory)
+        except OSError:
+            # Another process finished the same build first; keep its copy.
+            if not os.path.exists(os.path.join(directory, "meta.json")):
+                raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return PreprocessedSplit(directory)
+
+def _is_fresh(meta: dict, loader: "BaseDataLoader", split: str, schema_type: str) -> bool:
+    """
+    Checks a preprocessed split against its source files. Unchanged stats are
+    trusted; a file whose stats changed is fingerprinted, so touching or copying
+    files does not force a rebuild, but editing them does.
+    """
+    if meta.get("generator_version") != _generator_version():
+        return False
+    changed = [path for path, stat in meta["files"].items() if _stat(path) != stat]
+    if not changed:
+        return True
+    if any(not os.path.exists(path) for path in changed):
+        return False
+    return loader.fingerprint(split, schema_type) == meta["fingerprint"]
+
+def _refresh_stats(meta_path: str, meta: dict):
+    # Records the stats of files that were touched but not changed, so the next
+    # open does not fingerprint them again.
+    files = {path: _stat(path) for path in meta["files"]}
+    if files == meta["files"]:
+        return
+    meta["files"] = files
+    staging = f"{meta_path}.{os.getpid()}"
+    with open(staging, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(staging, meta_path)
+
+def open_preprocessed_split(loader: "BaseDataLoader", split: str, schema_type: str, use_cache: bool, cache_dir: Optional[str] = None) -> PreprocessedSplit:
+    """
+    Opens the preprocessed copy of a split, building it first if it is missing or
+    its source files or databases changed.
+
+    Args:
+        loader: The loader of the dataset.
+        split: The dataset split.
+        schema_type: The type of schema attached to the items.
+        use_cache: Whether a build reads and writes the schema cache.
+        cache_dir: The cache directory. Defaults to `cache/datasets` under the working directory.
+    """
+    cache_dir = cache_dir or os.path.join(os.getcwd(), DEFAULT_CACHE_DIR)
+    location = hashlib.sha256(os.path.abspath(loader.data_path).encode("utf-8")).hexdigest()
+    directory = os.path.join(cache_dir, f"{loader.dataset_name}_{split}_{schema_type}_{location[:16]}")
+
+    meta_path = os.path.join(directory, "meta.json")
+    with telemetry.span("dataset.open_preprocessed"):
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            if _is_fresh(meta, loader, split, schema_type):
+                _refresh_stats(meta_path, meta)
+                return PreprocessedSplit(directory)
+            logger.info(f"The sources of {directory} changed; preprocessing the split again.")
+
+        logger.info(f"Preprocessing {loader.dataset_name}/{split} into {directory}...")
+        return build_preprocessed_split(directory, loader, split, schema_type, use_cache)
@@ -0,0 +1,45 @@
+import os
+import json
+import hashlib
+from importlib.metadata import version, PackageNotFoundError
+from typing import Optional
+from sudo_sql.cache import SQLiteCacheStore, file_fingerprint
+
+DEFAULT_CACHE_FILE = os.path.join("cache", "schemas.sqlite")
+
+def _generator_version() -> str:
+    try:
+        return version("d-schema")
+    except PackageNotFoundError:
+        return "unknown"
+
+class SchemaCache:
+    """
+    A content-addressed cache of generated schemas.
+
+    Entries are keyed by the fingerprint of the database file's contents, the schema
+    type, and the d-schema version and generator options. Nothing depends on where
+    the dataset lives or on file timestamps, so a copied dataset still hits the cache.
+    A d-schema upgrade or a change of options misses it instead of serving stale schemas.
+    """
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None):
+        """
+        Args:
+            path: The SQLite cache file. Defaults to `cache/schemas.sqlite` under the working directory.
+            max_bytes: The maximum total size of cached schemas. None means unbounded.
+        """
+        self.store = SQLiteCacheStore(path or os.path.join(os.getcwd(), DEFAULT_CACHE_FILE), max_bytes=max_bytes)
+        self.generator_version = _generator_version()
+
+    def key(self, db_path: str, schema_type: str, options: Optional[dict] = None) -> str:
+        payload = json.dumps(
+            [file_fingerprint(db_path, self.store), schema_type, self.generator_version, options or {}],
+            sort_keys=True,
+        )
+        return "schema:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        return self.store.get_text(key)
+
+    def put(self, key: str, schema: str):
+        self.store.put_text(key, schema)
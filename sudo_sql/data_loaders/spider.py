@@ -1,30 +1,50 @@
 import os
 import json
+from typing import Iterator
 from .base import BaseDataLoader, StandardizedDataFormat
+from .streaming import iter_json_array
 
 class SpiderLoader(BaseDataLoader):
-    def load_data(self, split: str, schema_type: str, use_cache: bool) -> list[StandardizedDataFormat]:
+    dataset_name = "spider"
+
+    def _json_path(self, split: str) -> str:
         if split == 'train':
-            json_path = os.path.join(self.data_path, 'train_spider.json')
-        else:
-            json_path = os.path.join(self.data_path, f'{split}.json')
-
-        with open(json_path, 'r') as f:
-            data = json.load(f)
-
-        processed_data = []
-        for item in data:
-            db_id = item['db_id']
-            db_path = os.path.join(self.data_path, 'database', db_id, f'{db_id}.sqlite')
-            schema = self._get_schema(db_path, schema_type, use_cache, "spider", db_id)
-
-            processed_data.append({
-                'question': item['question'],
-                'sql': item['query'],
-                'db_id': db_id,
-                'db_path': db_path,
-                'schema': schema,
-                'evidence': None,
-                'difficulty': None
-            })
-        return processed_data
+            return os.path.join(self.data_path, 'train_spider.json')
+        return os.path.join(self.data_path, f'{split}.json')
+
+    def _read_split(self, split: str) -> list[dict]:
+        with open(self._json_path(split), 'r') as f:
+            return json.load(f)
+
+    def _db_path(self, db_id: str) -> str:
+        return os.path.join(self.data_path, 'database', db_id, f'{db_id}.sqlite')
+
+    def _standardize(self, item: dict, db_path: str, schema: str) -> StandardizedDataFormat:
+        return {
+            'question': item['question'],
+            'sql': item['query'],
+            'db_id': item['db_id'],
+            'db_path': db_path,
+            'schema': schema,
+            'evidence': None,
+            'difficulty': None
+        }
+
+    def source_files(self, split: str) -> list[str]:
+        return [self._json_path(split)]
+
+    def list_databases(self, split: str) -> dict[str, str]:
+        return {item['db_id']: self._db_path(item['db_id']) for item in iter_json_array(self._json_path(split))}
+
+    def load_data(self, split: str, schema_type: str, use_cache: bool) -> list[StandardizedDataFormat]:
+        data = self._read_split(split)
+        databases = {item['db_id']: self._db_path(item['db_id']) for item in data}
+        schemas = self._resolve_schemas(databases, schema_type, use_cache)
+
+        return [self._standardize(item, databases[item['db_id']], schemas[item['db_id']]) for item in data]
+
+    def iter_data(self, split: str, schema_type: str, use_cache: bool) -> Iterator[StandardizedDataFormat]:
+        for item in iter_json_array(self._json_path(split)):
+            db_path = self._db_path(item['db_id'])
+            schema = self._lazy_schema(item['db_id'], db_path, schema_type, use_cache)
+            yield self._standardize(item, db_path, schema)
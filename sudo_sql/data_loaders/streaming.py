@@ -0,0 +1,122 @@
+import json
+from typing import Iterator
+
+CHUNK_SIZE = 1 << 16
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+# Characters that may follow a complete array element.
+_DELIMITERS = _WHITESPACE + ",]"
+
+def iter_json_array(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator:
+    """
+    Yields the elements of a top-level JSON array one at a time.
+
+    The file is read in chunks and each element is decoded as soon as it is complete,
+    so memory use is bounded by the largest single element rather than the file size.
+
+    Args:
+        path: The path of a JSON file whose top-level value is an array.
+        chunk_size: The number of characters read at a time.
+
+    Yields:
+        The decoded array elements, in order.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = ""
+        position = 0
+        eof = False
+
+        def fill() -> bool:
+            nonlocal buffer, position, eof
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+                return False
+            buffer = buffer[position:] + chunk
+            position = 0
+            return True
+
+        def skip_whitespace() -> str:
+            # Returns the next significant character without consuming it, or "" at EOF.
+            nonlocal position
+            while True:
+                while position < len(buffer) and buffer[position] in _WHITESPACE:
+                    position += 1
+                if position < len(buffer):
+                    return buffer[position]
+                if not fill():
+                    return ""
+
+        if skip_whitespace() != "[":
+            raise ValueError(f"Expected a JSON array in {path}")
+        position += 1
+
+        if skip_whitespace() == "]":
+            return
+
+        while True:
+            skip_whitespace()
+            while True:
+                try:
+                    element, end = _decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    # The element is cut off by the end of the buffer: read more and retry.
+                    if eof or not fill():
+                        raise
+                    continue
+                # A number is only complete once a delimiter follows it: "12" may continue as
+                # "123", and "1." or "-0" as "1.5" or "-0.5", in the next chunk.
+                is_number = isinstance(element, (int, float)) and not isinstance(element, bool)
+                if is_number and (end == len(buffer) or buffer[end] not in _DELIMITERS) and not eof and fill():
+                    continue
+                break
+            position = end
+            yield element
+
+            separator = skip_whitespace()
+            if separator == ",":
+                position += 1
+            elif separator == "]":
+                return
+            else:
+                raise ValueError(f"Malformed JSON array in {path}")
+
+class StreamingDataset:
+    """
+    A re-iterable view over a dataset split. Every iteration streams the split from
+    disk again, so it can be consumed once per epoch without being held in memory.
+
+    When the loader has a `dataset_cache_dir`, the split is standardized once into
+    memory-mapped Arrow files and every iteration reads those instead.
+    """
+    def __init__(self, loader, split: str, schema_type: str, use_cache: bool):
+        self.loader = loader
+        self.split = split
+        self.schema_type = schema_type
+        self.use_cache = use_cache
+        self._preprocessed = None
+
+    def preprocessed(self):
+        """
+        Returns the preprocessed split, or None if the loader has no dataset cache.
+        """
+        if self._preprocessed is None and self.loader.dataset_cache_dir:
+            self._preprocessed = self.loader.preprocessed(self.split, self.schema_type, self.use_cache)
+        return self._preprocessed
+
+    def __iter__(self):
+        preprocessed = self.preprocessed()
+        if preprocessed is not None:
+            return iter(preprocessed)
+        return self.loader.iter_data(self.split, self.schema_type, self.use_cache)
+
+    def fingerprint(self) -> str:
+        """
+        Returns a digest that changes whenever the items of the split would change.
+        """
+        preprocessed = self.preprocessed()
+        if preprocessed is not None:
+            # Checked against the source files when the split was opened.
+            return preprocessed.fingerprint
+        return self.loader.fingerprint(self.split, self.schema_type)
@@ -0,0 +1,16 @@
+from .connection import ConnectionManager, get_connection, read_only_uri
+from .compare import has_order_by, multiset_hash
+from .executor import QueryExecutor, SubprocessExecutor, QueryResult, Comparison, get_executor
+
+__all__ = [
+    "ConnectionManager",
+    "get_connection",
+    "read_only_uri",
+    "QueryExecutor",
+    "SubprocessExecutor",
+    "QueryResult",
+    "Comparison",
+    "has_order_by",
+    "multiset_hash",
+    "get_executor",
+]
@@ -0,0 +1,64 @@
+import re
+import hashlib
+from functools import lru_cache
+from typing import Iterable
+
+_MASK = (1 << 128) - 1
+# String literals and quoted identifiers, whose contents are not SQL.
+_QUOTED = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|\[[^\]]*\]")
+_ORDER_BY = re.compile(r"\(|\)|\border\s+by\b", re.IGNORECASE)
+
+@lru_cache(maxsize=4096)
+def has_order_by(sql: str) -> bool:
+    """
+    Whether the outermost query of `sql` has an ORDER BY clause, i.e. whether the
+    order of its rows is part of the result. ORDER BY in subqueries does not count.
+    """
+    depth = 0
+    for match in _ORDER_BY.finditer(_QUOTED.sub("''", sql)):
+        token = match.group()
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth = max(depth - 1, 0)
+        elif depth == 0:
+            return True
+    return False
+
+def _encode_value(value) -> bytes:
+    # Values that compare equal (1, 1.0 and True) encode alike; all others differ by type tag or contents.
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if value is None:
+        return b"n"
+    if isinstance(value, int):
+        return b"i" + str(value).encode("ascii")
+    if isinstance(value, float):
+        return b"f" + value.hex().encode("ascii")
+    if isinstance(value, str):
+        return b"s" + value.encode("utf-8", "surrogatepass")
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return b"b" + bytes(value)
+    return b"r" + repr(value).encode("utf-8", "surrogatepass")
+
+def row_digest(row: tuple) -> int:
+    """
+    Returns a 128-bit BLAKE2b digest of a row. Rows that compare equal with `==`,
+    like (1,) and (1.0,), get the same digest, and the digest does not depend on
+    the process, unlike Python's `hash` of strings.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for value in row:
+        encoded = _encode_value(value)
+        # Each value is length-prefixed so that values cannot run into each other.
+        digest.update(len(encoded).to_bytes(8, "little"))
+        digest.update(encoded)
+    return int.from_bytes(digest.digest(), "little")
+
+def multiset_hash(rows: Iterable[tuple], digest: int = 0) -> int:
+    """
+    Adds the digests of `rows` (see `row_digest`) to `digest`, modulo 2**128. The
+    sum does not depend on the order of the rows but does count repetitions, so
+    equal multisets of rows hash the same.
+    """
+    return (digest + sum(map(row_digest, rows))) & _MASK
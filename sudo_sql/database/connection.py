@@ -0,0 +1,277 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from itertools import count
+from pathlib import Path
+from typing import Optional
+from sudo_sql.telemetry import telemetry
+
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024
+DEFAULT_CACHE_SIZE_KIB = 64 * 1024
+
+def read_only_uri(db_path: str, immutable: bool = True) -> str:
+    """
+    Builds a SQLite URI that opens `db_path` read-only.
+
+    With `immutable`, SQLite also skips file locking and change detection, which is
+    safe for benchmark databases that are never modified while a run is going on.
+    """
+    uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+    if immutable:
+        uri += "&immutable=1"
+    return uri
+
+# Pragmas that only read the schema or database state. Any other pragma, e.g. one
+# turning `query_only` back off, is denied.
+_INTROSPECTION_PRAGMAS = frozenset({
+    "table_info", "table_xinfo", "table_list", "index_list", "index_info", "index_xinfo",
+    "foreign_key_list", "database_list", "collation_list", "function_list",
+})
+# Pragmas that read a value without an argument, but set it with one.
+_VALUE_PRAGMAS = frozenset({"page_count", "page_size", "freelist_count", "schema_version", "user_version", "encoding"})
+_DENIED_ACTIONS = frozenset({
+    sqlite3.SQLITE_ATTACH, sqlite3.SQLITE_DETACH,
+    sqlite3.SQLITE_INSERT, sqlite3.SQLITE_UPDATE, sqlite3.SQLITE_DELETE,
+    sqlite3.SQLITE_CREATE_INDEX, sqlite3.SQLITE_CREATE_TABLE, sqlite3.SQLITE_CREATE_TRIGGER,
+    sqlite3.SQLITE_CREATE_VIEW, sqlite3.SQLITE_CREATE_VTABLE, sqlite3.SQLITE_CREATE_TEMP_INDEX,
+    sqlite3.SQLITE_CREATE_TEMP_TABLE, sqlite3.SQLITE_CREATE_TEMP_TRIGGER, sqlite3.SQLITE_CREATE_TEMP_VIEW,
+    sqlite3.SQLITE_DROP_INDEX, sqlite3.SQLITE_DROP_TABLE, sqlite3.SQLITE_DROP_TRIGGER,
+    sqlite3.SQLITE_DROP_VIEW, sqlite3.SQLITE_DROP_VTABLE, sqlite3.SQLITE_DROP_TEMP_INDEX,
+    sqlite3.SQLITE_DROP_TEMP_TABLE, sqlite3.SQLITE_DROP_TEMP_TRIGGER, sqlite3.SQLITE_DROP_TEMP_VIEW,
+    sqlite3.SQLITE_ALTER_TABLE, sqlite3.SQLITE_REINDEX, sqlite3.SQLITE_ANALYZE,
+    sqlite3.SQLITE_TRANSACTION, sqlite3.SQLITE_SAVEPOINT,
+})
+
+def _authorize_read_only(action, arg1, arg2, db_name, trigger):
+    # Replicas are shared, writable memdb databases, so `query_only` and the
+    # read-only URI are not enough: anything but reading is denied at prepare time.
+    # ATTACH/DETACH would also leak state into later queries on a pooled connection.
+    if action in _DENIED_ACTIONS:
+        return sqlite3.SQLITE_DENY
+    if action == sqlite3.SQLITE_PRAGMA:
+        pragma = (arg1 or "").lower()
+        if pragma in _INTROSPECTION_PRAGMAS or (pragma in _VALUE_PRAGMAS and arg2 is None):
+            return sqlite3.SQLITE_OK
+        return sqlite3.SQLITE_DENY
+    return sqlite3.SQLITE_OK
+
+class _Replica:
+    """
+    An in-memory copy of a database, shared by every connection of the process.
+
+    The data lives in a named `memdb` database, which SQLite frees once its last
+    connection closes. `anchor` keeps it alive while the replica is cached.
+    """
+    __slots__ = ("uri", "anchor", "size", "evicted")
+
+    def __init__(self, uri: str, anchor: sqlite3.Connection, size: int):
+        self.uri = uri
+        self.anchor = anchor
+        self.size = size
+        self.evicted = False
+
+class ConnectionManager:
+    """
+    Hands out pooled, read-only SQLite connections, one per (thread, database).
+
+    SQLite connections may only be used by the thread that created them, so each
+    thread gets its own pool. Pools are also discarded after a fork, since a child
+    process must not reuse its parent's connections.
+
+    With `replica_bytes`, databases are copied into memory with the backup API the
+    first time the process opens them, and every thread's connection reads the
+    shared copy instead of the file. Least-recently-used replicas are evicted to
+    keep their total size within `replica_bytes`; databases larger than that are
+    read from disk.
+    """
+    def __init__(self, mmap_size: int = DEFAULT_MMAP_SIZE, cache_size_kib: int = DEFAULT_CACHE_SIZE_KIB, immutable: bool = True, replica_bytes: Optional[int] = None):
+        """
+        Args:
+            mmap_size: The number of bytes of each database to memory-map.
+            cache_size_kib: The page cache size of each connection, in KiB.
+            immutable: Whether to open databases with `immutable=1`.
+            replica_bytes: The total size of the in-memory replicas kept per process.
+                           None disables them.
+        """
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self.immutable = immutable
+        self.replica_bytes = replica_bytes
+        self._local = threading.local()
+        self._reset_replicas()
+
+    def _reset_replicas(self):
+        self._pid = os.getpid()
+        self._replicas: OrderedDict[str, _Replica] = OrderedDict()
+        self._replica_lock = threading.Lock()
+        self._replica_size = 0
+        self._oversized = set()
+        # Bumped on every eviction, so threads know when to drop connections to evicted replicas.
+        self._evictions = 0
+
+    def _pool(self) -> dict[str, tuple[sqlite3.Connection, Optional[_Replica]]]:
+        if os.getpid() != self._pid:
+            self._local = threading.local()
+            # The parent's replicas are copied into the child, but its connections must not be used.
+            self._reset_replicas()
+        if not hasattr(self._local, "connections"):
+            self._local.connections = {}
+            self._local.evictions = self._evictions
+        return self._local.connections
+
+    def _configure(self, con: sqlite3.Connection) -> sqlite3.Connection:
+        con.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        con.execute(f"PRAGMA cache_size = -{int(self.cache_size_kib)}")
+        con.execute("PRAGMA temp_store = MEMORY")
+        # Belt and braces: the URI already forbids writes to the main database.
+        con.execute("PRAGMA query_only = 1")
+        # Set last: from here on, the connection's own pragmas are denied too.
+        con.set_authorizer(_authorize_read_only)
+        return con
+
+    def connect(self, db_path: str) -> sqlite3.Connection:
+        """
+        Opens a new, unpooled read-only connection with the manager's pragmas.
+        """
+        if not os.path.exists(db_path):
+            # mode=ro would fail with an opaque error; keep the message close to sqlite3.connect's.
+            raise sqlite3.OperationalError(f"unable to open database file: {db_path}")
+
+        return self._configure(sqlite3.connect(read_only_uri(db_path, self.immutable), uri=True))
+
+    def _replica(self, db_path: str, key: str) -> Optional[_Replica]:
+        """
+        Returns the replica of `db_path`, loading it if needed, or None if it is too large.
+        """
+        with self._replica_lock:
+            replica = self._replicas.get(key)
+            if replica is not None:
+                self._replicas.move_to_end(key)
+                return replica
+            if key in self._oversized:
+                return None
+
+        # Loading can take a while for large databases, so other threads are not held up meanwhile.
+        source = self.connect(db_path)
+        try:
+            page_count = source.execute("PRAGMA page_count").fetchone()[0]
+            page_size = source.execute("PRAGMA page_size").fetchone()[0]
+            size = page_count * page_size
+            if size > self.replica_bytes:
+                with self._replica_lock:
+                    self._oversized.add(key)
+                telemetry.count("replica.oversized")
+                return None
+            uri = f"file:/sudo_sql-replica-{os.getpid()}-{next(_replica_ids)}?vfs=memdb"
+            # The anchor is closed by whichever thread evicts the replica.
+            anchor = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            try:
+                with telemetry.span("replica.load"):
+                    source.backup(anchor)
+            except sqlite3.Error:
+                # E.g. the copy does not fit under the heap limit: keep reading the file.
+                anchor.close()
+                with self._replica_lock:
+                    self._oversized.add(key)
+                telemetry.count("replica.oversized")
+                return None
+        finally:
+            source.close()
+
+        with self._replica_lock:
+            loaded = self._replicas.get(key)
+            if loaded is not None:
+                # Another thread loaded it first.
+                anchor.close()
+                return loaded
+            replica = self._replicas[key] = _Replica(uri, anchor, size)
+            self._replica_size += size
+            while self._replica_size > self.replica_bytes:
+                _, evicted = self._replicas.popitem(last=False)
+                evicted.evicted = True
+                evicted.anchor.close()
+                self._replica_size -= evicted.size
+                self._evictions += 1
+                telemetry.count("replica.evictions")
+        telemetry.count("replica.loads")
+        return replica
+
+    def _open(self, db_path: str, key: str) -> tuple[sqlite3.Connection, Optional[_Replica]]:
+        while self.replica_bytes is not None:
+            replica = self._replica(db_path, key)
+            if replica is None:
+                break
+            con = sqlite3.connect(replica.uri, uri=True)
+            with self._replica_lock:
+                # Once evicted, the name may have been opened after the anchor closed, as a new and empty database.
+                alive = not replica.evicted
+            if alive:
+                return self._configure(con), replica
+            con.close()
+        return self.connect(db_path), None
+
+    def _drop_evicted(self, pool: dict):
+        for key, (con, replica) in list(pool.items()):
+            if replica is not None and replica.evicted:
+                con.close()
+                del pool[key]
+        self._local.evictions = self._evictions
+
+    def get(self, db_path: str) -> sqlite3.Connection:
+        """
+        Returns this thread's pooled connection to `db_path`, opening it if needed.
+        """
+        pool = self._pool()
+        if self._local.evictions != self._evictions:
+            # Connections keep an evicted replica's memory alive until they are closed.
+            self._drop_evicted(pool)
+        key = os.path.abspath(db_path)
+        entry = pool.get(key)
+        if entry is None:
+            entry = pool[key] = self._open(db_path, key)
+        elif entry[1] is not None:
+            with self._replica_lock:
+                if key in self._replicas:
+                    self._replicas.move_to_end(key)
+        return entry[0]
+
+    def replica_stats(self) -> dict:
+        """
+        Returns the replicated databases of this process, least recently used first,
+        and their total size.
+        """
+        with self._replica_lock:
+            return {"databases": list(self._replicas), "bytes": self._replica_size, "budget": self.replica_bytes}
+
+    def close(self):
+        """
+        Closes the calling thread's pooled connections.
+        """
+        pool = self._pool()
+        for con, _ in pool.values():
+            con.close()
+        pool.clear()
+
+    def clear_replicas(self):
+        """
+        Drops every replica. Their memory is freed once the connections still
+        using them are closed.
+        """
+        with self._replica_lock:
+            for replica in self._replicas.values():
+                replica.evicted = True
+                replica.anchor.close()
+            self._evictions += len(self._replicas)
+            self._replicas.clear()
+            self._replica_size = 0
+
+_replica_ids = count()
+
+_default_manager = ConnectionManager()
+
+def get_connection(db_path: str) -> sqlite3.Connection:
+    """
+    Returns a pooled, read-only connection to `db_path` from the shared manager.
+    """
+    return _default_manager.get(db_path)
@@ -0,0 +1,404 @@
+import os
+import time
+import queue
+import sqlite3
+import multiprocessing
+from collections import Counter
+from contextlib import closing
+from dataclasses import dataclass, field
+from typing import Optional
+from .compare import multiset_hash
+from .connection import ConnectionManager, _default_manager
+
+OK = "ok"
+ERROR = "error"
+TIMEOUT = "timeout"
+ROW_LIMIT = "row_limit"
+
+# Number of SQLite VM instructions between two deadline checks.
+PROGRESS_STEPS = 1000
+FETCH_SIZE = 1000
+
+@dataclass
+class QueryResult:
+    """
+    The outcome of executing one query.
+
+    `status` is one of "ok", "error", "timeout" or "row_limit". For "row_limit",
+    `rows` holds the first `max_rows` rows.
+    """
+    status: str
+    rows: list[tuple] = field(default_factory=list)
+    error: Optional[str] = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.status == OK
+
+@dataclass
+class Comparison:
+    """
+    The outcome of comparing the results of a predicted and a ground truth query.
+
+    `status` and `gold_status` are "ok", "error" or "timeout" for the predicted and
+    the ground truth query; `gold_status` is None when the prediction failed first.
+    `predicted_rows` and `gold_rows` count the rows read before the comparison was
+    decided, which is all of them only for matching results.
+    """
+    status: str
+    gold_status: Optional[str] = None
+    match: bool = False
+    predicted_rows: int = 0
+    gold_rows: int = 0
+    error: Optional[str] = None
+    elapsed: float = 0.0
+
+class QueryExecutor:
+    """
+    Executes queries on pooled, read-only connections with resource limits.
+
+    The wall-clock timeout is enforced through a SQLite progress handler, which
+    interrupts the query from inside the VM, so even a runaway cartesian join stops
+    on time. The memory limit maps to SQLite's `hard_heap_limit`, which applies to
+    the whole process; use `SubprocessExecutor` to isolate it.
+    """
+    def __init__(self, timeout: Optional[float] = 30.0, max_rows: Optional[int] = None, memory_limit: Optional[int] = None, manager: Optional[ConnectionManager] = None, replica_bytes: Optional[int] = None):
+        """
+        Args:
+            timeout: The wall-clock limit per query, in seconds. None disables it.
+            max_rows: The maximum number of rows fetched per query. None disables it.
+            memory_limit: The SQLite heap limit in bytes. None disables it. In-memory
+                          replicas count towards it.
+            manager: The connection manager. Defaults to the shared one, or to a
+                     manager of its own when `replica_bytes` is set.
+            replica_bytes: The total size of the in-memory database replicas (see
+                           `ConnectionManager`). None reads databases from disk.
+        """
+        self.timeout = timeout
+        self.max_rows = max_rows
+        self.memory_limit = memory_limit
+        self.replica_bytes = replica_bytes
+        self._owns_manager = manager is None and replica_bytes is not None
+        self.manager = manager or (ConnectionManager(replica_bytes=replica_bytes) if replica_bytes is not None else _default_manager)
+        self._heap_limit_set = False
+
+    def execute(self, db_path: str, sql: str) -> QueryResult:
+        """
+        Executes `sql` against `db_path`. Never raises for query errors: failures,
+        timeouts and truncated results are reported through `QueryResult.status`.
+        """
+        start = time.monotonic()
+        try:
+            con = self._connect(db_path)
+        except sqlite3.Error as e:
+            return QueryResult(ERROR, error=str(e), elapsed=time.monotonic() - start)
+
+        timed_out = False
+        if self.timeout is not None:
+            deadline = start + self.timeout
+
+            def check_deadline():
+                nonlocal timed_out
+                timed_out = time.monotonic() > deadline
+                return 1 if timed_out else 0
+
+            con.set_progress_handler(check_deadline, PROGRESS_STEPS)
+
+        cursor = con.cursor()
+        try:
+            cursor.execute(sql)
+            rows = []
+            while True:
+                batch = cursor.fetchmany(FETCH_SIZE)
+                if not batch:
+                    return QueryResult(OK, rows, elapsed=time.monotonic() - start)
+                rows.extend(batch)
+                if self.max_rows is not None and len(rows) > self.max_rows:
+                    return QueryResult(ROW_LIMIT, rows[:self.max_rows], error=f"Query returned more than {self.max_rows} rows", elapsed=time.monotonic() - start)
+        except Exception as e:
+            if timed_out:
+                return QueryResult(TIMEOUT, error=f"Query exceeded the {self.timeout}s time limit", elapsed=time.monotonic() - start)
+            return QueryResult(ERROR, error=str(e), elapsed=time.monotonic() - start)
+        finally:
+            cursor.close()
+            if self.timeout is not None:
+                con.set_progress_handler(None, 0)
+
+    def compare(self, db_path: str, predicted_sql: str, gold_sql: str, ordered: bool = False) -> Comparison:
+        """
+        Executes both queries against `db_path` and compares their results without
+        holding them in memory.
+
+        Both cursors are read in step, `FETCH_SIZE` rows at a time. Unordered results
+        are compared by a hash of their multiset of rows; `ordered` results row by row.
+        The comparison stops as soon as the results differ: at the first differing
+        row when ordered, and as soon as one result runs out of rows before the other.
+        Each query gets its own `timeout`; `max_rows` does not apply.
+        """
+        start = time.monotonic()
+        try:
+            con = self._connect(db_path)
+        except sqlite3.Error as e:
+            return Comparison(ERROR, error=str(e), elapsed=time.monotonic() - start)
+
+        # Seconds each query has run so far, and the query running now with its start time.
+        spent = {"predicted": 0.0, "gold": 0.0}
+        running = ["predicted", start]
+        timed_out = False
+
+        def check_deadline():
+            nonlocal timed_out
+            query, started = running
+            timed_out = spent[query] + time.monotonic() - started > self.timeout
+            return 1 if timed_out else 0
+
+        def run(query, call, *args):
+            running[:] = [query, time.monotonic()]
+            try:
+                return call(*args)
+            finally:
+                spent[query] += time.monotonic() - running[1]
+
+        if self.timeout is not None:
+            con.set_progress_handler(check_deadline, PROGRESS_STEPS)
+
+        predicted, gold = con.cursor(), con.cursor()
+        counts = [0, 0]
+        digests = [0, 0]
+        query = "predicted"
+
+        def done(match: bool) -> Comparison:
+            return Comparison(OK, OK, match, counts[0], counts[1], elapsed=time.monotonic() - start)
+
+        try:
+            run("predicted", predicted.execute, predicted_sql)
+            query = "gold"
+            run("gold", gold.execute, gold_sql)
+            while True:
+                query = "predicted"
+                predicted_batch = run("predicted", predicted.fetchmany, FETCH_SIZE)
+                query = "gold"
+                gold_batch = run("gold", gold.fetchmany, FETCH_SIZE)
+                counts[0] += len(predicted_batch)
+                counts[1] += len(gold_batch)
+                if len(predicted_batch) != len(gold_batch):
+                    # One result ran out of rows first, so the row counts differ.
+                    return done(False)
+                if not predicted_batch:
+                    return done(digests[0] == digests[1])
+                if ordered:
+                    if predicted_batch != gold_batch:
+                        return done(False)
+                elif counts[0] < FETCH_SIZE:
+                    # Both results are complete and small: compare them exactly. (Plain dict
+                    # equality; Counter's own __eq__ loops in Python.)
+                    return done(predicted_batch == gold_batch or dict.__eq__(Counter(predicted_batch), Counter(gold_batch)))
+                else:
+                    digests[0] = multiset_hash(predicted_batch, digests[0])
+                    digests[1] = multiset_hash(gold_batch, digests[1])
+        except Exception as e:
+            status = TIMEOUT if timed_out else ERROR
+            error = f"Query exceeded the {self.timeout}s time limit" if timed_out else str(e)
+            if query == "predicted":
+                return Comparison(status, error=error, predicted_rows=counts[0], elapsed=time.monotonic() - start)
+            return Comparison(OK, status, predicted_rows=counts[0], gold_rows=counts[1], error=error, elapsed=time.monotonic() - start)
+        finally:
+            predicted.close()
+            gold.close()
+            if self.timeout is not None:
+                con.set_progress_handler(None, 0)
+
+    def _connect(self, db_path: str) -> sqlite3.Connection:
+        if self.memory_limit is not None and not self._heap_limit_set:
+            # The limit is process-wide, and pooled connections deny pragmas, so a scratch connection sets it.
+            with closing(sqlite3.connect(":memory:")) as scratch:
+                scratch.execute(f"PRAGMA hard_heap_limit = {int(self.memory_limit)}")
+            self._heap_limit_set = True
+        return self.manager.get(db_path)
+
+    def close(self):
+        if self._owns_manager:
+            self.manager.close()
+            self.manager.clear_replicas()
+
+_worker_executor = None
+
+def _init_worker(timeout, max_rows, memory_limit, replica_bytes):
+    global _worker_executor
+    if memory_limit is not None:
+        try:
+            import resource
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+        except (ImportError, ValueError, OSError):
+            # Not available on this platform: fall back to SQLite's own heap limit.
+            pass
+    _worker_executor = QueryExecutor(timeout=timeout, max_rows=max_rows, memory_limit=memory_limit, replica_bytes=replica_bytes)
+
+def _execute_in_worker(db_path: str, sql: str) -> QueryResult:
+    return _worker_executor.execute(db_path, sql)
+
+def _compare_in_worker(db_path: str, predicted_sql: str, gold_sql: str, ordered: bool) -> Comparison:
+    return _worker_executor.compare(db_path, predicted_sql, gold_sql, ordered)
+
+def _worker_main(conn, timeout, max_rows, memory_limit, replica_bytes):
+    _init_worker(timeout, max_rows, memory_limit, replica_bytes)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        function, args = task
+        try:
+            conn.send((True, function(*args)))
+        except Exception as e:
+            conn.send((False, e))
+
+class _WorkerDied(Exception):
+    pass
+
+class _Worker:
+    """
+    A worker process running one query at a time, sent over its own pipe.
+    """
+    def __init__(self, context, initargs: tuple):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child, *initargs), daemon=True)
+        self.process.start()
+        child.close()
+        self.tasks = 0
+
+    def run(self, function, args: tuple, wait: Optional[float]):
+        """
+        Runs `function(*args)` in the worker. Raises TimeoutError if it takes longer
+        than `wait` seconds, and `_WorkerDied` if the process exits meanwhile.
+        """
+        try:
+            self.conn.send((function, args))
+            # A dead worker's pipe is ready too: recv then raises EOFError.
+            ready = self.conn.poll(wait)
+            if ready:
+                ok, value = self.conn.recv()
+        except (EOFError, OSError) as e:
+            raise _WorkerDied(f"exit code {self.process.exitcode}") from e
+        if not ready:
+            raise TimeoutError
+        self.tasks += 1
+        if not ok:
+            raise value
+        return value
+
+    def stop(self, kill: bool = False):
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+        self.process.join(timeout=5)
+        self.conn.close()
+
+class SubprocessExecutor(QueryExecutor):
+    """
+    Executes queries in worker processes.
+
+    Each query checks out a worker of its own, so at most `num_workers` queries run
+    at once. Workers are replaced after `max_tasks_per_worker` queries, which bounds
+    leaks from pathological queries. With a memory limit, each worker also gets an
+    address-space limit (RLIMIT_AS) instead of sharing the parent's SQLite heap. If a
+    worker stops responding past its timeout, that worker alone is killed and
+    replaced; queries running in the other workers are not affected.
+    """
+    def __init__(self, timeout: Optional[float] = 30.0, max_rows: Optional[int] = None, memory_limit: Optional[int] = None, num_workers: Optional[int] = None, max_tasks_per_worker: int = 1000, grace_period: float = 5.0, replica_bytes: Optional[int] = None):
+        """
+        Args:
+            timeout: The wall-clock limit per query, in seconds. None disables it.
+            max_rows: The maximum number of rows fetched per query. None disables it.
+            memory_limit: The per-worker memory limit in bytes. None disables it.
+            num_workers: The number of worker processes. Defaults to the number of CPUs.
+            max_tasks_per_worker: The number of queries after which a worker is recycled.
+            grace_period: Extra seconds to wait for a worker past `timeout` before killing it.
+            replica_bytes: The in-memory replica budget of each worker. Replicas are
+                           lost when a worker is recycled.
+        """
+        super().__init__(timeout=timeout, max_rows=max_rows, memory_limit=memory_limit)
+        self.replica_bytes = replica_bytes
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.grace_period = grace_period
+        # Like a ProcessPoolExecutor with max_tasks_per_child: forking a threaded parent is unsafe.
+        self._context = multiprocessing.get_context("spawn")
+        # Idle workers; None stands for a worker not started yet.
+        self._idle = queue.LifoQueue()
+        for _ in range(self.num_workers):
+            self._idle.put(None)
+
+    def _run(self, function, args: tuple, wait: Optional[float]):
+        worker = self._idle.get()
+        try:
+            if worker is None or not worker.process.is_alive():
+                worker = _Worker(self._context, (self.timeout, self.max_rows, self.memory_limit, self.replica_bytes))
+            try:
+                value = worker.run(function, args, wait)
+            except (TimeoutError, _WorkerDied):
+                worker.stop(kill=True)
+                worker = None
+                raise
+            if worker.tasks >= self.max_tasks_per_worker:
+                worker.stop()
+                worker = None
+            return value
+        finally:
+            self._idle.put(worker)
+
+    def execute(self, db_path: str, sql: str) -> QueryResult:
+        start = time.monotonic()
+        wait = None if self.timeout is None else self.timeout + self.grace_period
+        try:
+            return self._run(_execute_in_worker, (db_path, sql), wait)
+        except TimeoutError:
+            return QueryResult(TIMEOUT, error=f"Query exceeded the {self.timeout}s time limit", elapsed=time.monotonic() - start)
+        except _WorkerDied as e:
+            # E.g. the worker hit its memory limit.
+            return QueryResult(ERROR, error=f"Worker process died: {e}", elapsed=time.monotonic() - start)
+
+    def compare(self, db_path: str, predicted_sql: str, gold_sql: str, ordered: bool = False) -> Comparison:
+        start = time.monotonic()
+        # Both queries may use up their timeout.
+        wait = None if self.timeout is None else 2 * self.timeout + self.grace_period
+        try:
+            return self._run(_compare_in_worker, (db_path, predicted_sql, gold_sql, ordered), wait)
+        except TimeoutError:
+            return Comparison(TIMEOUT, error=f"Query exceeded the {self.timeout}s time limit", elapsed=time.monotonic() - start)
+        except _WorkerDied as e:
+            return Comparison(ERROR, error=f"Worker process died: {e}", elapsed=time.monotonic() - start)
+
+    def close(self):
+        """
+        Stops the idle workers. The executor starts new ones if it is used again.
+        """
+        workers = []
+        while True:
+            try:
+                workers.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        for worker in workers:
+            if worker is not None:
+                worker.stop()
+            self._idle.put(None)
+
+def get_executor(config: Optional[dict] = None) -> QueryExecutor:
+    """
+    Builds a query executor from an `execution` config section.
+
+    Recognized keys: timeout, max_rows, memory_limit, replica_bytes, subprocess,
+    num_workers, max_tasks_per_worker.
+    """
+    config = dict(config or {})
+    if config.pop("subprocess", False):
+        return SubprocessExecutor(**config)
+    return QueryExecutor(**config)
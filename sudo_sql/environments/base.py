@@ -1,4 +1,8 @@
 from abc import ABC, abstractmethod
+from typing import Optional, Sequence
+
+# A (generated_sql, db_path, ground_truth_sql) triple; db_path and ground_truth_sql may be None.
+StepInput = tuple[str, Optional[str], Optional[str]]
 
 class BaseEnvironment(ABC):
     """
@@ -12,6 +16,15 @@ class BaseEnvironment(ABC):
         """
         pass
 
+    def reset(self, item: dict):
+        """
+        Prepares the environment for the dataset item the next step answers.
+
+        Args:
+            item: The dataset item (question, ground truth SQL, database, ...).
+        """
+        pass
+
     @abstractmethod
     def step(self, generated_sql: str) -> tuple[str, float]:
         """
@@ -23,4 +36,25 @@ class BaseEnvironment(ABC):
         Returns:
             A tuple containing the observation (e.g., query result or error) and the reward.
         """
-        pass
\ No newline at end of file
+        pass
+
+    def step_batch(self, batch: Sequence[StepInput]) -> tuple[list[str], list[float]]:
+        """
+        Executes a batch of steps.
+
+        The default implementation calls `step` on each generated query in turn;
+        environments override it to use the database and ground truth of each triple
+        and to run steps concurrently.
+
+        Args:
+            batch: (generated_sql, db_path, ground_truth_sql) triples.
+
+        Returns:
+            A tuple containing the list of observations and the list of rewards.
+        """
+        observations, rewards = [], []
+        for generated_sql, _, _ in batch:
+            observation, reward = self.step(generated_sql)
+            observations.append(observation)
+            rewards.append(reward)
+        return observations, rewards
@@ -1,5 +1,5 @@
-from typing import Tuple
-from sudo_sql.environments.base import BaseEnvironment
+from typing import Optional, Sequence, Tuple
+from sudo_sql.environments.base import BaseEnvironment, StepInput
 
 class SFTEnvironment(BaseEnvironment):
     """
@@ -8,16 +8,24 @@ class SFTEnvironment(BaseEnvironment):
     This environment provides a reward of 1.0 if the generated SQL exactly matches
     the ground truth SQL from the dataset, and 0.0 otherwise.
     """
-    def __init__(self, dataset: list[dict]):
+    def __init__(self, dataset: Optional[list[dict]] = None):
         """
         Initializes the SFT environment.
 
         Args:
             dataset: A list of dictionaries, where each dictionary contains a
-                     'question' and a 'sql' key.
+                     'question' and a 'sql' key. Can be omitted when the ground
+                     truth is provided through `reset` instead.
         """
         self.dataset = dataset
         self.current_item = 0
+        self.ground_truth_sql = None
+
+    def reset(self, item: dict):
+        """
+        Sets the ground truth SQL the next step is compared against.
+        """
+        self.ground_truth_sql = item['sql']
 
     def step(self, generated_sql: str) -> Tuple[str, float]:
         """
@@ -29,7 +37,13 @@ class SFTEnvironment(BaseEnvironment):
         Returns:
             A tuple containing the observation (ground truth SQL) and the reward.
         """
-        ground_truth_sql = self.dataset[self.current_item]['sql']
+        if self.ground_truth_sql is not None:
+            ground_truth_sql = self.ground_truth_sql
+            self.ground_truth_sql = None
+        else:
+            ground_truth_sql = self.dataset[self.current_item]['sql']
+            # Move to the next item in the dataset for the next step
+            self.current_item = (self.current_item + 1) % len(self.dataset)
 
         if generated_sql.strip().lower() == ground_truth_sql.strip().lower():
             reward = 1.0
@@ -37,8 +51,17 @@ class SFTEnvironment(BaseEnvironment):
             reward = 0.0
 
         observation = ground_truth_sql
-        
-        # Move to the next item in the dataset for the next step
-        self.current_item = (self.current_item + 1) % len(self.dataset)
 
-        return observation, reward
\ No newline at end of file
+        return observation, reward
+
+    def step_batch(self, batch: Sequence[StepInput]) -> Tuple[list[str], list[float]]:
+        """
+        Compares each generated query with the ground truth of its triple.
+        """
+        observations, rewards = [], []
+        for generated_sql, _, ground_truth_sql in batch:
+            self.ground_truth_sql = ground_truth_sql
+            observation, reward = self.step(generated_sql)
+            observations.append(observation)
+            rewards.append(reward)
+        return observations, rewards
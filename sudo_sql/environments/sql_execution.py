@@ -1,42 +1,173 @@
-import sqlite3
-from typing import Tuple
-from sudo_sql.environments.base import BaseEnvironment
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Sequence, Tuple
+from sudo_sql.environments.base import BaseEnvironment, StepInput
+from sudo_sql.database import QueryExecutor, has_order_by
+from sudo_sql.database.executor import ERROR, TIMEOUT
+
+DEFAULT_MAX_ROWS = 1000
 
 class SQLExecutionEnvironment(BaseEnvironment):
     """
     An environment that executes a SQL query against a database and provides a reward.
+
+    Without a ground truth query, the reward is 1.0 if the query executes and -1.0 if
+    it fails. With one (passed to `step_batch` or set through `reset`), the reward is
+    1.0 if the results match, 0.0 if they differ and -1.0 if the query fails. Results
+    are compared like execution accuracy (see `QueryExecutor.compare`): streamed,
+    without a row limit, and in order only when the ground truth has an ORDER BY.
     """
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: Optional[str] = None, executor: Optional[QueryExecutor] = None, timeout_reward: float = -1.0, max_workers: Optional[int] = None):
         """
         Initializes the environment.
 
         Args:
-            db_path: The path to the SQLite database file.
+            db_path: The path to the SQLite database file. Can be omitted when every
+                     step names its database (through `reset` or `step_batch`).
+            executor: Executes queries with a timeout and resource limits. Defaults to a
+                      30s timeout on a pooled, read-only connection, reading at most
+                      1000 rows of queries scored without a ground truth.
+            timeout_reward: The reward given when a query hits the time limit.
+            max_workers: The number of databases `step_batch` executes on concurrently.
         """
         self.db_path = db_path
+        self._owns_executor = executor is None
+        self.executor = executor or QueryExecutor(max_rows=DEFAULT_MAX_ROWS)
+        self.timeout_reward = timeout_reward
+        self.max_workers = max_workers
+        self.timeouts = 0
+        self.ground_truth_sql = None
+        self._pool = None
+
+    def reset(self, item: dict):
+        """
+        Points the next step at the item's database and ground truth query, if it has them.
+        """
+        self.db_path = item.get('db_path') or self.db_path
+        self.ground_truth_sql = item.get('sql') or None
 
     def step(self, generated_sql: str) -> Tuple[str, float]:
         """
-        Executes the SQL query and returns a reward.
+        Executes the SQL query on a pooled, read-only connection and returns a reward.
 
         Args:
             generated_sql: The SQL query to execute.
 
         Returns:
-            A tuple containing the observation (result or error) and the reward.
-        """
-        try:
-            con = sqlite3.connect(self.db_path)
-            cursor = con.cursor()
-            cursor.execute(generated_sql)
-            result = cursor.fetchall()
-            reward = 1.0
-            observation = str(result)
-        except Exception as e:
-            reward = -1.0
-            observation = str(e)
-        finally:
-            if 'con' in locals():
-                con.close()
-        
-        return observation, reward
+            A tuple containing the observation (result, error or timeout) and the reward.
+        """
+        return self.score(generated_sql, self.db_path, self.ground_truth_sql)
+
+    def score(self, generated_sql: str, db_path: str, ground_truth_sql: Optional[str] = None) -> Tuple[str, float]:
+        """
+        Executes one query against `db_path` and rewards it, optionally against a ground truth.
+        """
+        if ground_truth_sql:
+            comparison = self.executor.compare(db_path, generated_sql, ground_truth_sql, ordered=has_order_by(ground_truth_sql))
+            status, error = comparison.status, comparison.error
+        else:
+            result = self.executor.execute(db_path, generated_sql)
+            status, error = result.status, result.error
+
+        if status == TIMEOUT:
+            self.timeouts += 1
+            return f"Timeout: {error}", self.timeout_reward
+        if status == ERROR:
+            return error, -1.0
+        if not ground_truth_sql:
+            # A truncated (row_limit) result still means the query executed.
+            return str(result.rows), 1.0
+
+        if comparison.gold_status in (ERROR, TIMEOUT):
+            return f"Could not execute the ground truth: {comparison.error}", 0.0
+        if comparison.match:
+            return f"The {comparison.predicted_rows} rows match the ground truth.", 1.0
+        return "The results differ from the ground truth.", 0.0
+
+    def step_batch(self, batch: Sequence[StepInput]) -> Tuple[list[str], list[float]]:
+        """
+        Executes a batch of queries, concurrently across databases.
+
+        Triples without a database use the environment's own `db_path`.
+        """
+        if self._pool is None:
+            self._pool = EnvironmentPool(executor=self.executor, timeout_reward=self.timeout_reward, max_workers=self.max_workers)
+
+        batch = [(sql, db_path or self.db_path, ground_truth_sql) for sql, db_path, ground_truth_sql in batch]
+        timeouts_before = self._pool.timeouts
+        observations, rewards = self._pool.step_batch(batch)
+        self.timeouts += self._pool.timeouts - timeouts_before
+        return observations, rewards
+
+    def close(self):
+        """
+        Shuts down the threads of `step_batch`, and the executor if the environment created it.
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        if self._owns_executor:
+            self.executor.close()
+
+class EnvironmentPool:
+    """
+    A pool of `SQLExecutionEnvironment`s keyed by database.
+
+    `step_batch` groups a batch by database and runs each group on its own thread.
+    SQLite releases the GIL while it executes a query, and every thread gets its own
+    pooled connection, so different databases are queried in parallel.
+    """
+    def __init__(self, executor: Optional[QueryExecutor] = None, timeout_reward: float = -1.0, max_workers: Optional[int] = None):
+        """
+        Args:
+            executor: The query executor shared by all environments.
+            timeout_reward: The reward given when a query hits the time limit.
+            max_workers: The number of databases executed on concurrently.
+        """
+        self.executor = executor or QueryExecutor(max_rows=DEFAULT_MAX_ROWS)
+        self.timeout_reward = timeout_reward
+        self.environments = {}
+        self._threads = ThreadPoolExecutor(max_workers=max_workers)
+
+    def get(self, db_path: str) -> SQLExecutionEnvironment:
+        """
+        Returns the environment bound to `db_path`, creating it if needed.
+        """
+        if db_path not in self.environments:
+            self.environments[db_path] = SQLExecutionEnvironment(db_path, executor=self.executor, timeout_reward=self.timeout_reward)
+        return self.environments[db_path]
+
+    @property
+    def timeouts(self) -> int:
+        return sum(env.timeouts for env in self.environments.values())
+
+    def step_batch(self, batch: Sequence[StepInput]) -> Tuple[list[str], list[float]]:
+        """
+        Scores (generated_sql, db_path, ground_truth_sql) triples.
+
+        Returns:
+            The observations and rewards, in the order of `batch`.
+        """
+        groups = {}
+        for index, (sql, db_path, ground_truth_sql) in enumerate(batch):
+            groups.setdefault(db_path, []).append((index, sql, ground_truth_sql))
+
+        # Environments are created up front so worker threads only read the mapping.
+        environments = {db_path: self.get(db_path) for db_path in groups}
+
+        def run_group(db_path, entries):
+            env = environments[db_path]
+            return [(index, env.score(sql, db_path, ground_truth_sql)) for index, sql, ground_truth_sql in entries]
+
+        observations = [None] * len(batch)
+        rewards = [0.0] * len(batch)
+        for group in self._threads.map(lambda args: run_group(*args), groups.items()):
+            for index, (observation, reward) in group:
+                observations[index] = observation
+                rewards[index] = reward
+        return observations, rewards
+
+    def close(self):
+        """
+        Shuts down the worker threads. The executor is left open for its owner to close.
+        """
+        self._threads.shutdown()
@@ -1,7 +1,8 @@
 # sudo_sql/evaluation/metrics.py
 
-import sqlite3
 import re
+from sudo_sql.database import QueryExecutor, has_order_by
+from sudo_sql.database.executor import ERROR, TIMEOUT
 
 def normalize_sql(sql):
     """
@@ -23,38 +24,59 @@ def exact_match_score(predicted_sql, ground_truth_sql):
     """
     return 1 if normalize_sql(predicted_sql) == normalize_sql(ground_truth_sql) else 0
 
-def execution_accuracy(predicted_sql, ground_truth_sql, db_path):
+CORRECT = "correct"
+INCORRECT = "incorrect"
+GOLD_ERROR = "gold_error"
+
+_default_executor = QueryExecutor()
+
+def execution_outcome(predicted_sql, ground_truth_sql, db_path, executor=None):
+    """
+    Executes the predicted and ground truth SQL queries and classifies the outcome.
+
+    The results are streamed and compared as they are read (see
+    `QueryExecutor.compare`), so memory use does not grow with their size. Row
+    order only matters when the ground truth query has an ORDER BY.
+
+    Args:
+        predicted_sql (str): The SQL query generated by the model.
+        ground_truth_sql (str): The correct SQL query.
+        db_path (str): Path to the SQLite database file.
+        executor (QueryExecutor): Executes the queries with a timeout and resource limits.
+            Defaults to a 30s timeout on a pooled, read-only connection.
+
+    Returns:
+        One of "correct", "incorrect", "error" (the prediction failed), "timeout"
+        (the prediction hit the time limit) or "gold_error" (the ground truth query
+        failed).
+    """
+    executor = executor or _default_executor
+
+    comparison = executor.compare(db_path, predicted_sql, ground_truth_sql, ordered=has_order_by(ground_truth_sql))
+    if comparison.status == TIMEOUT:
+        return TIMEOUT
+    if comparison.status == ERROR:
+        return ERROR
+    if comparison.gold_status in (ERROR, TIMEOUT):
+        return GOLD_ERROR
+
+    return CORRECT if comparison.match else INCORRECT
+
+def execution_accuracy(predicted_sql, ground_truth_sql, db_path, executor=None):
     """
     Calculates Execution Accuracy. It executes both the predicted and 
     ground truth SQL queries and compares their results.
 
+    Queries run on a pooled, read-only connection with a time limit, so generated
+    SQL can neither modify the database nor stall the evaluation.
+
     Args:
         predicted_sql (str): The SQL query generated by the model.
         ground_truth_sql (str): The correct SQL query.
         db_path (str): Path to the SQLite database file.
+        executor (QueryExecutor): Optional executor overriding the default limits.
 
     Returns:
-        1 if the results match, 0 otherwise. Returns 0 if any query fails.
-    """
-    try:
-        # Connect to a temporary in-memory database
-        con = sqlite3.connect(db_path)
-        cursor = con.cursor()
-
-        # Execute predicted query
-        cursor.execute(predicted_sql)
-        predicted_result = cursor.fetchall()
-
-        # Execute ground truth query
-        cursor.execute(ground_truth_sql)
-        ground_truth_result = cursor.fetchall()
-
-        # Compare results
-        return 1 if set(predicted_result) == set(ground_truth_result) else 0
-
-    except Exception:
-        # If any SQL execution fails, the prediction is considered incorrect.
-        return 0
-    finally:
-        if 'con' in locals():
-            con.close()
+        1 if the results match, 0 otherwise. Returns 0 if any query fails or times out.
+    """
+    return 1 if execution_outcome(predicted_sql, ground_truth_sql, db_path, executor) == CORRECT else 0
@@ -0,0 +1,201 @@
+import os
+import json
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator, Optional
+from sudo_sql.database import get_executor
+from sudo_sql.evaluation.metrics import exact_match_score, execution_outcome, CORRECT
+from sudo_sql.logger_config import logger
+from sudo_sql.results.store import INDEX_SUFFIX
+
+# Fields every record needs to be sharded and scored.
+REQUIRED_FIELDS = ("db_id", "generated_sql", "ground_truth_sql")
+
+def _resolve_db_path(record: dict, db_dir: Optional[str]) -> Optional[str]:
+    if db_dir:
+        return os.path.join(db_dir, record['db_id'], f"{record['db_id']}.sqlite")
+    return record.get('db_path')
+
+def _db_id_of(item_id: str) -> str:
+    if item_id.startswith("legacy:"):
+        return item_id[len("legacy:"):].rpartition(":")[0]
+    return item_id.rsplit(":", 2)[0]
+
+def _indexed_shards(results_path: str, size: int) -> Optional[dict[str, list[tuple[int, int]]]]:
+    """
+    Groups the byte ranges of the records by db_id using the results file's index,
+    or returns None if there is no index or it does not cover the whole file.
+    """
+    index_path = results_path + INDEX_SUFFIX
+    if not os.path.exists(index_path):
+        return None
+
+    shards = defaultdict(list)
+    offset = 0
+    with open(index_path, "r", encoding="utf-8") as f:
+        for line in f:
+            item_id, _, end = line.rstrip("\n").rpartition("\t")
+            if not item_id or not end.isdigit() or int(end) <= offset:
+                return None
+            shards[_db_id_of(item_id)].append((offset, int(end)))
+            offset = int(end)
+    return shards if offset == size else None
+
+def _parse_record(raw_line: bytes) -> Optional[dict]:
+    """
+    Parses one line of a results file, or logs a warning and returns None if it
+    is not a record with the fields needed to score it.
+    """
+    try:
+        record = json.loads(raw_line)
+    except json.JSONDecodeError:
+        logger.warning(f"Could not parse line in results file: {raw_line!r}")
+        return None
+    missing = [field for field in REQUIRED_FIELDS if field not in record] if isinstance(record, dict) else list(REQUIRED_FIELDS)
+    if missing:
+        logger.warning(f"Skipping record without {', '.join(missing)} in results file: {raw_line!r}")
+        return None
+    return record
+
+def _scanned_shards(results_path: str) -> dict[str, list[tuple[int, int]]]:
+    """
+    Groups the byte ranges of the records by db_id by reading the file once.
+    Records are parsed for their db_id and dropped.
+    """
+    shards = defaultdict(list)
+    with open(results_path, "rb") as f:
+        offset = 0
+        for raw_line in f:
+            start, offset = offset, offset + len(raw_line)
+            record = _parse_record(raw_line)
+            if record is not None:
+                shards[record['db_id']].append((start, offset))
+    return shards
+
+def _read_records(results_path: str, ranges: list[tuple[int, int]]) -> Iterator[dict]:
+    with open(results_path, "rb") as f:
+        for start, end in ranges:
+            f.seek(start)
+            record = _parse_record(f.read(end - start))
+            if record is not None:
+                yield record
+
+def _score_shard(results_path: str, ranges: list[tuple[int, int]], db_dir: Optional[str], execution_config: Optional[dict]) -> list[dict]:
+    """
+    Reads and scores all records of one database. Runs in a worker process, so every
+    database is opened by a single worker and its pooled connection stays warm.
+    """
+    executor = get_executor(execution_config)
+    scored = []
+    for record in _read_records(results_path, ranges):
+        db_path = _resolve_db_path(record, db_dir)
+        if db_path is None:
+            outcome = "missing_db"
+        else:
+            outcome = execution_outcome(record['generated_sql'], record['ground_truth_sql'], db_path, executor)
+        scored.append({
+            **record,
+            "em": exact_match_score(record['generated_sql'], record['ground_truth_sql']),
+            "ex": 1 if outcome == CORRECT else 0,
+            "ex_outcome": outcome,
+        })
+    executor.close()
+    return scored
+
+class _Summary:
+    """
+    Running EM/EX totals, overall and by difficulty and db.
+    """
+    def __init__(self):
+        self.totals = [0, 0, 0]
+        self.outcomes = Counter()
+        self.by_difficulty = defaultdict(lambda: [0, 0, 0])
+        self.by_db = defaultdict(lambda: [0, 0, 0])
+
+    def add(self, record: dict):
+        for totals in (self.totals, self.by_difficulty[record.get('difficulty') or "unknown"], self.by_db[record['db_id']]):
+            totals[0] += 1
+            totals[1] += record['em']
+            totals[2] += record['ex']
+        self.outcomes[record['ex_outcome']] += 1
+
+    def result(self, elapsed: float) -> dict:
+        def group_stats(totals: list) -> dict:
+            count, em, ex = totals
+            return {
+                "count": count,
+                "em": em / count if count else 0.0,
+                "ex": ex / count if count else 0.0,
+            }
+
+        return {
+            **group_stats(self.totals),
+            "outcomes": dict(self.outcomes),
+            "by_difficulty": {key: group_stats(totals) for key, totals in sorted(self.by_difficulty.items())},
+            "by_db": {key: group_stats(totals) for key, totals in sorted(self.by_db.items())},
+            "elapsed_seconds": elapsed,
+        }
+
+def evaluate_results(results_path: str, output_path: Optional[str] = None, summary_path: Optional[str] = None, num_workers: Optional[int] = None, db_dir: Optional[str] = None, execution_config: Optional[dict] = None) -> dict:
+    """
+    Scores an inference results file with EM and EX.
+
+    The records are sharded by db_id across a process pool. Shards are found from
+    the byte offsets in the results file's index (`<results>.idx`), or by one scan
+    of the file when it has no complete index, so only the offsets of the records
+    are held in memory. Each worker reads its own shard's records. Scored records
+    are written, and added to the summary, as each shard finishes, so the scored
+    file is grouped by database rather than in the order of the results file.
+
+    Args:
+        results_path: The JSONL file written by `InferencePipeline`.
+        output_path: Where to write the per-item scores. Defaults to `<results>.scored.jsonl`.
+        summary_path: Where to write the summary. Defaults to `<results>.summary.json`.
+        num_workers: The number of worker processes. Defaults to the number of CPUs.
+        db_dir: A directory laid out as `<db_dir>/<db_id>/<db_id>.sqlite`. Overrides the
+                `db_path` stored in each record.
+        execution_config: Options for the query executor (timeout, max_rows, ...).
+
+    Returns:
+        The summary: overall EM/EX, outcome counts, and breakdowns by difficulty and db.
+    """
+    start = time.monotonic()
+    base_path = results_path[:-len(".jsonl")] if results_path.endswith(".jsonl") else results_path
+    output_path = output_path or f"{base_path}.scored.jsonl"
+    summary_path = summary_path or f"{base_path}.summary.json"
+    num_workers = num_workers or os.cpu_count() or 1
+
+    shards = _indexed_shards(results_path, os.path.getsize(results_path))
+    if shards is None:
+        shards = _scanned_shards(results_path)
+
+    logger.info(f"Scoring {sum(len(s) for s in shards.values())} results across {len(shards)} databases with {num_workers} workers...")
+    summary = _Summary()
+    with open(output_path, 'w') as f:
+        def write_shard(scored: list[dict]):
+            for record in scored:
+                f.write(json.dumps(record) + '\n')
+                summary.add(record)
+
+        if num_workers > 1:
+            with ProcessPoolExecutor(max_workers=num_workers) as pool:
+                # Largest shards first, so a big database does not end up last on a single core.
+                # as_completed drops each future once yielded, so finished shards are not kept.
+                futures = (
+                    pool.submit(_score_shard, results_path, ranges, db_dir, execution_config)
+                    for ranges in sorted(shards.values(), key=len, reverse=True)
+                )
+                for future in as_completed(futures):
+                    write_shard(future.result())
+        else:
+            for ranges in shards.values():
+                write_shard(_score_shard(results_path, ranges, db_dir, execution_config))
+
+    summary = summary.result(time.monotonic() - start)
+    with open(summary_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    logger.info(f"EM: {summary['em']:.4f} | EX: {summary['ex']:.4f} | Outcomes: {summary['outcomes']}")
+    logger.info(f"Scores saved to {output_path}, summary saved to {summary_path}")
+    return summary
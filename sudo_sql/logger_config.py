@@ -1,6 +1,9 @@
 import sys
+from typing import Optional
 from loguru import logger
 
+LOG_FILE = "logs/sudo-sql.log"
+
 # Remove default handler
 logger.remove()
 
@@ -12,16 +15,29 @@ logger.add(
     colorize=True,
 )
 
-# Configure file logger
-logger.add(
-    "logs/sudo-sql.log",
-    level="DEBUG",
-    format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
-    rotation="10 MB",
-    retention="7 days",
-    enqueue=True,  # Make logging asynchronous
-    backtrace=True,
-    diagnose=True,
-)
+_file_sink_id: Optional[int] = None
+
+def enable_file_logging(path: str = LOG_FILE) -> int:
+    """
+    Adds the file logger. Opening the file (and starting its writer thread) is left
+    to the entry point rather than done on import, so importing the package has no
+    side effects. Calling this again is a no-op.
+
+    Returns:
+        The loguru handler id of the file sink.
+    """
+    global _file_sink_id
+    if _file_sink_id is None:
+        _file_sink_id = logger.add(
+            path,
+            level="DEBUG",
+            format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
+            rotation="10 MB",
+            retention="7 days",
+            enqueue=True,  # Make logging asynchronous
+            backtrace=True,
+            diagnose=True,
+        )
+    return _file_sink_id
 
-__all__ = ["logger"]
+__all__ = ["logger", "enable_file_logging"]
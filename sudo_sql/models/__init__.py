@@ -0,0 +1,15 @@
+from importlib import import_module
+from .base import BaseModelProvider
+
+# Providers are imported only when selected: the Hugging Face provider pulls in
+# transformers and torch, the OpenAI one the openai client.
+PROVIDERS = {
+    "openai": "sudo_sql.models.openai:OpenAIProvider",
+    "huggingface": "sudo_sql.models.huggingface:HuggingFaceProvider",
+}
+
+def get_provider_class(name: str) -> type[BaseModelProvider]:
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown model provider: {name}")
+    module_name, class_name = PROVIDERS[name].split(":")
+    return getattr(import_module(module_name), class_name)
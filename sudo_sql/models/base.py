@@ -1,10 +1,13 @@
+import asyncio
 from abc import ABC, abstractmethod
+from typing import AsyncIterator, Iterable
 
 class BaseModelProvider(ABC):
     """
     Abstract base class for all model providers.
     It ensures that any new model integration will follow a consistent interface.
     """
+    provider_name: str = ""
 
     @abstractmethod
     def generate(self, prompt: str) -> str:
@@ -19,6 +22,91 @@ class BaseModelProvider(ABC):
         """
         pass
 
+    def cache_identity(self) -> dict:
+        """
+        Returns everything besides the prompt that determines the output: the provider,
+        the model and the generation parameters. Used to key cached responses.
+        """
+        return {"provider": self.provider_name or type(self).__name__}
+
+    def is_deterministic(self) -> bool:
+        """
+        Whether the same prompt always produces the same output, i.e. whether
+        responses can be cached. Sampling providers must return False.
+        """
+        return False
+
+    async def generate_async(self, prompt: str) -> str:
+        """
+        Asynchronous counterpart of `generate`. By default, runs `generate` in a thread.
+        """
+        return await asyncio.to_thread(self.generate, prompt)
+
+    def generate_candidates(self, prompt: str, n: int) -> list[str]:
+        """
+        Samples `n` completions for one prompt. By default, calls `generate` `n` times;
+        providers that can sample several completions per request override this.
+        """
+        return [self.generate(prompt) for _ in range(n)]
+
+    async def generate_candidates_async(self, prompt: str, n: int) -> list[str]:
+        """
+        Asynchronous counterpart of `generate_candidates`. By default, runs it in a thread.
+        """
+        return await asyncio.to_thread(self.generate_candidates, prompt, n)
+
+    async def generate_many(self, prompts: Iterable[str], max_concurrency: int = 8, candidates: int = 1) -> AsyncIterator[tuple[int, str | list[str]]]:
+        """
+        Generates completions for many prompts while keeping at most `max_concurrency`
+        requests in flight.
+
+        Prompts are pulled from `prompts` lazily, so the iterable may be a generator.
+        Results are yielded in completion order, not submission order.
+
+        Args:
+            prompts: The prompts to send to the model.
+            max_concurrency: The maximum number of concurrent requests.
+            candidates: When above 1, the number of completions sampled per prompt
+                        with `generate_candidates_async`.
+
+        Yields:
+            Tuples of (index of the prompt in `prompts`, generated text), or of (index,
+            list of candidates) when `candidates` is above 1.
+        """
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be at least 1, got {max_concurrency}")
+
+        async def _indexed(index: int, prompt: str) -> tuple[int, str | list[str]]:
+            if candidates > 1:
+                return index, await self.generate_candidates_async(prompt, candidates)
+            return index, await self.generate_async(prompt)
+
+        prompt_iter = enumerate(prompts)
+        in_flight = set()
+        try:
+            while True:
+                while len(in_flight) < max_concurrency:
+                    next_prompt = next(prompt_iter, None)
+                    if next_prompt is None:
+                        break
+                    in_flight.add(asyncio.ensure_future(_indexed(*next_prompt)))
+
+                if not in_flight:
+                    break
+
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    async def aclose(self):
+        """
+        Releases resources held for asynchronous generation.
+        """
+        pass
+
     def generate_sql(self, question: str, schema: str) -> str:
         """
         Generates an SQL query by creating a specific prompt and calling the generate method.
@@ -0,0 +1,88 @@
+import os
+import json
+import hashlib
+from typing import Optional
+from sudo_sql.cache import SQLiteCacheStore
+from sudo_sql.models.base import BaseModelProvider
+
+DEFAULT_CACHE_FILE = os.path.join("cache", "responses.sqlite")
+
+class CachedProvider(BaseModelProvider):
+    """
+    Wraps a provider with a disk-backed cache of its responses.
+
+    Responses are keyed by the provider's `cache_identity()` (provider, model and
+    generation parameters) and a hash of the prompt, and stored in a size-bounded
+    `SQLiteCacheStore`. When the wrapped provider samples non-deterministically,
+    every call bypasses the cache.
+    """
+    def __init__(self, provider: BaseModelProvider, path: Optional[str] = None, max_bytes: Optional[int] = None):
+        """
+        Args:
+            provider: The provider whose responses are cached.
+            path: The SQLite cache file. Defaults to `cache/responses.sqlite` under the working directory.
+            max_bytes: The maximum total size of cached responses. None means unbounded.
+        """
+        self.provider = provider
+        self.store = SQLiteCacheStore(path or os.path.join(os.getcwd(), DEFAULT_CACHE_FILE), max_bytes=max_bytes)
+        self.enabled = provider.is_deterministic()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._identity = json.dumps(provider.cache_identity(), sort_keys=True)
+
+    def cache_identity(self) -> dict:
+        return self.provider.cache_identity()
+
+    def is_deterministic(self) -> bool:
+        return self.enabled
+
+    def key(self, prompt: str) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        payload = json.dumps([self._identity, prompt_hash])
+        return "response:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _lookup(self, prompt: str) -> Optional[str]:
+        if not self.enabled:
+            self.bypassed += 1
+            return None
+        response = self.store.get_text(self.key(prompt))
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    def _save(self, prompt: str, response: str):
+        if self.enabled:
+            self.store.put_text(self.key(prompt), response)
+
+    def generate(self, prompt: str) -> str:
+        response = self._lookup(prompt)
+        if response is None:
+            response = self.provider.generate(prompt)
+            self._save(prompt, response)
+        return response
+
+    async def generate_async(self, prompt: str) -> str:
+        response = self._lookup(prompt)
+        if response is None:
+            response = await self.provider.generate_async(prompt)
+            self._save(prompt, response)
+        return response
+
+    def generate_candidates(self, prompt: str, n: int) -> list[str]:
+        # Candidates are sampled, so they are never cached.
+        return self.provider.generate_candidates(prompt, n)
+
+    async def generate_candidates_async(self, prompt: str, n: int) -> list[str]:
+        return await self.provider.generate_candidates_async(prompt, n)
+
+    async def aclose(self):
+        await self.provider.aclose()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "bypassed": self.bypassed}
+
+    def close(self):
+        self.store.close()
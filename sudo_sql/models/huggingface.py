@@ -5,14 +5,18 @@ class HuggingFaceProvider(BaseModelProvider):
     """
     A provider for local Hugging Face models.
     """
-    def __init__(self, model_name: str = "t5-small"):
+    provider_name = "huggingface"
+
+    def __init__(self, model_name: str = "t5-small", generate_kwargs: dict = None):
         """
         Initializes the Hugging Face provider.
 
         Args:
             model_name: The name of the Hugging Face model to use.
+            generate_kwargs: Extra arguments forwarded to `generate`, e.g. do_sample or max_new_tokens.
         """
         self.model_name = model_name
+        self.generate_kwargs = dict(generate_kwargs or {})
         self.pipeline = pipeline("text2text-generation", model=self.model_name)
 
     def generate(self, prompt: str) -> str:
@@ -23,6 +27,6 @@ class HuggingFaceProvider(BaseModelProvider):
         if not prompt.startswith("translate English to SQL:"):
             prompt = f"translate English to SQL: {prompt}"
 
-        result = self.pipeline(prompt)
+        result = self.pipeline(prompt, **self.generate_kwargs)
         
         return result[0]['generated_text'].strip()
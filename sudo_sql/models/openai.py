@@ -1,15 +1,36 @@
 import os
-from openai import OpenAI
+import time
+import asyncio
+from typing import Optional
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+import httpx
 from sudo_sql.models.base import BaseModelProvider
+from sudo_sql.models.rate_limit import RateLimiter, RetryPolicy, AdaptiveConcurrency, estimate_tokens
+from sudo_sql.models.sql_stream import SQLStreamParser
+from sudo_sql.telemetry import telemetry
+from sudo_sql.logger_config import logger
 from dotenv import load_dotenv
 
-load_dotenv()
+SYSTEM_PROMPT = "You are a helpful assistant that generates SQL queries."
 
 class OpenAIProvider(BaseModelProvider):
     """
     A provider for OpenAI and compatible models.
     """
-    def __init__(self, model: str = "gpt-4", api_key: str = None, base_url: str = None):
+    provider_name = "openai"
+
+    def __init__(
+        self,
+        model: str = "gpt-4",
+        api_key: str = None,
+        base_url: str = None,
+        params: dict = None,
+        rate_limit: dict = None,
+        retry: dict = None,
+        adaptive_concurrency: dict = None,
+        connection_pool: dict = None,
+        stream: bool = False,
+    ):
         """
         Initializes the OpenAI provider.
 
@@ -17,25 +38,278 @@ class OpenAIProvider(BaseModelProvider):
             model: The name of the OpenAI model to use.
             api_key: The OpenAI API key. Can be None for local models.
             base_url: The base URL for the API endpoint.
+            params: Extra chat completion parameters, e.g. temperature, top_p, max_tokens or seed.
+            rate_limit: `RateLimiter` options (requests_per_minute, tokens_per_minute, burst_seconds),
+                        plus `completion_tokens`, the completion length assumed when `params`
+                        sets no max_tokens. No pacing when omitted.
+            retry: `RetryPolicy` options (max_retries, initial_delay, max_delay, jitter).
+            adaptive_concurrency: `AdaptiveConcurrency` options (initial, minimum, maximum,
+                                  latency_target, decrease_factor) for asynchronous requests.
+                                  The concurrency is fixed when omitted.
+            connection_pool: HTTP connection pool options: max_connections,
+                             max_keepalive_connections and timeout (seconds).
+            stream: Whether to stream completions, closing the stream as soon as a complete
+                    SQL statement has arrived. The extracted statement is returned
+                    instead of the raw completion.
         """
+        # Read .env when a provider is created rather than when the module is imported.
+        load_dotenv()
         self.model = model
+        self.base_url = base_url
+        self.params = dict(params or {})
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         # If no api_key is found, set it to a dummy value for local models, as the client requires it.
         if not self.api_key:
             self.api_key = "no-key"
 
-        self.client = OpenAI(api_key=self.api_key, base_url=base_url)
+        rate_limit = dict(rate_limit or {})
+        self.completion_tokens = rate_limit.pop("completion_tokens", 256)
+        self.rate_limiter = RateLimiter(**rate_limit) if rate_limit else None
+        self.retry_policy = RetryPolicy(**(retry or {}))
+        self.concurrency = AdaptiveConcurrency(**adaptive_concurrency) if adaptive_concurrency else None
+        self.connection_pool = dict(connection_pool or {})
+        self.stream = stream
+
+        # Retries are handled by `retry_policy`, so the client's own are turned off.
+        self.client = OpenAI(api_key=self.api_key, base_url=base_url, max_retries=0, **self._http_client_options(DefaultHttpxClient))
+        # The async client is created on first use, inside the running event loop.
+        self._async_client = None
+
+    def _http_client_options(self, client_class) -> dict:
+        if not self.connection_pool:
+            return {}
+        options = dict(self.connection_pool)
+        timeout = options.pop("timeout", None)
+        limits = httpx.Limits(**options)
+        if timeout is None:
+            return {"http_client": client_class(limits=limits)}
+        return {"http_client": client_class(limits=limits, timeout=timeout)}
+
+    def _messages(self, prompt: str) -> list[dict]:
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+
+    def _completion_budget(self) -> int:
+        return self.params.get("max_completion_tokens") or self.params.get("max_tokens") or self.completion_tokens
+
+    def _estimated_tokens(self, prompt: str, n: int = 1) -> int:
+        return estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(prompt) + self._completion_budget() * n
+
+    def _should_retry(self, error: Exception, attempt: int) -> Optional[float]:
+        """
+        Returns the delay before retrying a failed request, or None to give up.
+        """
+        if attempt >= self.retry_policy.max_retries or not self.retry_policy.is_retryable(error):
+            return None
+        delay = self.retry_policy.delay(attempt, error)
+        telemetry.count("model.retries")
+        if self.retry_policy.is_throttle(error):
+            telemetry.count("model.throttled")
+        logger.warning(f"Request failed ({type(error).__name__}: {error}); retry {attempt + 1}/{self.retry_policy.max_retries} in {delay:.2f}s.")
+        return delay
 
     def generate(self, prompt: str) -> str:
         """
         Generates text using the specified OpenAI model.
+
+        Requests are paced by the rate limiter, if configured, and throttled or
+        transiently failing requests are retried with backoff.
+        """
+        return self._complete(prompt)[0]
+
+    def generate_candidates(self, prompt: str, n: int) -> list[str]:
+        """
+        Samples `n` completions in a single request, through the API's `n` parameter.
+        """
+        return self._complete(prompt, n)
+
+    def _request_params(self, n: Optional[int]) -> dict:
+        return self.params if n is None else {**self.params, "n": n}
+
+    def _complete(self, prompt: str, n: Optional[int] = None) -> list[str]:
+        params = self._request_params(n)
+        estimated = self._estimated_tokens(prompt, params.get("n", 1))
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                telemetry.observe("model.rate_limit_wait", self.rate_limiter.acquire(estimated))
+            start = time.perf_counter()
+            try:
+                if self.stream:
+                    return self._complete_stream(prompt, params, start, estimated)
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=self._messages(prompt),
+                    **params
+                )
+            except Exception as error:
+                delay = self._should_retry(error, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self._record(response, start, estimated)
+            return self._contents(response, n)
+
+    @staticmethod
+    def _contents(response, n: Optional[int]) -> list[str]:
+        if n is None:
+            return [response.choices[0].message.content.strip()]
+        return [choice.message.content.strip() for choice in sorted(response.choices, key=lambda choice: choice.index)]
+
+    def _complete_stream(self, prompt: str, params: dict, start: float, estimated: int) -> list[str]:
+        """
+        Streams completions until each holds a complete SQL statement and returns the statements.
+        """
+        parsers = [SQLStreamParser() for _ in range(params.get("n", 1))]
+        received = 0
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(prompt),
+            stream=True,
+            **params
+        )
+        try:
+            for chunk in stream:
+                received += self._feed(parsers, chunk)
+                if all(parser.done for parser in parsers):
+                    break
+        finally:
+            # Closing the connection early is what stops the server from generating the rest.
+            stream.close()
+        self._record_stream(parsers, received, start, estimated)
+        return [parser.result() for parser in parsers]
+
+    @staticmethod
+    def _feed(parsers: list[SQLStreamParser], chunk) -> int:
+        """
+        Feeds the deltas of a stream chunk to the parsers of their choices. Returns the number of deltas.
+        """
+        received = 0
+        for choice in chunk.choices or ():
+            delta = choice.delta.content
+            if delta:
+                received += 1
+                parsers[choice.index if len(parsers) > 1 else 0].feed(delta)
+        return received
+
+    def _record_stream(self, parsers: list[SQLStreamParser], received: int, start: float, estimated: int):
+        """
+        Records a streamed request. Most servers send one token per chunk, so the
+        chunks received stand in for the completion tokens. The unused part of the
+        completion budget is only an upper bound on the tokens saved by stopping
+        early, since the model may have ended on its own long before the budget.
         """
-        response = self.client.chat.completions.create(
+        telemetry.observe("model.request", time.perf_counter() - start)
+        telemetry.count("tokens.completion", received)
+        telemetry.count("stream.requests", len(parsers))
+        budget = self._completion_budget() * len(parsers)
+        early_stops = sum(parser.done for parser in parsers)
+        if early_stops:
+            unused = max(budget - received, 0)
+            telemetry.count("stream.early_stops", early_stops)
+            telemetry.count("tokens.saved_upper_bound", unused)
+            telemetry.observe("stream.tokens_saved_upper_bound", unused)
+        if self.rate_limiter is not None:
+            self.rate_limiter.settle(estimated, estimated - budget + received)
+
+    def _record(self, response, start: float, estimated: Optional[int] = None):
+        telemetry.observe("model.request", time.perf_counter() - start)
+        usage = getattr(response, "usage", None)
+        telemetry.record_usage(usage)
+        if self.rate_limiter is not None and estimated is not None:
+            total_tokens = getattr(usage, "total_tokens", None)
+            self.rate_limiter.settle(estimated, total_tokens if isinstance(total_tokens, int) else None)
+
+    def cache_identity(self) -> dict:
+        # Endpoints serving the same model name (e.g. a local server and the hosted API) do not share entries.
+        base_url = self.base_url or os.getenv("OPENAI_BASE_URL")
+        return {"provider": self.provider_name, "model": self.model, "base_url": base_url, "system_prompt": SYSTEM_PROMPT, "params": self.params, "stream": self.stream}
+
+    def is_deterministic(self) -> bool:
+        # The API samples with temperature 1 unless told otherwise.
+        return self.params.get("temperature") == 0 and self.params.get("n", 1) == 1
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0, **self._http_client_options(DefaultAsyncHttpxClient))
+        return self._async_client
+
+    async def generate_async(self, prompt: str) -> str:
+        """
+        Asynchronous counterpart of `generate`, backed by `AsyncOpenAI`. With
+        `adaptive_concurrency`, every attempt also holds one of its slots.
+        """
+        return (await self._complete_async(prompt))[0]
+
+    async def generate_candidates_async(self, prompt: str, n: int) -> list[str]:
+        return await self._complete_async(prompt, n)
+
+    async def _complete_async(self, prompt: str, n: Optional[int] = None) -> list[str]:
+        params = self._request_params(n)
+        estimated = self._estimated_tokens(prompt, params.get("n", 1))
+        attempt = 0
+        while True:
+            if self.concurrency is not None:
+                await self.concurrency.acquire()
+            start = None
+            congested = False
+            try:
+                if self.rate_limiter is not None:
+                    telemetry.observe("model.rate_limit_wait", await self.rate_limiter.acquire_async(estimated))
+                start = time.perf_counter()
+                if self.stream:
+                    return await self._complete_stream_async(prompt, params, start, estimated)
+                response = await self.async_client.chat.completions.create(
+                    model=self.model,
+                    messages=self._messages(prompt),
+                    **params
+                )
+            except Exception as error:
+                congested = self.retry_policy.is_retryable(error)
+                delay = self._should_retry(error, attempt)
+                if delay is None:
+                    raise
+            else:
+                self._record(response, start, estimated)
+                return self._contents(response, n)
+            finally:
+                if self.concurrency is not None:
+                    self.concurrency.release(start, congested)
+            # Back off without holding a slot.
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _complete_stream_async(self, prompt: str, params: dict, start: float, estimated: int) -> list[str]:
+        """
+        Asynchronous counterpart of `_complete_stream`.
+        """
+        parsers = [SQLStreamParser() for _ in range(params.get("n", 1))]
+        received = 0
+        stream = await self.async_client.chat.completions.create(
             model=self.model,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that generates SQL queries."},
-                {"role": "user", "content": prompt}
-            ]
+            messages=self._messages(prompt),
+            stream=True,
+            **params
         )
-        
-        return response.choices[0].message.content.strip()
+        try:
+            async for chunk in stream:
+                received += self._feed(parsers, chunk)
+                if all(parser.done for parser in parsers):
+                    break
+        finally:
+            await stream.close()
+        self._record_stream(parsers, received, start, estimated)
+        return [parser.result() for parser in parsers]
+
+    async def aclose(self):
+        """
+        Closes the async client, if one was created.
+        """
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
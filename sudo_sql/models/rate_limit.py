@@ -0,0 +1,256 @@
+import time
+import random
+import asyncio
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional
+
+# Statuses worth retrying: timeouts, lock conflicts, throttling and server errors.
+RETRYABLE_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+def estimate_tokens(text: str) -> int:
+    """
+    A tokenizer-free estimate of the number of tokens in `text`: about four characters per token.
+    """
+    return len(text) // 4 + 1
+
+class TokenBucket:
+    """
+    A token bucket that hands out reservations.
+
+    `reserve` takes the tokens right away, letting the level go negative, and returns
+    how long the caller must wait before using them. Callers are therefore served in
+    the order they arrive, and a request larger than the bucket still goes through
+    once enough time has passed.
+    """
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            rate: Tokens added per second.
+            capacity: The most tokens that can accumulate, i.e. the largest burst.
+            clock: The time source, in seconds.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.level = capacity
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Takes `amount` tokens and returns the number of seconds until they are available.
+        """
+        with self._lock:
+            self._refill(self.clock())
+            self.level -= amount
+            return max(0.0, -self.level / self.rate)
+
+    def adjust(self, amount: float):
+        """
+        Gives back (positive) or takes (negative) tokens, e.g. once the real cost of a
+        request is known.
+        """
+        with self._lock:
+            self._refill(self.clock())
+            self.level = min(self.capacity, self.level + amount)
+
+class RateLimiter:
+    """
+    Paces requests to an endpoint's requests-per-minute and tokens-per-minute limits.
+
+    Each limit is a `TokenBucket` that refills continuously and holds at most
+    `burst_seconds` worth of its rate, since endpoints usually enforce their
+    per-minute limits over shorter windows as well.
+    """
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None, burst_seconds: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            requests_per_minute: The request limit. None for no limit.
+            tokens_per_minute: The token limit, prompt and completion tokens together. None for no limit.
+            burst_seconds: How many seconds of each rate may be spent at once.
+            clock: The time source, in seconds.
+        """
+        self.requests = self._bucket(requests_per_minute, burst_seconds, clock)
+        self.tokens = self._bucket(tokens_per_minute, burst_seconds, clock)
+
+    @staticmethod
+    def _bucket(per_minute: Optional[float], burst_seconds: float, clock) -> Optional[TokenBucket]:
+        if not per_minute:
+            return None
+        rate = per_minute / 60
+        return TokenBucket(rate, max(rate * burst_seconds, 1.0), clock)
+
+    def reserve(self, tokens: int) -> float:
+        """
+        Reserves one request of about `tokens` tokens and returns the seconds to wait before sending it.
+        """
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+    def settle(self, estimated: int, actual: Optional[int]):
+        """
+        Corrects the token bucket once a response reports the tokens a request really used.
+        """
+        if self.tokens is not None and actual is not None:
+            self.tokens.adjust(estimated - actual)
+
+    def acquire(self, tokens: int) -> float:
+        wait = self.reserve(tokens)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens: int) -> float:
+        wait = self.reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+def retry_after(error: Exception) -> Optional[float]:
+    """
+    Returns the delay, in seconds, that the server asked for in the `Retry-After`
+    (or `retry-after-ms`) header of a failed response, if any.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    milliseconds = headers.get("retry-after-ms")
+    if milliseconds is not None:
+        try:
+            return max(float(milliseconds) / 1000, 0.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter for throttled and transiently failing requests.
+    """
+    def __init__(self, max_retries: int = 6, initial_delay: float = 1.0, max_delay: float = 60.0, jitter: bool = True):
+        """
+        Args:
+            max_retries: Retries after the first attempt before the error is raised.
+            initial_delay: The backoff ceiling of the first retry, in seconds. It doubles with every retry.
+            max_delay: The largest backoff, in seconds.
+            jitter: Whether to draw each delay uniformly below its ceiling, so that
+                    clients throttled together do not retry together.
+        """
+        self.max_retries = max_retries
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    @staticmethod
+    def status(error: Exception) -> Optional[int]:
+        return getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+
+    def is_retryable(self, error: Exception) -> bool:
+        # Imported here so the policy itself does not depend on the openai client.
+        from openai import APIConnectionError
+
+        # APITimeoutError is an APIConnectionError.
+        return isinstance(error, APIConnectionError) or self.status(error) in RETRYABLE_STATUSES
+
+    def is_throttle(self, error: Exception) -> bool:
+        return self.status(error) == 429
+
+    def delay(self, attempt: int, error: Optional[Exception] = None) -> float:
+        """
+        Returns how long to wait before retry number `attempt` (from 0). A
+        `Retry-After` sent by the server takes precedence over the backoff.
+        """
+        requested = retry_after(error) if error is not None else None
+        if requested is not None:
+            return min(requested, self.max_delay)
+        ceiling = min(self.initial_delay * 2 ** attempt, self.max_delay)
+        return random.uniform(0, ceiling) if self.jitter else ceiling
+
+class AdaptiveConcurrency:
+    """
+    Adjusts the number of concurrent requests with additive increase, multiplicative
+    decrease (AIMD), as TCP does with its congestion window.
+
+    Every successful request within the latency target raises the limit by 1/limit,
+    i.e. by about one per limit's worth of requests. A throttled or failed request,
+    or one slower than the target, multiplies the limit by `decrease_factor`. Only
+    requests started after the last decrease can decrease it again, so a burst of
+    errors from one window of requests counts once.
+    """
+    def __init__(self, initial: int = 8, minimum: int = 1, maximum: int = 64, latency_target: Optional[float] = None, decrease_factor: float = 0.5):
+        """
+        Args:
+            initial: The starting limit.
+            minimum: The lowest the limit goes.
+            maximum: The highest the limit goes.
+            latency_target: The request latency, in seconds, above which the endpoint is
+                            considered overloaded. None to react to errors only.
+            decrease_factor: The factor applied to the limit on congestion.
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.last_decrease = float("-inf")
+        self._waiters = []
+
+    async def acquire(self):
+        """
+        Waits for a free slot.
+        """
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.in_flight += 1
+
+    def release(self, started: Optional[float], congested: bool = False):
+        """
+        Frees a slot and adapts the limit to how the request went.
+
+        Args:
+            started: When the request was sent, from `time.perf_counter`. None if it
+                     was never sent, which leaves the limit unchanged.
+            congested: Whether the request was throttled or failed because the endpoint was overloaded.
+        """
+        self.in_flight -= 1
+        if started is None:
+            pass
+        elif congested or (self.latency_target is not None and time.perf_counter() - started > self.latency_target):
+            if started >= self.last_decrease:
+                self.limit = max(self.limit * self.decrease_factor, self.minimum)
+                self.last_decrease = time.perf_counter()
+        else:
+            self.limit = min(self.limit + 1 / self.limit, self.maximum)
+
+        # Wake every waiter; those that still find no free slot wait again.
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiters = []
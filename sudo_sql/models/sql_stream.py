@@ -0,0 +1,119 @@
+import re
+from typing import Optional
+
+# Where SQL starts in free text: a code fence, an upper case SELECT, or a SELECT or
+# WITH opening a line. A lower case "select" within a sentence is more likely prose.
+_FENCE = re.compile(r"```[^\n`]*\n")
+_STATEMENT = re.compile(r"\bSELECT\b|^[ \t]*(?i:select|with)\b", re.MULTILINE)
+
+class SQLStreamParser:
+    """
+    Finds the first complete SQL statement in text that arrives in pieces.
+
+    The statement starts at a code fence or at the first SELECT (or a select or WITH
+    at the start of a line) and is complete at a `;` or at the closing code fence.
+    Semicolons and backticks inside string literals, quoted identifiers and
+    comments do not count. Each character is scanned once, however the text is split.
+
+    Example:
+        parser = SQLStreamParser()
+        for chunk in stream:
+            if parser.feed(chunk):
+                break
+        sql = parser.result()
+    """
+    def __init__(self):
+        self.text = ""
+        self.start: Optional[int] = None
+        self.end: Optional[int] = None
+        self.fenced = False
+        self.done = False
+        self._position = 0
+        # None, or the character closing the literal, identifier or comment being scanned.
+        self._quote: Optional[str] = None
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Adds the next piece of text and returns whether a complete statement has been seen.
+        """
+        if self.done:
+            return True
+        self.text += chunk
+        if self.start is None:
+            self._find_start(final=False)
+        if self.start is not None:
+            self._scan(final=False)
+        return self.done
+
+    def _find_start(self, final: bool):
+        fence = _FENCE.search(self.text)
+        statement = _STATEMENT.search(self.text)
+        if statement is not None and not final and statement.end() == len(self.text):
+            # "SELECT" may still turn out to be "SELECTED".
+            statement = None
+        if fence is not None and (statement is None or fence.start() <= statement.start()):
+            self.start = self._position = fence.end()
+            self.fenced = True
+        elif statement is not None:
+            self.start = self._position = statement.start()
+
+    def _scan(self, final: bool):
+        text = self.text
+        position = self._position
+        while position < len(text):
+            # Markers are up to three characters long; wait for the rest of a split one.
+            if not final and text[position] in "-/*`" and position + 3 > len(text):
+                break
+            char = text[position]
+            if self._quote is not None:
+                if self._quote == "\n" and char == "\n":
+                    self._quote = None
+                elif self._quote == "*/" and text.startswith("*/", position):
+                    self._quote = None
+                    position += 1
+                elif char == self._quote:
+                    self._quote = None
+            elif text.startswith("```", position):
+                if self.fenced:
+                    self._finish(position)
+                    return
+            elif char == ";":
+                self._finish(position)
+                return
+            elif char in "'\"`[":
+                self._quote = "]" if char == "[" else char
+            elif text.startswith("--", position):
+                self._quote = "\n"
+                position += 1
+            elif text.startswith("/*", position):
+                self._quote = "*/"
+                position += 1
+            position += 1
+        self._position = position
+
+    def _finish(self, end: int):
+        self.end = end
+        self.done = True
+
+    def result(self) -> str:
+        """
+        Returns the extracted statement, without its terminating `;`. Call this once
+        the text is complete: an unterminated statement runs to the end of the text,
+        and text without any SQL is returned as is.
+        """
+        if not self.done:
+            if self.start is None:
+                self._find_start(final=True)
+            if self.start is not None:
+                self._scan(final=True)
+        if self.start is None:
+            return self.text.strip()
+        return self.text[self.start:self.end].strip()
+
+def extract_sql(text: str) -> str:
+    """
+    Returns the first SQL statement in a model's complete output.
+    """
+    parser = SQLStreamParser()
+    parser.feed(text)
+    return parser.result()
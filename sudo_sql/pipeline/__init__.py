@@ -1,19 +1,38 @@
 import yaml
+from importlib import import_module
+from typing import Optional
 from .base import BasePipeline
-from .inference import InferencePipeline
-from .sft import SFTPipeline
-from .rl import RLPipeline
 
-def get_pipeline(config_path: str) -> BasePipeline:
+# Pipelines are imported only when selected, so a mode that does not need the
+# training stack (torch, transformers, trl) does not pay for importing it.
+PIPELINES = {
+    "sft": "sudo_sql.pipeline.sft:SFTPipeline",
+    "rl": "sudo_sql.pipeline.rl:RLPipeline",
+    "infer": "sudo_sql.pipeline.inference:InferencePipeline",
+}
+
+def get_pipeline_class(mode: str) -> type[BasePipeline]:
+    if mode not in PIPELINES:
+        raise ValueError(f"Unknown pipeline mode: {mode}")
+    module_name, class_name = PIPELINES[mode].split(":")
+    return getattr(import_module(module_name), class_name)
+
+def _merge_config(config: dict, overrides: dict) -> dict:
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(config.get(key), dict):
+            _merge_config(config[key], value)
+        else:
+            config[key] = value
+    return config
+
+def get_pipeline(config_path: str, overrides: Optional[dict] = None) -> BasePipeline:
+    """
+    Builds the pipeline of a config file. `overrides`, e.g. from command line
+    options, are merged into the config section by section.
+    """
     with open(config_path, 'r') as f:
         config = yaml.safe_load(f)
+    if overrides:
+        _merge_config(config, overrides)
     
-    mode = config.get("mode")
-    if mode == "sft":
-        return SFTPipeline(config)
-    elif mode == "rl":
-        return RLPipeline(config)
-    elif mode == "infer":
-        return InferencePipeline(config)
-    else:
-        raise ValueError(f"Unknown pipeline mode: {mode}")
+    return get_pipeline_class(config.get("mode"))(config)
@@ -1,26 +1,47 @@
 from abc import ABC, abstractmethod
+import os
+import json
+import time
+from functools import cached_property
+from typing import TYPE_CHECKING, Iterable, Optional
 import yaml
-import torch
-from transformers import AutoTokenizer
-from trl import AutoModelForCausalLMWithValueHead
 from sudo_sql.environments.base import BaseEnvironment
-from sudo_sql.data_loaders import get_data_loader
+from sudo_sql.data_loaders import get_data_loader, StreamingDataset
+from sudo_sql.data_loaders.preprocessed import DEFAULT_CACHE_DIR as DEFAULT_DATASET_CACHE_DIR
+from sudo_sql.pipeline.batching import chunked, length_buckets
+from sudo_sql.models.sql_stream import extract_sql
+from sudo_sql.schema_linking import SchemaPruner
+from sudo_sql.telemetry import telemetry
 from sudo_sql.logger_config import logger
 
+if TYPE_CHECKING:
+    import torch
+    from sudo_sql.pipeline.tokenized import TokenizedPrompts
+
 class BasePipeline(ABC):
     """
     The base class for all pipelines.
     """
+    prompt_template = "Given the schema: {schema}, generate the SQL for: {question}"
 
     def __init__(self, config: dict):
         """
         Initializes the pipeline from a configuration dictionary.
         """
         self.config = config
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.model_config = self.config['model']
         self.generation_config = self.config.get('generation', {})
         self.training_config = self.config.get('training', {})
+        self.schema_pruner = self._schema_pruner(self.config.get('schema_pruning', {}))
+
+    @cached_property
+    def device(self) -> "torch.device":
+        """
+        The device models run on. torch is imported on first use, so pipelines
+        that only call remote APIs never load it.
+        """
+        import torch
+        return torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
     @abstractmethod
     def run(self):
@@ -29,17 +50,83 @@ class BasePipeline(ABC):
         """
         pass
 
-    def _load_dataset(self, dataset_name: str, data_path: str, split: str, schema_type: str, use_cache: bool) -> list[dict]:
+    def _load_dataset(self, dataset_name: str, data_path: str, split: str, schema_type: str, use_cache: bool, **loader_options) -> list[dict]:
         """
         Loads a dataset using the data loader factory.
         """
-        loader = get_data_loader(dataset_name, data_path)
+        loader = get_data_loader(dataset_name, data_path, **loader_options)
         return loader.load_data(split, schema_type, use_cache)
 
+    def _stream_dataset(self, dataset_name: str, data_path: str, split: str, schema_type: str, use_cache: bool, **loader_options) -> StreamingDataset:
+        """
+        Opens a dataset for streaming. Items are read lazily and every iteration
+        (e.g. every epoch) streams the split again.
+        """
+        loader = get_data_loader(dataset_name, data_path, **loader_options)
+        return StreamingDataset(loader, split, schema_type, use_cache)
+
+    def _loader_options(self, section: dict) -> dict:
+        """
+        Collects data loader options from a pipeline config section.
+        """
+        schema_cache = section.get('schema_cache', {})
+        dataset_cache = section.get('dataset_cache') or {}
+        return {
+            'num_workers': section.get('schema_workers'),
+            'schema_cache_path': schema_cache.get('path'),
+            'schema_cache_max_bytes': schema_cache.get('max_bytes'),
+            'dataset_cache_dir': dataset_cache.get('path', DEFAULT_DATASET_CACHE_DIR) if dataset_cache.get('enabled', False) else None,
+        }
+
+    def _schema_pruner(self, pruning_config: dict) -> Optional[SchemaPruner]:
+        """
+        Builds the schema pruner when `schema_pruning.enabled` is set.
+        """
+        if not pruning_config.get('enabled', False):
+            return None
+        options = {key: value for key, value in pruning_config.items() if key != 'enabled'}
+        return SchemaPruner(**options)
+
+    def _log_pruning_stats(self):
+        if self.schema_pruner is None or not self.schema_pruner.questions:
+            return
+        stats = self.schema_pruner.stats()
+        logger.info(
+            f"Schema pruning: {stats['schema_tokens_before']} -> {stats['schema_tokens_after']} estimated schema tokens "
+            f"over {stats['questions']} prompts ({stats['reduction']:.1%} fewer)"
+        )
+
+    def _export_telemetry(self, default_summary_path: Optional[str] = None):
+        """
+        Logs the run's telemetry and writes it to `telemetry.summary_path` (or
+        `default_summary_path`) and, if set, `telemetry.prometheus_path`.
+        """
+        telemetry_config = self.config.get('telemetry') or {}
+        summary = telemetry.summary()
+        for name, stats in summary['spans'].items():
+            logger.info(
+                f"{name}: {stats['count']} calls, {stats['total']:.2f}s total, "
+                f"p50 {stats['p50'] * 1000:.1f}ms, p90 {stats['p90'] * 1000:.1f}ms, p99 {stats['p99'] * 1000:.1f}ms"
+            )
+        if summary['counters']:
+            logger.info(f"Counters: {summary['counters']}")
+
+        summary_path = telemetry_config.get('summary_path') or default_summary_path
+        if summary_path:
+            telemetry.write_json(summary_path, summary)
+            logger.info(f"Telemetry summary saved to {summary_path}")
+        prometheus_path = telemetry_config.get('prometheus_path')
+        if prometheus_path:
+            telemetry.write_prometheus(prometheus_path, summary)
+            logger.info(f"Prometheus metrics saved to {prometheus_path}")
+
     def _initialize_trainer(self):
         """
         Initializes the model, tokenizer, and PPO trainer.
         """
+        import torch
+        from transformers import AutoTokenizer
+        from trl import AutoModelForCausalLMWithValueHead
         from verl import PPOTrainer, PPOConfig
 
         model_name = self.model_config['name']
@@ -58,37 +145,139 @@ class BasePipeline(ABC):
             optimizer_class=torch.optim.AdamW,
         )
 
-    def _train_loop(self, ppo_trainer, env: BaseEnvironment, dataset: list[dict]):
+    def _build_prompt(self, item: dict, record_stats: bool = True) -> str:
+        """
+        Builds the prompt of an item. `record_stats` is turned off when the item's
+        prompt has been or will be built elsewhere, so pruning stats count each item once.
+        """
+        with telemetry.span("prompt.build"):
+            schema = item['schema']
+            if self.schema_pruner is not None:
+                schema = self.schema_pruner.prune(item['question'], schema, item.get('db_path'), record_stats=record_stats)
+            return self.prompt_template.format(schema=schema, question=item['question'])
+
+    def _prompt_signature(self) -> str:
+        """
+        Identifies how prompts are built: the template and the schema pruning options.
+        """
+        if self.schema_pruner is None:
+            return self.prompt_template
+        return self.prompt_template + json.dumps(self.schema_pruner.options(), sort_keys=True)
+
+    def _prompt_prefix(self, item: dict) -> str:
+        """
+        Returns the part of the prompt that comes before the question, which is
+        the same for every question about one database.
+        """
+        return self.prompt_template.split("{question}")[0].format(schema=item['schema'])
+
+    def _pretokenize(self, dataset: Iterable[dict], tokenizer) -> Optional["TokenizedPrompts"]:
+        """
+        Returns the memory-mapped token ids of a streamed dataset's prompts, tokenizing
+        the split on first use. Returns None for in-memory datasets or when
+        `generation.pretokenize` is off. Callers use the token ids instead of building
+        the prompts again, so pruning stats are recorded while tokenizing.
+        """
+        if not self.generation_config.get('pretokenize', True) or not isinstance(dataset, StreamingDataset):
+            return None
+        from sudo_sql.pipeline.tokenized import load_tokenized_prompts
+
+        start = time.monotonic()
+        tokens = load_tokenized_prompts(
+            dataset,
+            tokenizer,
+            self._prompt_signature(),
+            self._build_prompt,
+            cache_dir=self.generation_config.get('tokenized_cache_dir'),
+        )
+        logger.info(f"Opened {len(tokens)} tokenized prompts from {tokens.directory} in {time.monotonic() - start:.2f}s")
+        return tokens
+
+    def _train_loop(self, ppo_trainer, env: BaseEnvironment, dataset: Iterable[dict]):
         """
-        Runs a generic training loop.
+        Runs a generic training loop. `dataset` is iterated once per epoch, so it can
+        be a list or a `StreamingDataset`.
+
+        Items are read in windows of `generation.bucket_window` mini-batches and
+        sorted into mini-batches of `ppo.batch_size` prompts of similar length. Each
+        mini-batch is generated, scored with `env.step_batch` and passed to a single
+        `ppo_trainer.step` call.
+
+        Prompts of a `StreamingDataset` are tokenized once and read back from a
+        memory-mapped cache in every epoch (see `_pretokenize`); they are not built
+        again, and the text the trainer steps on is decoded from the cached ids.
         """
+        import torch
+
+        telemetry.reset()
         tokenizer = ppo_trainer.tokenizer
+        with telemetry.span("dataset.pretokenize"):
+            tokens = self._pretokenize(dataset, tokenizer)
         epochs = self.training_config.get('epochs', 1)
         max_length = self.generation_config.get('max_length', 512)
+        batch_size = self.config.get('ppo', {}).get('batch_size', 1)
+        window_size = batch_size * self.generation_config.get('bucket_window', 8)
+        stop_at_sql = self.generation_config.get('stop_at_sql', False)
 
         for epoch in range(epochs):
             logger.info(f"--- Epoch {epoch + 1}/{epochs} ---")
-            for i, item in enumerate(dataset):
-                question = item['question']
-                schema = item['schema']
-                
-                prompt_text = f"Given the schema: {schema}, generate the SQL for: {question}"
-                encoded_prompt = tokenizer.encode(prompt_text, return_tensors="pt").to(self.device)
-
-                generated_tokens = ppo_trainer.generate(
-                    queries=encoded_prompt,
-                    gen_len=max_length,
-                    batch_size=1,
-                )
-                
-                generated_sql = tokenizer.decode(generated_tokens[0], skip_special_tokens=True)
-                observation, reward = env.step(generated_sql)
-
-                stats = ppo_trainer.step(
-                    queries=[prompt_text],
-                    responses=[generated_sql],
-                    scores=[torch.tensor(reward)],
-                )
-
-                if i % 10 == 0:
-                    logger.info(f"Step {i+1}/{len(dataset)} | Reward: {reward:.2f}")
+            step = 0
+            samples = 0
+            start = time.monotonic()
+            for window in chunked(telemetry.iterate(enumerate(dataset), "dataset.next"), window_size):
+                items = [item for _, item in window]
+                prompts = None
+                with telemetry.span("train.tokenize"):
+                    if tokens is not None:
+                        encoded_prompts = [torch.from_numpy(tokens[index].astype("int64")).to(self.device) for index, _ in window]
+                    else:
+                        prompts = [self._build_prompt(item, record_stats=epoch == 0) for item in items]
+                        encoded_prompts = [tokenizer.encode(prompt, return_tensors="pt")[0].to(self.device) for prompt in prompts]
+
+                for bucket in length_buckets([len(ids) for ids in encoded_prompts], batch_size):
+                    with telemetry.span("train.generate"):
+                        generated_tokens = ppo_trainer.generate(
+                            queries=[encoded_prompts[i] for i in bucket],
+                            gen_len=max_length,
+                            batch_size=len(bucket),
+                        )
+                        generated_sql = tokenizer.batch_decode(generated_tokens, skip_special_tokens=True)
+
+                    with telemetry.span("train.reward"):
+                        # The policy is updated on the full responses; only the reward looks at the extracted SQL.
+                        candidates = [extract_sql(sql) for sql in generated_sql] if stop_at_sql else generated_sql
+                        observations, rewards = env.step_batch([
+                            (sql, items[i].get('db_path'), items[i].get('sql') or None)
+                            for i, sql in zip(bucket, candidates)
+                        ])
+
+                    with telemetry.span("train.ppo_step"):
+                        if prompts is not None:
+                            queries = [prompts[i] for i in bucket]
+                        else:
+                            queries = tokenizer.batch_decode([encoded_prompts[i] for i in bucket], skip_special_tokens=True)
+                        stats = ppo_trainer.step(
+                            queries=queries,
+                            responses=generated_sql,
+                            scores=[torch.tensor(reward) for reward in rewards],
+                        )
+
+                    step += 1
+                    samples += len(bucket)
+                    telemetry.count("train.steps")
+                    telemetry.count("train.samples", len(bucket))
+                    telemetry.count("tokens.prompt", sum(len(encoded_prompts[i]) for i in bucket))
+                    if step % 10 == 1:
+                        elapsed = time.monotonic() - start
+                        logger.info(
+                            f"Step {step} | Samples: {samples} | Mean reward: {sum(rewards) / len(rewards):.2f} | "
+                            f"{step / elapsed:.2f} steps/s, {samples / elapsed:.1f} samples/s"
+                        )
+
+        self._log_pruning_stats()
+        self._export_telemetry(self._default_telemetry_path())
+
+    def _default_telemetry_path(self) -> Optional[str]:
+        # Training runs keep their telemetry next to the saved model.
+        output_dir = self.training_config.get('output_dir')
+        return os.path.join(output_dir, "telemetry.json") if output_dir else None
@@ -0,0 +1,94 @@
+from itertools import islice
+from typing import Iterable, Iterator, Sequence, TypeVar
+
+T = TypeVar("T")
+
+def chunked(iterable: Iterable[T], size: int) -> Iterator[list[T]]:
+    """
+    Splits an iterable into lists of at most `size` elements without materializing it.
+    """
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+def length_buckets(lengths: Sequence[int], batch_size: int) -> list[list[int]]:
+    """
+    Groups item indices into batches of similar length to keep padding low.
+
+    Args:
+        lengths: The (token) length of each item.
+        batch_size: The maximum number of items per batch.
+
+    Returns:
+        A list of batches, each one a list of indices into `lengths`.
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+def generate_batched(model, tokenizer, prompts: Sequence[str | Sequence[int]], batch_size: int, device, stop_at_sql: bool = False, candidates: int = 1, **generate_kwargs) -> Iterator[tuple[int, str | list[str]]]:
+    """
+    Generates completions for `prompts` in left-padded, length-bucketed batches.
+
+    Only the newly generated tokens are decoded, so the prompt is not echoed back.
+
+    Args:
+        model: A model exposing the Hugging Face `generate` API.
+        tokenizer: The tokenizer matching `model`. Its `pad_token` must be set.
+        prompts: The prompts to generate completions for, as text or as token ids
+                 that were already encoded with `tokenizer`.
+        batch_size: The maximum number of prompts per `generate` call.
+        device: The device the input tensors are moved to.
+        stop_at_sql: Whether to stop each sequence once it holds a complete SQL
+                     statement and to yield the extracted statement.
+        candidates: When above 1, the number of sequences sampled per prompt with
+                    `num_return_sequences`. Sampling has to be enabled in `generate_kwargs`.
+        **generate_kwargs: Extra arguments forwarded to `model.generate`.
+
+    Yields:
+        Tuples of (index of the prompt in `prompts`, generated text), one batch at a
+        time, or of (index, list of candidates) when `candidates` is above 1.
+    """
+    if candidates > 1:
+        generate_kwargs["num_return_sequences"] = candidates
+    if stop_at_sql:
+        from sudo_sql.pipeline.stopping import sql_stopping_criteria
+        from sudo_sql.models.sql_stream import extract_sql
+
+    encoded = [tokenizer.encode(prompt) if isinstance(prompt, str) else list(prompt) for prompt in prompts]
+
+    # Decoder-only models continue from the last position, so padding has to go on the left.
+    padding_side = tokenizer.padding_side
+    tokenizer.padding_side = "left"
+    try:
+        for bucket in length_buckets([len(ids) for ids in encoded], batch_size):
+            batch = tokenizer.pad({"input_ids": [encoded[i] for i in bucket]}, padding=True, return_tensors="pt")
+            input_ids = batch["input_ids"].to(device)
+            attention_mask = batch["attention_mask"].to(device)
+
+            stop_kwargs = {}
+            if stop_at_sql:
+                stop_kwargs["stopping_criteria"], criteria = sql_stopping_criteria(tokenizer, input_ids.shape[1], generate_kwargs.get("max_new_tokens", 0))
+            generated_tokens = model.generate(
+                input_ids,
+                attention_mask=attention_mask,
+                pad_token_id=tokenizer.pad_token_id,
+                **stop_kwargs,
+                **generate_kwargs,
+            )
+            completions = tokenizer.batch_decode(generated_tokens[:, input_ids.shape[1]:], skip_special_tokens=True)
+            if stop_at_sql:
+                criteria.record()
+                completions = [extract_sql(completion) for completion in completions]
+
+            completions = [completion.strip() for completion in completions]
+            if candidates > 1:
+                # The sequences of a prompt are consecutive rows of the output.
+                for position, index in enumerate(bucket):
+                    yield index, completions[position * candidates:(position + 1) * candidates]
+            else:
+                yield from zip(bucket, completions)
+    finally:
+        tokenizer.padding_side = padding_side
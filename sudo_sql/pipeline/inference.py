@@ -1,117 +1,337 @@
 import os
-import json
+import asyncio
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, Optional
 from datetime import datetime
 from .base import BasePipeline
-from ..models.openai import OpenAIProvider
+from .batching import chunked, generate_batched
+from .sharding import shard_filter, shard_suffix, validate_shard
+from ..models import get_provider_class
+from ..models.cached import CachedProvider
+from ..results import ResultsStore, make_item_id
 from ..logger_config import logger
-from trl import AutoModelForCausalLMWithValueHead
-from transformers import AutoTokenizer
+from ..telemetry import telemetry
+
+if TYPE_CHECKING:
+    from .voting import CandidateVoter
 
 class InferencePipeline(BasePipeline):
     def run(self):
         logger.info("--- Running Inference ---")
+        telemetry.reset()
         infer_config = self.config['inference']
         output_config = infer_config.get('output', {})
         save_mode = output_config.get('save_mode', 'overwrite')
 
-        output_file = None
-        processed_questions = set()
-        if output_config.get('save_path'):
-            model_name = self.model_config.get("name", "unknown_model").replace("/", "_")
-            
-            if save_mode == 'resume':
-                filename = f"{infer_config['dataset_name']}_{infer_config['split']}_{model_name}.jsonl"
-            else:
-                timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
-                filename = f"{infer_config['dataset_name']}_{infer_config['split']}_{model_name}_{timestamp}.jsonl"
-            
-            output_file = os.path.join(output_config['save_path'], filename)
-            
-            if save_mode == 'overwrite' and os.path.exists(output_file):
-                os.remove(output_file)
-            
-            if save_mode == 'resume' and os.path.exists(output_file):
-                logger.info(f"Resuming inference run. Loading previously generated results from {output_file}...")
-                with open(output_file, 'r') as f:
-                    for line in f:
-                        try:
-                            data = json.loads(line)
-                            processed_questions.add(data['question'])
-                        except json.JSONDecodeError:
-                            logger.warning(f"Could not parse line in results file: {line}")
-                logger.info(f"Found {len(processed_questions)} previously completed items. Skipping...")
-
-        dataset = self._load_dataset(
+        store = self._open_results_store(infer_config, output_config, save_mode)
+        try:
+            self._generate(infer_config, store, resume=save_mode == 'resume')
+        finally:
+            if store is not None:
+                store.close()
+                logger.info(f"Results saved to {store.path}")
+        self._log_pruning_stats()
+        self._export_telemetry(self._telemetry_path(store))
+        logger.info("--- Inference complete ---")
+
+    def _telemetry_path(self, store: ResultsStore | None) -> str | None:
+        if store is None:
+            return None
+        base_path = store.path[:-len(".jsonl")] if store.path.endswith(".jsonl") else store.path
+        return f"{base_path}.telemetry.json"
+
+    def _open_results_store(self, infer_config: dict, output_config: dict, save_mode: str) -> ResultsStore | None:
+        if not output_config.get('save_path'):
+            return None
+
+        model_name = self.model_config.get("name", "unknown_model").replace("/", "_")
+        shard_index, num_shards = self._shard(infer_config)
+        # Every shard writes (and resumes) its own file; `main.py merge` combines them.
+        suffix = shard_suffix(shard_index, num_shards) if num_shards > 1 else ""
+
+        if save_mode == 'resume':
+            filename = f"{infer_config['dataset_name']}_{infer_config['split']}_{model_name}{suffix}.jsonl"
+        else:
+            timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            filename = f"{infer_config['dataset_name']}_{infer_config['split']}_{model_name}_{timestamp}{suffix}.jsonl"
+
+        output_file = os.path.join(output_config['save_path'], filename)
+        store = ResultsStore(
+            output_file,
+            flush_every=output_config.get('flush_every', 32),
+            flush_interval=output_config.get('flush_interval', 5.0),
+        )
+
+        if save_mode == 'resume' and os.path.exists(output_file):
+            logger.info(f"Resuming inference run. Loading previously generated results from {output_file}...")
+            store.open(resume=True)
+            logger.info(f"Found {len(store)} previously completed items. Skipping...")
+        else:
+            store.open(resume=save_mode == 'append')
+        return store
+
+    def _generate(self, infer_config: dict, store: ResultsStore | None, resume: bool):
+        dataset = self._stream_dataset(
             infer_config['dataset_name'], 
             infer_config['data_path'], 
             infer_config['split'], 
             infer_config['schema_type'], 
-            infer_config.get('use_cache', True)
+            infer_config.get('use_cache', True),
+            **self._loader_options(infer_config)
         )
 
+        shard_index, num_shards = self._shard(infer_config)
+        in_shard = shard_filter(dataset, shard_index, num_shards, (infer_config.get('shard') or {}).get('balance', 'count'))
+        if in_shard is not None:
+            logger.info(f"Running shard {shard_index + 1} of {num_shards}.")
+
         provider_type = self.model_config.get("provider")
         model_name = self.model_config.get("name")
 
         if provider_type == "openai":
             logger.info(f"Using OpenAI provider with model: {model_name}")
             base_url = self.model_config.get("base_url")
-            provider = OpenAIProvider(model=model_name, base_url=base_url)
-
-            for item in dataset:
-                if item['question'] in processed_questions:
-                    logger.debug(f"Skipping already processed question: {item['question']}")
-                    continue
-
-                prompt_text = f"Given the schema: {item['schema']}, generate the SQL for: {item['question']}"
-                logger.debug(f"Generating SQL for question: {item['question']}")
-                generated_sql = provider.generate(prompt_text)
-                logger.info(f"Question: {item['question']}")
-                logger.info(f"Generated SQL: {generated_sql}")
-                logger.info(f"Ground Truth SQL: {item['sql']}")
-
-                if output_file:
-                    result = {
-                        "db_id": item['db_id'],
-                        "question": item['question'],
-                        "generated_sql": generated_sql,
-                        "ground_truth_sql": item['sql']
-                    }
-                    with open(output_file, 'a') as f:
-                        f.write(json.dumps(result) + '\n')
+            provider_class = get_provider_class(provider_type)
+            provider = provider_class(
+                model=model_name,
+                base_url=base_url,
+                params=self.model_config.get("params"),
+                rate_limit=self.model_config.get("rate_limit"),
+                retry=self.model_config.get("retry"),
+                adaptive_concurrency=self.model_config.get("adaptive_concurrency"),
+                connection_pool=self.model_config.get("connection_pool"),
+                stream=self.model_config.get("stream", False),
+            )
+            provider = self._with_response_cache(provider, infer_config.get('response_cache', {}))
+
+            pending = self._pending_items(dataset, store if resume else None, in_shard)
+            max_concurrency = infer_config.get('max_concurrency', 1)
+            voter = self._candidate_voter(infer_config.get('voting') or {})
+            if voter is not None and self.model_config.get("params", {}).get("temperature", 1.0) == 0:
+                logger.warning("Voting samples candidates at temperature 0, so they will mostly agree; raise model.params.temperature.")
+            try:
+                if max_concurrency > 1:
+                    logger.info(f"Sending up to {max_concurrency} concurrent requests to the endpoint.")
+                    asyncio.run(self._run_concurrent(provider, pending, max_concurrency, store, voter))
+                else:
+                    for _, item_id, item in pending:
+                        logger.debug(f"Generating SQL for question: {item['question']}")
+                        if voter is None:
+                            self._record_result(item_id, item, provider.generate(self._build_prompt(item)), store)
+                        else:
+                            candidates = provider.generate_candidates(self._build_prompt(item), voter.candidates)
+                            generated_sql, vote = self._vote(voter, item, candidates)
+                            self._record_result(item_id, item, generated_sql, store, vote)
+            finally:
+                if voter is not None:
+                    voter.close()
+                if isinstance(provider, CachedProvider):
+                    logger.info(f"Response cache: {provider.stats()}")
+                    provider.close()
         else:
+            # The training stack is only imported for local models.
+            import torch
+            from trl import AutoModelForCausalLMWithValueHead
+            from transformers import AutoTokenizer
+
             logger.info(f"Using local Hugging Face model: {model_name}")
+            if (infer_config.get('response_cache') or {}).get('enabled', False):
+                logger.warning("The response cache only covers the openai provider; local generation is not cached.")
             device_map = self.model_config.get('device_map', self.device)
             model = AutoModelForCausalLMWithValueHead.from_pretrained(model_name, torch_dtype=torch.bfloat16, device_map=device_map)
             tokenizer = AutoTokenizer.from_pretrained(model_name)
             tokenizer.pad_token = tokenizer.eos_token
 
-            for item in dataset:
-                if item['question'] in processed_questions:
-                    logger.debug(f"Skipping already processed question: {item['question']}")
-                    continue
-
-                prompt_text = f"Given the schema: {item['schema']}, generate the SQL for: {item['question']}"
-                logger.debug(f"Generating SQL for question: {item['question']}")
-                encoded_prompt = tokenizer.encode(prompt_text, return_tensors="pt").to(self.device)
-                generated_tokens = model.generate(
-                    encoded_prompt,
-                    max_new_tokens=self.generation_config.get('max_length', 128),
-                )
-                generated_sql = tokenizer.decode(generated_tokens[0], skip_special_tokens=True)
-                logger.info(f"Question: {item['question']}")
-                logger.info(f"Generated SQL: {generated_sql}")
-                logger.info(f"Ground Truth SQL: {item['sql']}")
-
-                if output_file:
-                    result = {
-                        "db_id": item['db_id'],
-                        "question": item['question'],
-                        "generated_sql": generated_sql,
-                        "ground_truth_sql": item['sql']
-                    }
-                    with open(output_file, 'a') as f:
-                        f.write(json.dumps(result) + '\n')
-
-        if output_file:
-            logger.info(f"Results saved to {output_file}")
-        logger.info("--- Inference complete ---")
+            tokens = self._pretokenize(dataset, tokenizer)
+            pending = self._pending_items(dataset, store if resume else None, in_shard)
+            batch_size = self.generation_config.get('batch_size', 1)
+            logger.info(f"Generating with batch size {batch_size}.")
+            # Length bucketing happens within windows of several batches, so the split
+            # can be streamed instead of being sorted as a whole.
+            window_size = batch_size * self.generation_config.get('bucket_window', 8)
+            voter = self._candidate_voter(infer_config.get('voting') or {})
+            if self.generation_config.get('prefix_cache', False):
+                if voter is None:
+                    self._generate_with_prefix_cache(model, tokenizer, pending, tokens, batch_size, window_size, store)
+                    return
+                logger.warning("The prefix cache does not sample several candidates; generating without it.")
+
+            sampling = {}
+            if voter is not None:
+                sampling = {"candidates": voter.candidates, "do_sample": True, "temperature": self.generation_config.get('temperature', 0.7)}
+            try:
+                for window in chunked(pending, window_size):
+                    prompts = [self._build_prompt(item) if tokens is None else tokens[index].tolist() for index, _, item in window]
+                    with telemetry.span("model.generate_window"):
+                        completions = list(generate_batched(
+                            model,
+                            tokenizer,
+                            prompts,
+                            batch_size=batch_size,
+                            device=self.device,
+                            stop_at_sql=self.generation_config.get('stop_at_sql', False),
+                            max_new_tokens=self.generation_config.get('max_length', 128),
+                            **sampling,
+                        ))
+                    for position, generated in completions:
+                        _, item_id, item = window[position]
+                        if voter is None:
+                            self._record_result(item_id, item, generated, store)
+                        else:
+                            generated_sql, vote = self._vote(voter, item, generated)
+                            self._record_result(item_id, item, generated_sql, store, vote)
+            finally:
+                if voter is not None:
+                    voter.close()
+
+    def _with_response_cache(self, provider, cache_config: dict):
+        """
+        Wraps `provider` with a disk-backed response cache when `response_cache.enabled` is set.
+        """
+        if not cache_config.get('enabled', False):
+            return provider
+        cached = CachedProvider(provider, path=cache_config.get('path'), max_bytes=cache_config.get('max_bytes'))
+        if not cached.enabled:
+            logger.warning("Sampling is not deterministic (set model.params.temperature to 0); the response cache is bypassed.")
+        return cached
+
+    def _generate_with_prefix_cache(self, model, tokenizer, pending: Iterable[tuple[int, str, dict]], tokens, batch_size: int, window_size: int, store: ResultsStore | None):
+        """
+        Generates with a local model, prefilling each database's schema prefix once.
+
+        Items of a window are grouped by db_id and every group is generated from the
+        `past_key_values` of its shared prompt prefix. Datasets ordered by database,
+        like Spider and BIRD, also reuse the prefix across windows.
+        """
+        if self.schema_pruner is not None:
+            logger.warning("Schema pruning gives every question its own schema, so the prefix cache is rarely reused.")
+        from .prefix_cache import PrefixCachedGenerator
+
+        generator = PrefixCachedGenerator(
+            model,
+            tokenizer,
+            self.device,
+            batch_size=batch_size,
+            stop_at_sql=self.generation_config.get('stop_at_sql', False),
+            max_new_tokens=self.generation_config.get('max_length', 128),
+        )
+        prefix_text = prefix_ids = None
+        for window in chunked(pending, window_size):
+            groups = {}
+            for entry in window:
+                groups.setdefault(entry[2]['db_id'], []).append(entry)
+
+            for entries in groups.values():
+                text = self._prompt_prefix(entries[0][2])
+                if text != prefix_text:
+                    prefix_text, prefix_ids = text, tokenizer.encode(text)
+                prompts = [
+                    tokenizer.encode(self._build_prompt(item)) if tokens is None else tokens[index].tolist()
+                    for index, _, item in entries
+                ]
+                with telemetry.span("model.generate_group"):
+                    completions = list(generator.generate(prefix_ids, prompts))
+                for position, generated_sql in completions:
+                    _, item_id, item = entries[position]
+                    self._record_result(item_id, item, generated_sql, store)
+
+        logger.info(f"Prefix cache: {generator.prefills} schema prefills, {generator.cached_tokens} prompt tokens reused.")
+
+    def _shard(self, infer_config: dict) -> tuple[int, int]:
+        """
+        Returns (shard index, number of shards) from `inference.shard`.
+        """
+        shard_config = infer_config.get('shard') or {}
+        shard_index, num_shards = shard_config.get('index', 0), shard_config.get('num_shards', 1)
+        validate_shard(shard_index, num_shards)
+        return shard_index, num_shards
+
+    def _pending_items(self, dataset: Iterable[dict], store: ResultsStore | None, in_shard: Optional[Callable[[int], bool]] = None) -> Iterator[tuple[int, str, dict]]:
+        """
+        Yields (index, item_id, item) for every item of this shard, dropping items
+        that already have a result in `store`. Indexes are positions in the whole
+        split, so item ids are the same however the split is sharded.
+        """
+        for index, item in enumerate(telemetry.iterate(dataset, "dataset.next")):
+            if in_shard is not None and not in_shard(index):
+                continue
+            item_id = make_item_id(item['db_id'], item['question'], index)
+            if store is not None and store.is_completed(item_id, item['db_id'], item['question']):
+                logger.debug(f"Skipping already processed question: {item['question']}")
+                continue
+            yield index, item_id, item
+
+    def _candidate_voter(self, voting_config: dict) -> Optional['CandidateVoter']:
+        """
+        Builds the voter selecting among sampled candidates, or None unless
+        `inference.voting.candidates` is above 1.
+        """
+        candidates = voting_config.get('candidates', 1)
+        if candidates <= 1:
+            return None
+        from .voting import CandidateVoter
+        from ..database import get_executor
+
+        execution = {
+            "timeout": voting_config.get('timeout', 10),
+            "max_rows": voting_config.get('max_rows', 10000),
+            "replica_bytes": voting_config.get('replica_bytes'),
+        }
+        logger.info(f"Sampling {candidates} candidates per question and voting on their execution results.")
+        return CandidateVoter(get_executor(execution), max_workers=voting_config.get('max_workers'), candidates=candidates)
+
+    def _vote(self, voter: 'CandidateVoter', item: dict, candidates: list[str]) -> tuple[str, dict]:
+        """
+        Returns the candidate selected for `item` and the vote counts to store with it.
+        """
+        vote = voter.select(candidates, item.get('db_path'))
+        logger.debug(f"Vote: {vote.votes} of {vote.candidates} candidates, {vote.distinct} distinct, {vote.executed} executed.")
+        return vote.sql, {"votes": vote.votes, "candidates": vote.candidates, "distinct_candidates": vote.distinct}
+
+    def _record_result(self, item_id: str, item: dict, generated_sql: str, store: ResultsStore | None, extra: Optional[dict] = None):
+        """
+        Logs a generated result and writes it to the results store, if one is configured.
+        Fields in `extra` are added to the stored record.
+        """
+        logger.info(f"Question: {item['question']}")
+        logger.info(f"Generated SQL: {generated_sql}")
+        logger.info(f"Ground Truth SQL: {item['sql']}")
+
+        telemetry.count("items.completed")
+        if store is not None:
+            with telemetry.span("results.write"):
+                store.write({
+                    "item_id": item_id,
+                    "db_id": item['db_id'],
+                    "question": item['question'],
+                    "generated_sql": generated_sql,
+                    "ground_truth_sql": item['sql'],
+                    "db_path": item.get('db_path'),
+                    "difficulty": item.get('difficulty'),
+                    **(extra or {}),
+                })
+
+    async def _run_concurrent(self, provider, items: Iterable[tuple[int, str, dict]], max_concurrency: int, store: ResultsStore | None, voter: Optional['CandidateVoter'] = None):
+        """
+        Generates SQL for `items` with a bounded number of requests in flight,
+        recording each result as soon as it completes. With a `voter`, candidates
+        are executed in a thread so requests keep streaming in meanwhile.
+        """
+        in_flight = {}
+
+        def prompts():
+            # Items are pulled lazily by the provider; only those in flight are kept around.
+            for index, (_, item_id, item) in enumerate(items):
+                in_flight[index] = (item_id, item)
+                yield self._build_prompt(item)
+
+        try:
+            candidates = voter.candidates if voter is not None else 1
+            async for index, generated in provider.generate_many(prompts(), max_concurrency=max_concurrency, candidates=candidates):
+                item_id, item = in_flight.pop(index)
+                if voter is None:
+                    self._record_result(item_id, item, generated, store)
+                else:
+                    generated_sql, vote = await asyncio.to_thread(self._vote, voter, item, generated)
+                    self._record_result(item_id, item, generated_sql, store, vote)
+        finally:
+            await provider.aclose()
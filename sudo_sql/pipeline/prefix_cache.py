@@ -0,0 +1,131 @@
+import copy
+from collections import defaultdict
+from typing import Iterator, Sequence
+import torch
+from transformers import DynamicCache
+from .batching import chunked
+from .stopping import sql_stopping_criteria
+from ..models.sql_stream import extract_sql
+
+def common_prefix_length(a: Sequence[int], b: Sequence[int]) -> int:
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+class PrefixCachedGenerator:
+    """
+    Generates completions for prompts that share a long prefix, such as all the
+    questions asked about one database schema.
+
+    The prefix is run through the model once and its `past_key_values` are kept.
+    Each prompt then only prefills the tokens after the shared prefix. The last
+    prefix is kept across calls, so consecutive groups over the same schema reuse it.
+
+    Prompts are passed as token ids of the full prompt. A tokenizer may merge the
+    last prefix token with the first token of the suffix, so the cache is cropped
+    to the tokens a prompt actually shares with the prefix.
+
+    Prompts sharing as many prefix tokens are batched together. Their suffixes are
+    padded on the left, between the cached prefix and the suffix, and masked out:
+    `generate` derives position ids from the attention mask, so every suffix
+    continues right after the prefix.
+    """
+    def __init__(self, model, tokenizer, device, batch_size: int = 1, stop_at_sql: bool = False, **generate_kwargs):
+        """
+        Args:
+            model: A model exposing the Hugging Face `generate` API. A TRL value-head
+                   wrapper is unwrapped to its `pretrained_model`.
+            tokenizer: The tokenizer matching `model`. Its `pad_token_id` must be set.
+            device: The device the input tensors are moved to.
+            batch_size: The maximum number of prompts per `generate` call. Suffixes of
+                        similar length are batched together to keep padding low.
+            stop_at_sql: Whether to stop each sequence once it holds a complete SQL
+                         statement and to yield the extracted statement.
+            **generate_kwargs: Extra arguments forwarded to `model.generate`.
+        """
+        self.model = getattr(model, "pretrained_model", model)
+        self.tokenizer = tokenizer
+        self.device = device
+        self.batch_size = batch_size
+        self.stop_at_sql = stop_at_sql
+        self.generate_kwargs = generate_kwargs
+        self.prefix_ids = None
+        self.prefix_cache = None
+        self.prefills = 0
+        self.cached_tokens = 0
+
+    def _prefill(self, prefix_ids: list[int]):
+        if prefix_ids == self.prefix_ids:
+            return
+        with torch.no_grad():
+            output = self.model(input_ids=torch.tensor([prefix_ids], device=self.device), past_key_values=DynamicCache(), use_cache=True)
+        self.prefix_ids = prefix_ids
+        self.prefix_cache = output.past_key_values
+        self.prefills += 1
+
+    def _cache_for(self, shared: int, batch_size: int):
+        cache = copy.deepcopy(self.prefix_cache)
+        if shared < len(self.prefix_ids):
+            cache.crop(shared)
+        if batch_size > 1:
+            cache.batch_repeat_interleave(batch_size)
+        return cache
+
+    def generate(self, prefix_ids: Sequence[int], prompts: Sequence[Sequence[int]]) -> Iterator[tuple[int, str]]:
+        """
+        Generates a completion for each prompt, reusing the cached `prefix_ids`.
+
+        Args:
+            prefix_ids: The token ids of the shared prefix.
+            prompts: The token ids of each full prompt, prefix included.
+
+        Yields:
+            Tuples of (index of the prompt in `prompts`, generated text).
+        """
+        prefix_ids = list(prefix_ids)
+        self._prefill(prefix_ids)
+
+        # Prompts sharing as many prefix tokens reuse the same cropped cache.
+        groups = defaultdict(list)
+        for index, ids in enumerate(prompts):
+            ids = list(ids)
+            # At least one token has to be left for `generate` to prefill.
+            shared = min(common_prefix_length(prefix_ids, ids), len(ids) - 1)
+            groups[shared].append((index, ids))
+
+        pad_token_id = self.tokenizer.pad_token_id
+        for shared, entries in groups.items():
+            # Longest suffixes first, so each batch pads its suffixes as little as possible.
+            entries.sort(key=lambda entry: len(entry[1]), reverse=True)
+            for batch in chunked(entries, self.batch_size):
+                width = len(batch[0][1])
+                rows, masks = [], []
+                for _, ids in batch:
+                    padding = width - len(ids)
+                    rows.append(ids[:shared] + [pad_token_id] * padding + ids[shared:])
+                    masks.append([1] * shared + [0] * padding + [1] * (len(ids) - shared))
+                input_ids = torch.tensor(rows, device=self.device)
+                attention_mask = torch.tensor(masks, device=self.device)
+                cache = self._cache_for(shared, len(batch)) if shared > 0 else None
+                stop_kwargs = {}
+                if self.stop_at_sql:
+                    stop_kwargs["stopping_criteria"], criteria = sql_stopping_criteria(self.tokenizer, input_ids.shape[1], self.generate_kwargs.get("max_new_tokens", 0))
+                with torch.no_grad():
+                    generated_tokens = self.model.generate(
+                        input_ids,
+                        attention_mask=attention_mask,
+                        past_key_values=cache,
+                        pad_token_id=pad_token_id,
+                        **stop_kwargs,
+                        **self.generate_kwargs,
+                    )
+                self.cached_tokens += shared * len(batch)
+                completions = self.tokenizer.batch_decode(generated_tokens[:, input_ids.shape[1]:], skip_special_tokens=True)
+                if self.stop_at_sql:
+                    criteria.record()
+                    completions = [extract_sql(completion) for completion in completions]
+                for (index, _), completion in zip(batch, completions):
+                    yield index, completion.strip()
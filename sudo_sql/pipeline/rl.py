@@ -1,15 +1,38 @@
 from .base import BasePipeline
 from ..environments.sql_execution import SQLExecutionEnvironment
+from ..database import get_executor
 from ..logger_config import logger
 
 class RLPipeline(BasePipeline):
     def run(self):
         logger.info("--- Running RL ---")
         rl_config = self.config['rl']
-        env = SQLExecutionEnvironment(db_path=rl_config['db_path'])
+        execution_config = rl_config.get('execution', {})
+        env = SQLExecutionEnvironment(
+            db_path=rl_config.get('db_path'),
+            executor=get_executor({'max_rows': 1000, **execution_config}),
+            timeout_reward=rl_config.get('timeout_reward', -1.0),
+            max_workers=rl_config.get('max_workers'),
+        )
         ppo_trainer = self._initialize_trainer()
-        rl_dataset = [{'question': rl_config['question'], 'schema': rl_config['schema'], 'sql': ''}] * self.training_config.get('steps', 100)
-        self._train_loop(ppo_trainer, env, rl_dataset)
+        if 'dataset_name' in rl_config:
+            # Train over a full split: every item carries its own database and ground truth.
+            rl_dataset = self._stream_dataset(
+                rl_config['dataset_name'],
+                rl_config['data_path'],
+                rl_config.get('split', 'train'),
+                rl_config['schema_type'],
+                rl_config.get('use_cache', True),
+                **self._loader_options(rl_config)
+            )
+        else:
+            rl_dataset = [{'question': rl_config['question'], 'schema': rl_config['schema'], 'sql': ''}] * self.training_config.get('steps', 100)
+        try:
+            self._train_loop(ppo_trainer, env, rl_dataset)
+        finally:
+            env.close()
+            env.executor.close()
+        logger.info(f"{env.timeouts} generated queries hit the execution time limit.")
         logger.info("--- RL complete ---")
         output_dir = self.training_config.get('output_dir')
         if output_dir:
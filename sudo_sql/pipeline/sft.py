@@ -6,14 +6,15 @@ class SFTPipeline(BasePipeline):
     def run(self):
         logger.info("--- Running SFT ---")
         sft_config = self.config['sft']
-        dataset = self._load_dataset(
+        dataset = self._stream_dataset(
             sft_config['dataset_name'], 
             sft_config['data_path'], 
             'train', 
             sft_config['schema_type'], 
-            sft_config.get('use_cache', True)
+            sft_config.get('use_cache', True),
+            **self._loader_options(sft_config)
         )
-        env = SFTEnvironment(dataset)
+        env = SFTEnvironment()
         ppo_trainer = self._initialize_trainer()
         self._train_loop(ppo_trainer, env, dataset)
         logger.info("--- SFT complete ---")
@@ -0,0 +1,59 @@
+import heapq
+from typing import Callable, Iterable, Optional
+
+def validate_shard(shard_index: int, num_shards: int):
+    if num_shards < 1:
+        raise ValueError(f"num_shards must be at least 1, got {num_shards}.")
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"shard_index must be in [0, {num_shards}), got {shard_index}.")
+
+def balance_by_length(lengths: list[int], num_shards: int) -> list[int]:
+    """
+    Assigns items to shards so that every shard gets about the same total length.
+
+    Items are placed longest first on the shard with the least total length so far
+    (ties go to the lower shard and the earlier item), so the assignment only
+    depends on the lengths and is the same in every worker.
+
+    Returns:
+        The shard of every item.
+    """
+    shards = [0] * len(lengths)
+    loads = [(0, shard) for shard in range(num_shards)]
+    for index in sorted(range(len(lengths)), key=lambda i: (-lengths[i], i)):
+        load, shard = heapq.heappop(loads)
+        shards[index] = shard
+        heapq.heappush(loads, (load + lengths[index], shard))
+    return shards
+
+def estimated_prompt_length(item: dict) -> int:
+    """
+    A cheap stand-in for the prompt length of an item: the characters of its schema and question.
+    """
+    return len(item.get('schema') or "") + len(item['question'])
+
+def shard_filter(dataset: Iterable[dict], shard_index: int, num_shards: int, balance: str = "count") -> Optional[Callable[[int], bool]]:
+    """
+    Builds a predicate telling whether the item at a given position of `dataset`
+    belongs to shard `shard_index`. Returns None when there is a single shard.
+
+    Args:
+        dataset: The split, in its stable order. Only read when `balance` is "length".
+        shard_index: The shard this worker runs, from 0.
+        num_shards: The total number of shards.
+        balance: "count" deals items round-robin, so shards get the same number of
+                 items without reading the split. "length" reads the split once and
+                 balances the estimated prompt length of the shards instead.
+    """
+    validate_shard(shard_index, num_shards)
+    if num_shards == 1:
+        return None
+    if balance == "count":
+        return lambda index: index % num_shards == shard_index
+    if balance == "length":
+        shards = balance_by_length([estimated_prompt_length(item) for item in dataset], num_shards)
+        return lambda index: shards[index] == shard_index
+    raise ValueError(f"Unknown shard balance: {balance}")
+
+def shard_suffix(shard_index: int, num_shards: int) -> str:
+    return f".shard-{shard_index:03d}-of-{num_shards:03d}"
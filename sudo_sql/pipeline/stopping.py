@@ -0,0 +1,70 @@
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+from sudo_sql.models.sql_stream import SQLStreamParser
+from sudo_sql.telemetry import telemetry
+
+class SQLStoppingCriteria(StoppingCriteria):
+    """
+    Stops each sequence of a `generate` batch once it holds a complete SQL statement.
+
+    Every sequence has its own `SQLStreamParser`, fed with the text decoded since the
+    previous step. Finished sequences are reported individually, so `generate` pads
+    them while the rest of the batch carries on, and ends as soon as all are done.
+    """
+    def __init__(self, tokenizer, prompt_length: int, max_new_tokens: int):
+        """
+        Args:
+            tokenizer: The tokenizer used to decode the generated tokens.
+            prompt_length: The (padded) length of the prompts in `input_ids`.
+            max_new_tokens: The generation budget, used to bound the tokens saved.
+        """
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.max_new_tokens = max_new_tokens
+        self.parsers = []
+        self.texts = []
+        self.stopped_at = []
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        if not self.parsers:
+            self.parsers = [SQLStreamParser() for _ in range(input_ids.shape[0])]
+            self.texts = [""] * input_ids.shape[0]
+            self.stopped_at = [None] * input_ids.shape[0]
+
+        generated = input_ids.shape[1] - self.prompt_length
+        done = []
+        for row, parser in enumerate(self.parsers):
+            if not parser.done:
+                text = self.tokenizer.decode(input_ids[row, self.prompt_length:], skip_special_tokens=True)
+                if text.startswith(self.texts[row]):
+                    parser.feed(text[len(self.texts[row]):])
+                else:
+                    # A multi-byte character completed differently than it was first decoded.
+                    parser = self.parsers[row] = SQLStreamParser()
+                    parser.feed(text)
+                self.texts[row] = text
+                if parser.done:
+                    self.stopped_at[row] = generated
+            done.append(parser.done)
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+    def record(self):
+        """
+        Adds the sequences stopped early, and the generation budget they left unused, to the telemetry.
+        The unused budget is an upper bound on the tokens saved: a sequence may have
+        ended with an EOS token well before it.
+        """
+        for stopped_at in self.stopped_at:
+            telemetry.count("stream.requests")
+            if stopped_at is not None:
+                unused = max(self.max_new_tokens - stopped_at, 0)
+                telemetry.count("stream.early_stops")
+                telemetry.count("tokens.saved_upper_bound", unused)
+                telemetry.observe("stream.tokens_saved_upper_bound", unused)
+
+def sql_stopping_criteria(tokenizer, prompt_length: int, max_new_tokens: int) -> tuple[StoppingCriteriaList, SQLStoppingCriteria]:
+    """
+    Returns the `stopping_criteria` argument of one `generate` call, and the criteria in it.
+    """
+    criteria = SQLStoppingCriteria(tokenizer, prompt_length, max_new_tokens)
+    return StoppingCriteriaList([criteria]), criteria
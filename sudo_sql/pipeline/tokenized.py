@@ -0,0 +1,141 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+from typing import Callable, Iterable, Optional
+import numpy as np
+from .batching import chunked
+
+DEFAULT_CACHE_DIR = os.path.join("cache", "tokenized")
+TOKEN_DTYPE = np.int32
+OFFSET_DTYPE = np.int64
+ENCODE_BATCH_SIZE = 1024
+
+class TokenizedPrompts:
+    """
+    The token ids of every prompt of a split, memory-mapped from disk.
+
+    The ids of all prompts are stored back to back in one flat array; `offsets[i]`
+    and `offsets[i + 1]` delimit the ids of prompt `i`. Opening a split is an mmap,
+    and pages are only read when a prompt is accessed.
+    """
+    def __init__(self, directory: str):
+        """
+        Args:
+            directory: A directory written by `build_tokenized_prompts`.
+        """
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        self.offsets = self._map("offsets.bin", OFFSET_DTYPE)
+        self.ids = self._map("ids.bin", TOKEN_DTYPE)
+
+    def _map(self, filename: str, dtype) -> np.ndarray:
+        path = os.path.join(self.directory, filename)
+        if os.path.getsize(path) == 0:
+            # numpy cannot memory-map an empty file.
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r")
+
+    def __len__(self) -> int:
+        return max(len(self.offsets) - 1, 0)
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        return self.ids[self.offsets[index]:self.offsets[index + 1]]
+
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+def tokenizer_id(tokenizer) -> list:
+    """
+    Identifies a tokenizer by its class, name and vocabulary size.
+    """
+    return [type(tokenizer).__name__, getattr(tokenizer, "name_or_path", None), len(tokenizer)]
+
+def tokenized_cache_key(tokenizer, prompt_template: str, dataset_fingerprint: str) -> str:
+    """
+    Builds the cache key of a tokenized split from the tokenizer, a hash of the
+    prompt template and the fingerprint of the split's items.
+    """
+    template_hash = hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()
+    payload = json.dumps([tokenizer_id(tokenizer), template_hash, dataset_fingerprint])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def build_tokenized_prompts(directory: str, prompts: Iterable[str], tokenizer, meta: Optional[dict] = None) -> TokenizedPrompts:
+    """
+    Tokenizes `prompts` and writes them to `directory` as flat, memory-mappable arrays.
+
+    Prompts are streamed and encoded in batches. The arrays are written to a temporary
+    directory that is renamed into place once complete, so an interrupted build never
+    leaves a partial cache behind.
+
+    Args:
+        directory: Where to store the arrays.
+        prompts: The prompts, in dataset order.
+        tokenizer: The tokenizer used to encode the prompts.
+        meta: Extra metadata stored next to the arrays.
+
+    Returns:
+        The tokenized prompts, memory-mapped from `directory`.
+    """
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=parent, prefix=".tokenizing-")
+    try:
+        count = 0
+        total = 0
+        with open(os.path.join(staging, "ids.bin"), "wb") as ids_file, open(os.path.join(staging, "offsets.bin"), "wb") as offsets_file:
+            np.zeros(1, dtype=OFFSET_DTYPE).tofile(offsets_file)
+            for batch in chunked(prompts, ENCODE_BATCH_SIZE):
+                encoded = tokenizer(batch)["input_ids"]
+                lengths = np.fromiter((len(ids) for ids in encoded), dtype=OFFSET_DTYPE, count=len(encoded))
+                if lengths.sum():
+                    np.concatenate([np.asarray(ids, dtype=TOKEN_DTYPE) for ids in encoded]).tofile(ids_file)
+                (total + np.cumsum(lengths)).tofile(offsets_file)
+                total += int(lengths.sum())
+                count += len(encoded)
+
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump({**(meta or {}), "count": count, "tokens": total}, f, indent=2)
+
+        try:
+            os.replace(staging, directory)
+        except OSError:
+            # Another process finished the same build first; keep its copy.
+            if not os.path.exists(os.path.join(directory, "meta.json")):
+                raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return TokenizedPrompts(directory)
+
+def load_tokenized_prompts(dataset, tokenizer, prompt_template: str, build_prompt: Callable[[dict], str], cache_dir: Optional[str] = None) -> TokenizedPrompts:
+    """
+    Opens the tokenized prompts of a `StreamingDataset`, tokenizing the split first
+    if it is not cached yet.
+
+    Args:
+        dataset: The dataset to tokenize. Must have a `fingerprint()`.
+        tokenizer: The tokenizer used to encode the prompts.
+        prompt_template: The template `build_prompt` renders, part of the cache key.
+        build_prompt: Builds the prompt of one item.
+        cache_dir: The cache directory. Defaults to `cache/tokenized` under the working directory.
+
+    Returns:
+        The tokenized prompts, in dataset order.
+    """
+    cache_dir = cache_dir or os.path.join(os.getcwd(), DEFAULT_CACHE_DIR)
+    key = tokenized_cache_key(tokenizer, prompt_template, dataset.fingerprint())
+    directory = os.path.join(cache_dir, f"{dataset.loader.dataset_name}_{dataset.split}_{key[:16]}")
+
+    if os.path.exists(os.path.join(directory, "meta.json")):
+        return TokenizedPrompts(directory)
+
+    meta = {
+        "dataset": dataset.loader.dataset_name,
+        "split": dataset.split,
+        "schema_type": dataset.schema_type,
+        "tokenizer": tokenizer_id(tokenizer),
+        "key": key,
+    }
+    return build_tokenized_prompts(directory, (build_prompt(item) for item in dataset), tokenizer, meta)
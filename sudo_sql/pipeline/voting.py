@@ -0,0 +1,109 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional, Sequence
+from sudo_sql.database import QueryExecutor, QueryResult, multiset_hash
+from sudo_sql.database.executor import ERROR
+from sudo_sql.evaluation.metrics import normalize_sql
+from sudo_sql.telemetry import telemetry
+
+DEFAULT_MAX_ROWS = 10000
+
+def result_fingerprint(rows: Sequence[tuple]) -> str:
+    """
+    Hashes a result set the way execution accuracy compares unordered results: as a
+    multiset of rows, ignoring their order but not their repetitions. Rows are
+    digested like in `QueryExecutor.compare`, so (1,) and (1.0,) vote alike.
+    """
+    return f"{multiset_hash(rows):032x}"
+
+@dataclass
+class Vote:
+    """
+    The outcome of voting on the candidates for one question.
+
+    `sql` is the selected candidate, `votes` the number of candidates agreeing with
+    its result, `distinct` the number of distinct normalized candidates and
+    `executed` the number of them that ran successfully. `fingerprint` identifies
+    the winning result set; it is None when no candidate ran.
+    """
+    sql: str
+    votes: int
+    candidates: int
+    distinct: int
+    executed: int
+    fingerprint: Optional[str] = None
+
+class CandidateVoter:
+    """
+    Picks one of several candidate queries by agreement on their execution results.
+
+    Candidates are normalized with `normalize_sql` and deduplicated first, so every
+    distinct query runs once, however many candidates produced it. The distinct
+    queries run in parallel threads, each on its own pooled connection and under the
+    executor's timeout. Every candidate then votes for the fingerprint of its query's
+    result set, and the most common result wins. Ties go to the result of the
+    earliest candidate. If no candidate executes, the most frequent query wins.
+    """
+    def __init__(self, executor: Optional[QueryExecutor] = None, max_workers: Optional[int] = None, candidates: int = 5):
+        """
+        Args:
+            executor: Executes the candidates. Defaults to a 30s timeout and at most
+                      10000 rows per query. It is closed with the voter.
+            max_workers: The number of threads executing candidates of one question.
+            candidates: The number of candidates sampled per question.
+        """
+        self.executor = executor or QueryExecutor(max_rows=DEFAULT_MAX_ROWS)
+        self.candidates = candidates
+        self._threads = ThreadPoolExecutor(max_workers=max_workers)
+
+    def select(self, candidates: Sequence[str], db_path: str) -> Vote:
+        # normalized query -> the first candidate text and the positions that produced it
+        groups = {}
+        for position, sql in enumerate(candidates):
+            normalized = normalize_sql(sql or "")
+            if normalized:
+                groups.setdefault(normalized, (sql.strip(), []))[1].append(position)
+
+        telemetry.count("voting.candidates", len(candidates))
+        telemetry.count("voting.distinct", len(groups))
+        if not groups:
+            return Vote(sql="", votes=0, candidates=len(candidates), distinct=0, executed=0)
+
+        texts = [text for text, _ in groups.values()]
+        if db_path:
+            with telemetry.span("voting.execute"):
+                results: list[QueryResult] = list(self._threads.map(lambda sql: self.executor.execute(db_path, sql), texts))
+        else:
+            results = [QueryResult(ERROR, error="No database to execute the candidates on") for _ in texts]
+
+        # fingerprint -> [votes, first position, (size, first position, text) of its most common query]
+        tally = {}
+        for (text, positions), result in zip(groups.values(), results):
+            if not result.ok:
+                continue
+            fingerprint = result_fingerprint(result.rows)
+            entry = tally.setdefault(fingerprint, [0, positions[0], None])
+            entry[0] += len(positions)
+            entry[1] = min(entry[1], positions[0])
+            choice = (-len(positions), positions[0], text)
+            entry[2] = min(entry[2], choice) if entry[2] is not None else choice
+
+        executed = sum(result.ok for result in results)
+        if not tally:
+            # Nothing ran: fall back to agreement on the query text itself.
+            text, positions = min(groups.values(), key=lambda group: (-len(group[1]), group[1][0]))
+            return Vote(sql=text, votes=len(positions), candidates=len(candidates), distinct=len(groups), executed=0)
+
+        fingerprint, (votes, _, (_, _, text)) = min(tally.items(), key=lambda pair: (-pair[1][0], pair[1][1]))
+        return Vote(
+            sql=text,
+            votes=votes,
+            candidates=len(candidates),
+            distinct=len(groups),
+            executed=executed,
+            fingerprint=fingerprint,
+        )
+
+    def close(self):
+        self._threads.shutdown()
+        self.executor.close()
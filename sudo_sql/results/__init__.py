@@ -0,0 +1,4 @@
+from .store import ResultsStore, make_item_id, item_index
+from .merge import merge_results
+
+__all__ = ["ResultsStore", "make_item_id", "item_index", "merge_results"]
@@ -0,0 +1,66 @@
+import os
+import json
+from .store import ResultsStore, item_index, _legacy_key
+from ..logger_config import logger
+
+def merge_results(paths: list[str], output_path: str) -> dict:
+    """
+    Combines the results files of several shards into one file ordered by item index.
+
+    Records are identified by their `item_id`. A record seen in more than one file
+    (e.g. after re-running a shard) is written once, from the first file listed;
+    copies whose generated SQL differs are counted as conflicts. Only the position
+    of each record is kept in memory while scanning, so large splits can be merged.
+
+    Args:
+        paths: The shard results files.
+        output_path: The merged results file. It gets an index like any results file.
+
+    Returns:
+        Counts of the records read, written, duplicated and conflicting, and of the
+        item indexes missing between the first and the last merged item.
+    """
+    if os.path.abspath(output_path) in {os.path.abspath(path) for path in paths}:
+        raise ValueError(f"The merged file {output_path} must not be one of the inputs.")
+
+    # item_id -> (index, file number, offset, generated_sql)
+    entries = {}
+    stats = {"files": len(paths), "records": 0, "duplicates": 0, "conflicts": 0}
+    for number, path in enumerate(paths):
+        with open(path, "rb") as f:
+            offset = 0
+            for raw_line in f:
+                line_offset, offset = offset, offset + len(raw_line)
+                try:
+                    record = json.loads(raw_line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping unparseable line at byte {line_offset} of {path}.")
+                    continue
+                stats["records"] += 1
+                # Records written before item ids existed go after the others, in file order.
+                item_id = record.get("item_id") or _legacy_key(record["db_id"], record["question"])
+                if item_id in entries:
+                    stats["duplicates"] += 1
+                    if entries[item_id][3] != record.get("generated_sql"):
+                        stats["conflicts"] += 1
+                        logger.warning(f"Conflicting results for {item_id}; keeping the one from {paths[entries[item_id][1]]}.")
+                    continue
+                entries[item_id] = (item_index(item_id) if "item_id" in record else None, number, line_offset, record.get("generated_sql"))
+
+    ordered = sorted(entries.items(), key=lambda pair: (pair[1][0] is None, pair[1][0] or 0, pair[1][1], pair[1][2]))
+    files = [open(path, "rb") for path in paths]
+    try:
+        with ResultsStore(output_path, flush_every=1024, flush_interval=float("inf"), fsync=False).open() as store:
+            for item_id, (_, number, offset, _) in ordered:
+                files[number].seek(offset)
+                record = json.loads(files[number].readline())
+                record.setdefault("item_id", item_id)
+                store.write(record)
+    finally:
+        for f in files:
+            f.close()
+
+    indexes = [entry[0] for _, entry in ordered if entry[0] is not None]
+    stats["written"] = len(ordered)
+    stats["missing"] = indexes[-1] - indexes[0] + 1 - len(indexes) if indexes else 0
+    return stats
@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import hashlib
+from typing import Optional
+from ..logger_config import logger
+
+INDEX_SUFFIX = ".idx"
+
+def make_item_id(db_id: str, question: str, index: int) -> str:
+    """
+    Builds the stable id of a dataset item: its database, a hash of its question
+    and its position in the split. The same question asked against two databases,
+    or twice in one split, gets two different ids.
+    """
+    digest = hashlib.sha1(question.encode("utf-8")).hexdigest()[:12]
+    return f"{db_id}:{digest}:{index}"
+
+def item_index(item_id: str) -> Optional[int]:
+    """
+    Returns the position in the split encoded in an item id, or None for ids
+    that do not carry one.
+    """
+    _, _, index = item_id.rpartition(":")
+    return int(index) if index.isdigit() else None
+
+def _legacy_key(db_id: str, question: str) -> str:
+    # Results written before item ids existed are matched on (db_id, question).
+    digest = hashlib.sha1(question.encode("utf-8")).hexdigest()[:12]
+    return f"legacy:{db_id}:{digest}"
+
+class ResultsStore:
+    """
+    An append-only JSONL results file with a buffered writer and a sidecar index.
+
+    Records are buffered in memory and written in batches, followed by an fsync.
+    After each batch the ids of the new records and their end offsets are appended
+    to `<path>.idx`. On resume the index is read instead of the results file, and
+    only the part of the file past the last indexed offset is scanned. That part
+    exists when a run died between writing results and writing the index. A torn
+    last line left by a crash is truncated away before anything else is read.
+    """
+    def __init__(self, path: str, flush_every: int = 32, flush_interval: float = 5.0, fsync: bool = True):
+        """
+        Initializes the store. Call `open` before writing.
+
+        Args:
+            path: The path of the JSONL results file.
+            flush_every: The number of buffered records that triggers a flush.
+            flush_interval: The number of seconds after which buffered records are flushed.
+            fsync: Whether to fsync the results file on every flush.
+        """
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+
+        self._completed = set()
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._size = 0
+        self._data_file = None
+        self._index_file = None
+
+    def open(self, resume: bool = False) -> "ResultsStore":
+        """
+        Opens the results file for appending.
+
+        Args:
+            resume: Whether to load the ids of previously written results. When False,
+                    any existing results file and index are removed.
+        """
+        if resume:
+            self._load()
+        else:
+            for path in (self.path, self.index_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._data_file = open(self.path, "ab")
+        self._index_file = open(self.index_path, "a", encoding="utf-8")
+        self._size = self._data_file.tell()
+        self._last_flush = time.monotonic()
+        return self
+
+    def __enter__(self) -> "ResultsStore":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._completed)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._completed
+
+    def is_completed(self, item_id: str, db_id: Optional[str] = None, question: Optional[str] = None) -> bool:
+        """
+        Checks whether a result for an item was already written, including results
+        from older files that only recorded the question text.
+        """
+        if item_id in self._completed:
+            return True
+        return db_id is not None and question is not None and _legacy_key(db_id, question) in self._completed
+
+    def write(self, record: dict):
+        """
+        Buffers a result record. The record must carry an `item_id`.
+        """
+        if "item_id" not in record:
+            raise ValueError("Result records must have an 'item_id'.")
+
+        self._buffer.append(record)
+        self._completed.add(record["item_id"])
+        if len(self._buffer) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes buffered records to the results file, then records them in the index.
+        """
+        if not self._buffer:
+            return
+
+        chunks = []
+        index_lines = []
+        for record in self._buffer:
+            chunk = (json.dumps(record) + "\n").encode("utf-8")
+            chunks.append(chunk)
+            self._size += len(chunk)
+            index_lines.append(f"{record['item_id']}\t{self._size}\n")
+
+        self._data_file.write(b"".join(chunks))
+        self._data_file.flush()
+        if self.fsync:
+            os.fsync(self._data_file.fileno())
+
+        # The index only ever points at data that is already durable.
+        self._index_file.write("".join(index_lines))
+        self._index_file.flush()
+
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        """
+        Flushes any buffered records and closes the underlying files.
+        """
+        if self._data_file is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self._data_file.close()
+            self._index_file.close()
+            self._data_file = None
+            self._index_file = None
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+            return
+
+        size = self._truncate_torn_tail()
+        indexed_size = self._read_index(size)
+        if indexed_size < size:
+            self._index_tail(indexed_size)
+
+    def _truncate_torn_tail(self) -> int:
+        """
+        Drops a partially written last line, if any, and returns the resulting file size.
+        """
+        with open(self.path, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return 0
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return size
+
+            position = size
+            while position > 0:
+                step = min(4096, position)
+                position -= step
+                f.seek(position)
+                newline = f.read(step).rfind(b"\n")
+                if newline != -1:
+                    position += newline + 1
+                    break
+
+            logger.warning(f"Truncating torn last line of {self.path} ({size - position} bytes).")
+            f.truncate(position)
+            return position
+
+    def _read_index(self, size: int) -> int:
+        """
+        Loads completed ids from the index, ignoring entries past `size`.
+        Returns the highest offset that is covered by the index.
+        """
+        if not os.path.exists(self.index_path):
+            return 0
+
+        valid_length = 0
+        indexed_size = 0
+        with open(self.index_path, "rb+") as f:
+            for raw_line in f:
+                item_id, _, offset = raw_line.decode("utf-8", errors="replace").rstrip("\n").rpartition("\t")
+                if not raw_line.endswith(b"\n") or not item_id or not offset.isdigit() or int(offset) > size:
+                    break
+                self._completed.add(item_id)
+                indexed_size = int(offset)
+                valid_length += len(raw_line)
+
+            # Drop a torn tail, or entries pointing past a truncated results file.
+            if valid_length < f.seek(0, os.SEEK_END):
+                f.truncate(valid_length)
+
+        return indexed_size
+
+    def _index_tail(self, offset: int):
+        """
+        Scans results written after `offset` that the index does not know about yet.
+        """
+        index_lines = []
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for raw_line in f:
+                offset += len(raw_line)
+                try:
+                    data = json.loads(raw_line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Could not parse line in results file: {raw_line!r}")
+                    continue
+                item_id = data.get("item_id") or _legacy_key(data["db_id"], data["question"])
+                self._completed.add(item_id)
+                index_lines.append(f"{item_id}\t{offset}\n")
+
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write("".join(index_lines))
@@ -0,0 +1,3 @@
+from .pruner import SchemaIndex, SchemaPruner, count_tokens
+
+__all__ = ["SchemaIndex", "SchemaPruner", "count_tokens"]
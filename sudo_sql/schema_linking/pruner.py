@@ -0,0 +1,263 @@
+import os
+import re
+import sqlite3
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Optional
+from sudo_sql.database import get_connection
+
+_CAMEL_CASE = re.compile(r"([a-z])([A-Z])")
+_WORD = re.compile(r"[a-z0-9]+")
+_HEADER = re.compile(r"#\s*Table:\s*(\S+)")
+_CREATE_TABLE = re.compile(r"\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?[`\"\[]?([^\s`\"\]\(]+)", re.IGNORECASE)
+_COLUMN_LINE = re.compile(r"\s*\(\s*[`\"\[]?([^,:\s`\"\]\)]+)")
+_DDL_COLUMN = re.compile(r"\s*[`\"\[]?([^\s`\"\]\(,]+)")
+_DDL_CONSTRAINT = re.compile(r"\s*(PRIMARY\s+KEY|FOREIGN\s+KEY|CONSTRAINT|UNIQUE|CHECK)\b", re.IGNORECASE)
+_KEY_MARKERS = re.compile(r"primary key|foreign key|references|maps to", re.IGNORECASE)
+
+STOPWORDS = frozenset(
+    "a an and are as at be by do does each for from give how in is it its list many me much of on or "
+    "show that the their there this to was were what when where which who whose with".split()
+)
+
+# Relevance of a question word matching a column name, a table name, or a column's
+# description and sample values.
+NAME_WEIGHT = 3.0
+TABLE_WEIGHT = 3.0
+TEXT_WEIGHT = 1.0
+
+def words(text: str) -> set[str]:
+    """
+    Splits text into lowercase words, breaking up snake_case and camelCase
+    identifiers and dropping stopwords. Plurals are folded into the singular.
+    """
+    result = set()
+    for word in _WORD.findall(_CAMEL_CASE.sub(r"\1 \2", text).lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        result.add(word)
+    return result
+
+def count_tokens(text: str) -> int:
+    """
+    A tokenizer-free estimate of the number of tokens in `text`.
+    """
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+@dataclass
+class _Column:
+    name: str
+    line: int
+    is_key: bool
+
+@dataclass
+class _Table:
+    name: str
+    header: list[int]
+    footer: list[int]
+    columns: list[_Column] = field(default_factory=list)
+    constraints: list[int] = field(default_factory=list)
+    is_ddl: bool = False
+
+def parse_schema(schema: str) -> tuple[list[str], list[_Table]]:
+    """
+    Splits a generated schema into its lines and tables.
+
+    Two layouts are recognized: `# Table: name` blocks with one `(column, ...)` line
+    per column, as written by d-schema's text generators, and `CREATE TABLE`
+    statements with one column definition per line.
+    """
+    lines = schema.split("\n")
+    tables = []
+    table = None
+    for number, line in enumerate(lines):
+        header = _HEADER.match(line) or _CREATE_TABLE.match(line)
+        if header:
+            table = _Table(header.group(1), header=[number], footer=[], is_ddl=not line.lstrip().startswith("#"))
+            tables.append(table)
+            if table.is_ddl and line.count("(") and line.count("(") == line.count(")"):
+                # A single-line statement: the table is kept or dropped as a whole.
+                table = None
+            continue
+        if table is None:
+            continue
+
+        stripped = line.strip()
+        if table.is_ddl:
+            if stripped.startswith(")"):
+                table.footer.append(number)
+                table = None
+            elif _DDL_CONSTRAINT.match(line):
+                table.constraints.append(number)
+            elif stripped and not stripped.startswith("--"):
+                table.columns.append(_Column(_DDL_COLUMN.match(line).group(1), number, bool(_KEY_MARKERS.search(line))))
+        else:
+            column = _COLUMN_LINE.match(line)
+            if column:
+                table.columns.append(_Column(column.group(1), number, bool(_KEY_MARKERS.search(line))))
+            elif stripped in ("[", "]"):
+                (table.footer if stripped == "]" else table.header).append(number)
+    return lines, tables
+
+class SchemaIndex:
+    """
+    A lexical index over one database's schema.
+
+    Every word of a table name, column name, column description and sample value
+    points at the columns it describes. Scoring a question is a handful of
+    dictionary lookups, so pruning adds microseconds per question.
+    """
+    def __init__(self, schema: str, db_path: Optional[str] = None, sample_values: int = 3):
+        """
+        Args:
+            schema: The generated schema text.
+            db_path: The database, read for sample values of text columns. Optional.
+            sample_values: The number of distinct sample values indexed per text column.
+        """
+        self.lines, self.tables = parse_schema(schema)
+        # word -> {(table index, column index or -1 for the table itself): weight}
+        self.postings = defaultdict(dict)
+
+        samples = self._sample_values(db_path, sample_values) if db_path and sample_values else {}
+        for t, table in enumerate(self.tables):
+            self._add(words(table.name), (t, -1), TABLE_WEIGHT)
+            for c, column in enumerate(table.columns):
+                self._add(words(column.name), (t, c), NAME_WEIGHT)
+                text = self.lines[column.line] + " " + " ".join(samples.get((table.name.lower(), column.name.lower()), ()))
+                self._add(words(text), (t, c), TEXT_WEIGHT)
+
+    def _add(self, vocabulary: set[str], target: tuple[int, int], weight: float):
+        for word in vocabulary:
+            postings = self.postings[word]
+            postings[target] = max(postings.get(target, 0.0), weight)
+
+    def _sample_values(self, db_path: str, limit: int) -> dict[tuple[str, str], list[str]]:
+        if not os.path.exists(db_path):
+            return {}
+        samples = {}
+        try:
+            con = get_connection(db_path)
+            for table in self.tables:
+                for _, column, column_type, *_ in con.execute(f'PRAGMA table_info("{table.name}")'):
+                    if "CHAR" not in column_type.upper() and "TEXT" not in column_type.upper() and column_type:
+                        continue
+                    rows = con.execute(f'SELECT DISTINCT "{column}" FROM "{table.name}" WHERE "{column}" IS NOT NULL LIMIT {int(limit)}')
+                    samples[(table.name.lower(), column.lower())] = [str(value) for value, in rows]
+        except sqlite3.Error:
+            # Sample values only sharpen the ranking; the schema text is enough without them.
+            pass
+        return samples
+
+    def score(self, question: str) -> dict[tuple[int, int], float]:
+        scores = defaultdict(float)
+        for word in words(question):
+            for target, weight in self.postings.get(word, {}).items():
+                scores[target] += weight
+        return scores
+
+    def prune(self, question: str, top_k_tables: int, top_k_columns: int) -> str:
+        """
+        Renders the schema with only the `top_k_tables` tables and, within them, the
+        `top_k_columns` columns most relevant to `question`. Key columns and
+        constraints are always kept, so joins stay expressible.
+        """
+        if not self.tables:
+            return "\n".join(self.lines)
+
+        scores = self.score(question)
+        # A table scores its name match plus its best column.
+        name_scores = [0.0] * len(self.tables)
+        column_scores = [0.0] * len(self.tables)
+        for (t, c), score in scores.items():
+            if c == -1:
+                name_scores[t] += score
+            else:
+                column_scores[t] = max(column_scores[t], score)
+        table_scores = [name + column for name, column in zip(name_scores, column_scores)]
+        # Stable ordering: ties keep the schema's own table order.
+        ranked = sorted(range(len(self.tables)), key=lambda t: -table_scores[t])
+        kept_tables = set(ranked[:max(top_k_tables, 1)])
+
+        keep = [True] * len(self.lines)
+        for t, table in enumerate(self.tables):
+            if t not in kept_tables:
+                for number in table.header + table.footer + table.constraints + [column.line for column in table.columns]:
+                    keep[number] = False
+                continue
+
+            # Key columns are always kept, so they do not take up any of the top k places.
+            candidates = [c for c, column in enumerate(table.columns) if not column.is_key]
+            kept_columns = set(sorted(candidates, key=lambda c: -scores.get((t, c), 0.0))[:top_k_columns])
+            for c, column in enumerate(table.columns):
+                keep[column.line] = c in kept_columns or column.is_key
+
+        return "\n".join(self._tidy([line for line, kept in zip(self.lines, keep) if kept]))
+
+    @staticmethod
+    def _tidy(lines: list[str]) -> list[str]:
+        tidy = []
+        for line in lines:
+            # Dropped tables leave their separating blank lines behind.
+            if not line.strip() and tidy and not tidy[-1].strip():
+                continue
+            # Dropping the last column definitions can leave a dangling comma before ");".
+            if line.strip().startswith(")") and tidy and tidy[-1].rstrip().endswith(","):
+                tidy[-1] = tidy[-1].rstrip()[:-1]
+            tidy.append(line)
+        return tidy
+
+class SchemaPruner:
+    """
+    Shrinks the schema in each prompt to the tables and columns relevant to the question.
+
+    A `SchemaIndex` is built once per database and reused for every question about
+    it. The pruner also tallies the (estimated) schema tokens before and after pruning.
+    """
+    def __init__(self, top_k_tables: int = 5, top_k_columns: int = 10, sample_values: int = 3):
+        """
+        Args:
+            top_k_tables: The number of tables kept per question.
+            top_k_columns: The number of columns kept per table, not counting key columns.
+            sample_values: The number of distinct sample values indexed per text column.
+        """
+        self.top_k_tables = top_k_tables
+        self.top_k_columns = top_k_columns
+        self.sample_values = sample_values
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.questions = 0
+        self._indexes = {}
+        self._schema_tokens = {}
+
+    def options(self) -> dict:
+        return {"top_k_tables": self.top_k_tables, "top_k_columns": self.top_k_columns, "sample_values": self.sample_values}
+
+    def index(self, schema: str, db_path: Optional[str] = None) -> SchemaIndex:
+        key = (db_path, schema)
+        if key not in self._indexes:
+            self._indexes[key] = SchemaIndex(schema, db_path, self.sample_values)
+            self._schema_tokens[key] = count_tokens(schema)
+        return self._indexes[key]
+
+    def prune(self, question: str, schema: str, db_path: Optional[str] = None, record_stats: bool = True) -> str:
+        """
+        Returns the part of `schema` relevant to `question`. With `record_stats` off,
+        the question is not added to the tallies, e.g. when its prompt is built again.
+        """
+        pruned = self.index(schema, db_path).prune(question, self.top_k_tables, self.top_k_columns)
+        if not record_stats:
+            return pruned
+        self.questions += 1
+        self.tokens_before += self._schema_tokens[(db_path, schema)]
+        self.tokens_after += count_tokens(pruned)
+        return pruned
+
+    def stats(self) -> dict:
+        return {
+            "questions": self.questions,
+            "schema_tokens_before": self.tokens_before,
+            "schema_tokens_after": self.tokens_after,
+            "reduction": 1 - self.tokens_after / self.tokens_before if self.tokens_before else 0.0,
+        }
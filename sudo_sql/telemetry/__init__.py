@@ -0,0 +1,3 @@
+from .metrics import Telemetry, telemetry, percentile
+
+__all__ = ["Telemetry", "telemetry", "percentile"]
@@ -0,0 +1,194 @@
+import os
+import re
+import json
+import math
+import time
+import random
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+PERCENTILES = (50, 90, 99)
+# Samples kept per histogram for percentiles; count, total and max stay exact.
+RESERVOIR_SIZE = 4096
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """
+    Returns the nearest-rank `p`th percentile of already sorted values.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+class _Histogram:
+    """
+    Exact count, total and max of a stream of values, plus a uniform random sample
+    of at most `size` of them (reservoir sampling) to estimate percentiles from.
+    """
+    __slots__ = ("count", "total", "max", "samples", "size")
+
+    def __init__(self, size: int):
+        self.count = 0
+        self.total = 0.0
+        self.max = -math.inf
+        self.samples = []
+        self.size = size
+
+    def add(self, value: float, rng: random.Random):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        if len(self.samples) < self.size:
+            self.samples.append(value)
+            return
+        slot = rng.randrange(self.count)
+        if slot < self.size:
+            self.samples[slot] = value
+
+class Telemetry:
+    """
+    A lightweight, in-process registry of timings and counters for one run.
+
+    `span` times a block of code and records its duration in a histogram named after
+    the stage, `observe` records any other value and `count` increments a counter
+    (e.g. tokens). At the end of a run, `summary` reports latency percentiles,
+    throughput and totals, and `write_json` / `write_prometheus` export them.
+
+    Memory stays bounded however long a run is: each histogram keeps at most
+    `reservoir_size` samples, so percentiles of longer histograms are estimates.
+    """
+    def __init__(self, reservoir_size: int = RESERVOIR_SIZE):
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+        self.reservoir_size = reservoir_size
+        self.reset()
+
+    def reset(self):
+        """
+        Drops everything recorded so far and restarts the run clock.
+        """
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+            self.started = time.monotonic()
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = _Histogram(self.reservoir_size)
+            histogram.add(value, self._random)
+
+    def count(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """
+        Records the wall-clock duration of the block, in seconds, under `name`.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def iterate(self, iterable: Iterable[T], name: str) -> Iterator[T]:
+        """
+        Yields from `iterable`, recording how long each item took to produce under `name`.
+        Useful for lazy sources such as a streamed dataset.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(name, time.perf_counter() - start)
+            yield item
+
+    def record_usage(self, usage):
+        """
+        Adds the token counts of an API response's `usage` object, if it has one.
+        """
+        if usage is None:
+            return
+        self.count("tokens.prompt", int(getattr(usage, "prompt_tokens", 0) or 0))
+        self.count("tokens.completion", int(getattr(usage, "completion_tokens", 0) or 0))
+
+    def summary(self) -> dict:
+        """
+        Summarizes the run: per-stage latency statistics, counters and throughput.
+        """
+        with self._lock:
+            histograms = {
+                name: (histogram.count, histogram.total, histogram.max, sorted(histogram.samples))
+                for name, histogram in self.histograms.items()
+            }
+            counters = dict(self.counters)
+            elapsed = time.monotonic() - self.started
+
+        spans = {}
+        for name, (count, total, maximum, samples) in sorted(histograms.items()):
+            spans[name] = {
+                "count": count,
+                "total": total,
+                "mean": total / count,
+                **{f"p{p}": percentile(samples, p) for p in PERCENTILES},
+                "max": maximum,
+            }
+        return {
+            "elapsed_seconds": elapsed,
+            "spans": spans,
+            "counters": dict(sorted(counters.items())),
+            "throughput": {f"{name}_per_second": value / elapsed for name, value in sorted(counters.items())} if elapsed else {},
+        }
+
+    def write_json(self, path: str, summary: Optional[dict] = None):
+        summary = summary or self.summary()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    def write_prometheus(self, path: str, summary: Optional[dict] = None, prefix: str = "sudo_sql"):
+        """
+        Writes the summary in the Prometheus text exposition format, e.g. for the
+        node exporter's textfile collector.
+        """
+        summary = summary or self.summary()
+        lines = [
+            f"# HELP {prefix}_span_seconds Duration of pipeline stages.",
+            f"# TYPE {prefix}_span_seconds summary",
+        ]
+        for name, stats in summary["spans"].items():
+            for p in PERCENTILES:
+                lines.append(f'{prefix}_span_seconds{{span="{name}",quantile="{p / 100}"}} {stats[f"p{p}"]}')
+            lines.append(f'{prefix}_span_seconds_sum{{span="{name}"}} {stats["total"]}')
+            lines.append(f'{prefix}_span_seconds_count{{span="{name}"}} {stats["count"]}')
+        for name, value in summary["counters"].items():
+            metric = f"{prefix}_{_metric_name(name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        lines.append(f"# TYPE {prefix}_run_elapsed_seconds gauge")
+        lines.append(f"{prefix}_run_elapsed_seconds {summary['elapsed_seconds']}")
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write atomically, so a scraper never reads a half-written file.
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_path, path)
+
+telemetry = Telemetry()
@@ -0,0 +1,212 @@
+import os
+import numpy as np
+import torch
+import pytest
+
+from sudo_sql.pipeline.batching import length_buckets, generate_batched
+from sudo_sql.pipeline.tokenized import build_tokenized_prompts, load_tokenized_prompts
+
+class FakeTokenizer:
+    """Whitespace tokenizer with the small subset of the HF API used by generate_batched."""
+    pad_token_id = 0
+    padding_side = "right"
+
+    def __init__(self):
+        self.vocab = {"<pad>": 0}
+        self.padding_sides_seen = []
+
+    def encode(self, text):
+        return [self.vocab.setdefault(word, len(self.vocab)) for word in text.split()]
+
+    def pad(self, features, padding, return_tensors):
+        self.padding_sides_seen.append(self.padding_side)
+        rows = features["input_ids"]
+        width = max(len(row) for row in rows)
+        input_ids = [[self.pad_token_id] * (width - len(row)) + row for row in rows]
+        attention_mask = [[0] * (width - len(row)) + [1] * len(row) for row in rows]
+        return {"input_ids": torch.tensor(input_ids), "attention_mask": torch.tensor(attention_mask)}
+
+    def batch_decode(self, sequences, skip_special_tokens):
+        words = {i: w for w, i in self.vocab.items()}
+        return [" ".join(words[int(t)] for t in row if int(t) != self.pad_token_id) for row in sequences]
+
+    def decode(self, ids, skip_special_tokens):
+        return self.batch_decode([ids], skip_special_tokens)[0]
+
+class EchoLastTokenModel:
+    """Generates a single token: the last prompt token, so outputs are traceable to inputs."""
+    def __init__(self):
+        self.batch_shapes = []
+
+    def generate(self, input_ids, attention_mask, pad_token_id, **kwargs):
+        self.batch_shapes.append(tuple(input_ids.shape))
+        return torch.cat([input_ids, input_ids[:, -1:]], dim=1)
+
+def test_length_buckets_groups_similar_lengths():
+    buckets = length_buckets([5, 1, 4, 2, 3], batch_size=2)
+    assert buckets == [[1, 3], [4, 2], [0]]
+
+def test_length_buckets_rejects_invalid_batch_size():
+    with pytest.raises(ValueError):
+        length_buckets([1, 2], batch_size=0)
+
+def test_generate_batched_maps_outputs_back_to_prompts():
+    tokenizer = FakeTokenizer()
+    model = EchoLastTokenModel()
+    prompts = ["a b c alpha", "beta", "c d gamma", "e f g h delta"]
+
+    results = dict(generate_batched(model, tokenizer, prompts, batch_size=2, device="cpu"))
+
+    assert results == {0: "alpha", 1: "beta", 2: "gamma", 3: "delta"}
+    assert model.batch_shapes == [(2, 3), (2, 5)]
+    assert tokenizer.padding_sides_seen == ["left", "left"]
+    assert tokenizer.padding_side == "right"
+
+class CallableTokenizer(FakeTokenizer):
+    """Adds the batch `__call__` and `len()` used when pre-tokenizing a split."""
+    name_or_path = "fake"
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def __call__(self, texts):
+        self.calls += 1
+        return {"input_ids": [self.encode(text) for text in texts]}
+
+    def __len__(self):
+        return 1000
+
+class FakeStreamingDataset:
+    def __init__(self, items, fingerprint="v1"):
+        self.items = items
+        self.loader = type("Loader", (), {"dataset_name": "test_ds"})()
+        self.split = "dev"
+        self.schema_type = "ddl-schema"
+        self._fingerprint = fingerprint
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def fingerprint(self):
+        return self._fingerprint
+
+def test_build_tokenized_prompts_round_trips(tmp_path):
+    tokenizer = CallableTokenizer()
+    prompts = ["a b c", "", "d", "a d e f"]
+
+    tokens = build_tokenized_prompts(str(tmp_path / "split"), prompts, tokenizer)
+
+    assert len(tokens) == 4
+    assert [tokens[i].tolist() for i in range(4)] == [tokenizer.encode(p) for p in prompts]
+    assert tokens.lengths().tolist() == [3, 0, 1, 4]
+    assert isinstance(tokens.ids, np.memmap)
+    assert not [name for name in os.listdir(tmp_path) if name.startswith(".tokenizing-")]
+
+def test_build_tokenized_prompts_handles_empty_split(tmp_path):
+    tokens = build_tokenized_prompts(str(tmp_path / "split"), [], CallableTokenizer())
+    assert len(tokens) == 0
+
+def test_load_tokenized_prompts_reuses_cache_until_inputs_change(tmp_path):
+    tokenizer = CallableTokenizer()
+    items = [{"schema": "s", "question": "q one"}, {"schema": "s", "question": "q two three"}]
+    build_prompt = lambda item: "{schema} {question}".format(**item)
+
+    first = load_tokenized_prompts(FakeStreamingDataset(items), tokenizer, "{schema} {question}", build_prompt, str(tmp_path))
+    second = load_tokenized_prompts(FakeStreamingDataset(items), tokenizer, "{schema} {question}", build_prompt, str(tmp_path))
+    assert tokenizer.calls == 1
+    assert second.directory == first.directory
+    assert second[1].tolist() == tokenizer.encode("s q two three")
+
+    changed_data = load_tokenized_prompts(FakeStreamingDataset(items, "v2"), tokenizer, "{schema} {question}", build_prompt, str(tmp_path))
+    changed_template = load_tokenized_prompts(FakeStreamingDataset(items), tokenizer, "{question}", build_prompt, str(tmp_path))
+    assert tokenizer.calls == 3
+    assert len({first.directory, changed_data.directory, changed_template.directory}) == 3
+
+def test_generate_batched_accepts_token_ids():
+    tokenizer = FakeTokenizer()
+    encoded = tokenizer.encode("select name")
+
+    assert list(generate_batched(EchoLastTokenModel(), tokenizer, [np.array(encoded)], batch_size=2, device="cpu")) == [(0, "name")]
+
+class IdTokenizer:
+    pad_token_id = 0
+
+    def batch_decode(self, sequences, skip_special_tokens):
+        return [" ".join(str(int(t)) for t in row) for row in sequences]
+
+def test_prefix_cached_generation_matches_uncached_generation():
+    from transformers import GPT2Config, GPT2LMHeadModel
+    from sudo_sql.pipeline.prefix_cache import PrefixCachedGenerator
+
+    torch.manual_seed(0)
+    model = GPT2LMHeadModel(GPT2Config(n_layer=2, n_embd=32, n_head=2, vocab_size=50, n_positions=64)).eval()
+    prefix = [5, 6, 7, 8, 9, 10]
+    # Suffixes of different lengths batch together; one prompt only shares part of the prefix.
+    prompts = [prefix + [11, 12], prefix + [13, 14, 16, 17], prefix[:-1] + [20, 21, 22], prefix + [15]]
+
+    generator = PrefixCachedGenerator(model, IdTokenizer(), "cpu", batch_size=4, max_new_tokens=4, do_sample=False)
+    generate = model.generate
+    batch_sizes = []
+    model.generate = lambda input_ids, **kwargs: batch_sizes.append(len(input_ids)) or generate(input_ids, **kwargs)
+    cached = dict(generator.generate(prefix, prompts))
+    model.generate = generate
+    assert sorted(batch_sizes) == [1, 3]
+    cached.update({index + len(prompts): text for index, text in generator.generate(prefix, prompts[:1])})
+
+    expected = {}
+    for index, ids in enumerate(prompts + prompts[:1]):
+        input_ids = torch.tensor([ids])
+        output = model.generate(input_ids, attention_mask=torch.ones_like(input_ids), pad_token_id=0, max_new_tokens=4, do_sample=False)
+        expected[index] = " ".join(str(int(t)) for t in output[0, len(ids):])
+
+    assert cached == expected
+    assert generator.prefills == 1
+
+class ScriptedModel:
+    """Generates scripted continuations token by token, honouring stopping criteria like `generate` does."""
+    def __init__(self, tokenizer, continuations):
+        self.continuations = [tokenizer.encode(text) for text in continuations]
+        self.steps = 0
+
+    def generate(self, input_ids, attention_mask, pad_token_id, max_new_tokens, stopping_criteria=(), num_return_sequences=1, **kwargs):
+        input_ids = input_ids.repeat_interleave(num_return_sequences, dim=0)
+        finished = torch.zeros(input_ids.shape[0], dtype=torch.bool)
+        for step in range(max_new_tokens):
+            next_tokens = torch.tensor([
+                pad_token_id if done or step >= len(self.continuations[row]) else self.continuations[row][step]
+                for row, done in enumerate(finished.tolist())
+            ])
+            input_ids = torch.cat([input_ids, next_tokens[:, None]], dim=1)
+            self.steps += 1
+            for criteria in stopping_criteria:
+                finished |= criteria(input_ids, None)
+            if finished.all():
+                break
+        return input_ids
+
+def test_generate_batched_stops_at_complete_sql():
+    from sudo_sql.telemetry import telemetry
+
+    telemetry.reset()
+    tokenizer = FakeTokenizer()
+    model = ScriptedModel(tokenizer, [
+        "SELECT a FROM t ; This query returns every a . " + "more " * 20,
+        "Sure , here it is : SELECT b FROM u WHERE c = ';' ; Explanation follows " + "more " * 20,
+    ])
+    results = dict(generate_batched(model, tokenizer, ["q1", "q2"], batch_size=2, device="cpu", stop_at_sql=True, max_new_tokens=40))
+
+    assert results == {0: "SELECT a FROM t", 1: "SELECT b FROM u WHERE c = ';'"}
+    # The batch ends once both sequences are done: after the 15th token of the second one.
+    assert model.steps == 15
+    counters = telemetry.summary()["counters"]
+    assert counters["stream.requests"] == 2
+    assert counters["stream.early_stops"] == 2
+    assert counters["tokens.saved_upper_bound"] == (40 - 5) + (40 - 15)
+
+def test_generate_batched_groups_candidates_by_prompt():
+    tokenizer = FakeTokenizer()
+    model = ScriptedModel(tokenizer, ["SELECT 1 ;", "SELECT 2 ;", "SELECT 3 ;", "SELECT 4 ;"])
+    results = dict(generate_batched(model, tokenizer, ["q1", "q2"], batch_size=2, device="cpu", stop_at_sql=True, candidates=2, max_new_tokens=10))
+
+    assert results == {0: ["SELECT 1", "SELECT 2"], 1: ["SELECT 3", "SELECT 4"]}
@@ -0,0 +1,36 @@
+import os
+import sys
+import json
+import sqlite3
+
+sys.path.insert(0, ".")
+from benchmarks.fixtures import generate_fixtures
+from benchmarks.harness import time_stage, compare
+
+def test_fixtures_are_valid_and_reused(tmp_path):
+    manifest = generate_fixtures(str(tmp_path), databases=3, questions=30, rows=20, seed=1)
+
+    with open(os.path.join(manifest["spider"], "dev.json")) as f:
+        items = json.load(f)
+    assert len(items) == 30 and len({item["db_id"] for item in items}) == 3
+    for item in items:
+        con = sqlite3.connect(os.path.join(manifest["spider"], "database", item["db_id"], f"{item['db_id']}.sqlite"))
+        con.execute(item["query"]).fetchall()
+        con.close()
+
+    with open(os.path.join(manifest["bird"], "dev_synthetic", "dev.json")) as f:
+        assert [item["SQL"] for item in json.load(f)] == [item["query"] for item in items]
+
+    mtime = os.path.getmtime(os.path.join(manifest["spider"], "dev.json"))
+    assert generate_fixtures(str(tmp_path), databases=3, questions=30, rows=20, seed=1) == manifest
+    assert os.path.getmtime(os.path.join(manifest["spider"], "dev.json")) == mtime
+
+def test_time_stage_and_compare():
+    calls = []
+    summary = time_stage("noop", 10, lambda: calls.append(1), repeats=3, warmup=2).summary()
+
+    assert len(calls) == 5 and len(summary["runs"]) == 3
+    assert summary["min"] <= summary["median"] <= summary["max"]
+
+    lines = compare({"stages": [summary]}, {"stages": [{**summary, "median": summary["median"] * 2}]})
+    assert lines[0].startswith("noop") and "x0.50" in lines[0]
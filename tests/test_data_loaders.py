@@ -1,15 +1,29 @@
 import pytest
 import os
-import time
+import json
+import shutil
+import sqlite3
 from unittest.mock import patch, MagicMock
 
 from sudo_sql.data_loaders.base import BaseDataLoader
+from sudo_sql.data_loaders.spider import SpiderLoader
+from sudo_sql.data_loaders.streaming import StreamingDataset, iter_json_array
+from sudo_sql.data_loaders.schema_cache import SchemaCache
+from sudo_sql.cache import SQLiteCacheStore
 
 # A concrete implementation for testing the abstract BaseDataLoader's methods
 class ConcreteLoader(BaseDataLoader):
+    dataset_name = "test_ds"
+
     def load_data(self, split: str, schema_type: str, use_cache: bool) -> list:
         return []
 
+    def iter_data(self, split: str, schema_type: str, use_cache: bool):
+        return iter([])
+
+    def list_databases(self, split: str) -> dict:
+        return {}
+
 @pytest.fixture
 def loader(tmp_path):
     """Provides a concrete loader instance and a temporary data path."""
@@ -30,12 +44,18 @@ def mock_d_schema():
             
             yield mock_parser_cls, mock_generator_cls
 
+def _make_db(path, table="t"):
+    con = sqlite3.connect(path)
+    con.execute(f"CREATE TABLE {table} (id INTEGER)")
+    con.commit()
+    con.close()
+
 @patch('os.getcwd')
 def test_cache_miss(mock_getcwd, loader, tmp_path, mock_d_schema):
-    """Test that d-schema is called and a cache file is created when no cache exists."""
+    """Test that d-schema is called and the schema is stored when no cache entry exists."""
     mock_getcwd.return_value = str(tmp_path)
     db_path = tmp_path / "test.db"
-    db_path.touch()
+    _make_db(db_path)
 
     schema = loader._get_schema(str(db_path), "ddl-schema", True, "test_ds", "test_db")
 
@@ -43,25 +63,18 @@ def test_cache_miss(mock_getcwd, loader, tmp_path, mock_d_schema):
     mock_d_schema[0].assert_called_once()
     mock_d_schema[1].assert_called_once()
 
-    cache_path = tmp_path / "cache/schemas/test_ds/test_db/ddl-schema.txt"
-    assert cache_path.exists()
-    assert cache_path.read_text() == "generated_ddl_schema"
+    cache = SchemaCache(str(tmp_path / "cache/schemas.sqlite"))
+    assert cache.get(cache.key(str(db_path), "ddl-schema")) == "generated_ddl_schema"
 
 @patch('os.getcwd')
 def test_cache_hit(mock_getcwd, loader, tmp_path, mock_d_schema):
     """Test that the cached schema is used and d-schema is not called when cache is valid."""
     mock_getcwd.return_value = str(tmp_path)
     db_path = tmp_path / "test.db"
-    db_path.touch()
+    _make_db(db_path)
 
-    cache_dir = tmp_path / "cache/schemas/test_ds/test_db"
-    cache_dir.mkdir(parents=True)
-    cache_path = cache_dir / "ddl-schema.txt"
-    cache_path.write_text("cached_schema")
-    time.sleep(0.1)
-    db_path.touch() # Make sure db is older
-    time.sleep(0.1)
-    cache_path.touch() # Make sure cache is newer
+    cache = SchemaCache(str(tmp_path / "cache/schemas.sqlite"))
+    cache.put(cache.key(str(db_path), "ddl-schema"), "cached_schema")
 
     schema = loader._get_schema(str(db_path), "ddl-schema", True, "test_ds", "test_db")
 
@@ -70,39 +83,278 @@ def test_cache_hit(mock_getcwd, loader, tmp_path, mock_d_schema):
     mock_d_schema[1].assert_not_called()
 
 @patch('os.getcwd')
-def test_stale_cache(mock_getcwd, loader, tmp_path, mock_d_schema):
-    """Test that d-schema is called and cache is updated when cache is stale."""
+def test_cache_hit_after_copy(mock_getcwd, loader, tmp_path, mock_d_schema):
+    """Test that a copied database (new path and mtime, same contents) still hits the cache."""
     mock_getcwd.return_value = str(tmp_path)
-    cache_dir = tmp_path / "cache/schemas/test_ds/test_db"
-    cache_dir.mkdir(parents=True)
-    cache_path = cache_dir / "ddl-schema.txt"
-    cache_path.write_text("stale_schema")
+    db_path = tmp_path / "test.db"
+    _make_db(db_path)
+    loader._get_schema(str(db_path), "ddl-schema", True, "test_ds", "test_db")
+
+    copied_path = tmp_path / "copy" / "test.db"
+    copied_path.parent.mkdir()
+    shutil.copyfile(db_path, copied_path)
 
-    time.sleep(0.1)
+    schema = loader._get_schema(str(copied_path), "ddl-schema", True, "test_ds", "test_db")
+
+    assert schema == "generated_ddl_schema"
+    mock_d_schema[0].assert_called_once()
 
+@patch('os.getcwd')
+def test_stale_cache(mock_getcwd, loader, tmp_path, mock_d_schema):
+    """Test that d-schema is called again when the database contents change."""
+    mock_getcwd.return_value = str(tmp_path)
     db_path = tmp_path / "test.db"
-    db_path.touch()
+    _make_db(db_path)
+
+    cache = SchemaCache(str(tmp_path / "cache/schemas.sqlite"))
+    cache.put(cache.key(str(db_path), "ddl-schema"), "stale_schema")
+
+    _make_db(db_path, table="new_table")
 
     schema = loader._get_schema(str(db_path), "ddl-schema", True, "test_ds", "test_db")
 
     assert schema == "generated_ddl_schema"
     mock_d_schema[0].assert_called_once()
     mock_d_schema[1].assert_called_once()
-    assert cache_path.read_text() == "generated_ddl_schema"
+    assert cache.get(cache.key(str(db_path), "ddl-schema")) == "generated_ddl_schema"
 
 @patch('os.getcwd')
 def test_cache_disabled(mock_getcwd, loader, tmp_path, mock_d_schema):
     """Test that d-schema is called even if a valid cache exists when use_cache=False."""
     mock_getcwd.return_value = str(tmp_path)
     db_path = tmp_path / "test.db"
-    db_path.touch()
+    _make_db(db_path)
 
-    cache_dir = tmp_path / "cache/schemas/test_ds/test_db"
-    cache_dir.mkdir(parents=True)
-    cache_path = cache_dir / "ddl-schema.txt"
-    cache_path.write_text("cached_schema")
+    cache = SchemaCache(str(tmp_path / "cache/schemas.sqlite"))
+    cache.put(cache.key(str(db_path), "ddl-schema"), "cached_schema")
 
     schema = loader._get_schema(str(db_path), "ddl-schema", False, "test_ds", "test_db")
 
     assert schema == "generated_ddl_schema"
     mock_d_schema[0].assert_called_once()
+
+def test_cache_key_depends_on_generator_version(tmp_path):
+    """Test that a d-schema upgrade does not serve schemas built by the old version."""
+    db_path = tmp_path / "test.db"
+    _make_db(db_path)
+    cache = SchemaCache(str(tmp_path / "schemas.sqlite"))
+    old_key = cache.key(str(db_path), "ddl-schema")
+
+    cache.generator_version = "999.0"
+
+    assert cache.key(str(db_path), "ddl-schema") != old_key
+    assert cache.key(str(db_path), "ddl-schema", {"profile": True}) != cache.key(str(db_path), "ddl-schema")
+
+def test_cache_store_evicts_least_recently_used(tmp_path):
+    store = SQLiteCacheStore(str(tmp_path / "store.sqlite"), max_bytes=10, access_resolution=0)
+    store.put_text("a", "xxxx")
+    store.put_text("b", "xxxx")
+    store.get_text("a")
+    store.put_text("c", "xxxx")
+
+    assert store.get_text("a") == "xxxx"
+    assert store.get_text("b") is None
+    assert store.get_text("c") == "xxxx"
+    assert store.total_bytes() == 8
+
+def test_cache_store_hits_refresh_access_time_coarsely(tmp_path):
+    store = SQLiteCacheStore(str(tmp_path / "store.sqlite"), access_resolution=60)
+    with patch("sudo_sql.cache.store.time.time", return_value=1000.0):
+        store.put_text("a", "xxxx")
+    changes = store._con.total_changes
+
+    with patch("sudo_sql.cache.store.time.time", return_value=1030.0):
+        assert [store.get_text("a") for _ in range(100)] == ["xxxx"] * 100
+    assert store._con.total_changes == changes
+
+    with patch("sudo_sql.cache.store.time.time", return_value=1060.0):
+        store.get_text("a")
+        store.get_text("a")
+    assert store._con.total_changes == changes + 1
+    assert store._con.execute("SELECT accessed FROM entries").fetchone()[0] == 1060.0
+
+@patch('os.getcwd')
+def test_resolve_schemas_generates_each_database_once(mock_getcwd, tmp_path, mock_d_schema):
+    """Test that schemas are resolved once per distinct database and served from cache afterwards."""
+    mock_getcwd.return_value = str(tmp_path)
+    loader = ConcreteLoader(data_path=str(tmp_path), num_workers=1)
+    databases = {}
+    for db_id in ("db_a", "db_b"):
+        db_path = tmp_path / f"{db_id}.sqlite"
+        _make_db(db_path, table=db_id)
+        databases[db_id] = str(db_path)
+
+    schemas = loader._resolve_schemas(databases, "ddl-schema", True)
+
+    assert schemas == {"db_a": "generated_ddl_schema", "db_b": "generated_ddl_schema"}
+    assert mock_d_schema[0].call_count == 2
+
+    assert loader._resolve_schemas(databases, "ddl-schema", True) == schemas
+    assert mock_d_schema[0].call_count == 2
+
+@patch('os.getcwd')
+def test_spider_loader_shares_schema_across_questions(mock_getcwd, tmp_path, mock_d_schema):
+    """Test that questions on the same database trigger a single schema generation."""
+    mock_getcwd.return_value = str(tmp_path)
+    questions = [
+        {"db_id": "concert_singer", "question": f"Question {i}", "query": "SELECT 1"} for i in range(5)
+    ]
+    (tmp_path / "dev.json").write_text(json.dumps(questions))
+    db_dir = tmp_path / "database" / "concert_singer"
+    db_dir.mkdir(parents=True)
+    (db_dir / "concert_singer.sqlite").touch()
+
+    data = SpiderLoader(str(tmp_path), num_workers=1).load_data("dev", "ddl-schema", False)
+
+    assert len(data) == 5
+    assert all(item['schema'] == "generated_ddl_schema" for item in data)
+    mock_d_schema[0].assert_called_once()
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 1 << 16])
+def test_iter_json_array_matches_json_load(tmp_path, chunk_size):
+    """Test that the incremental parser yields the same elements as json.load, whatever the chunk size."""
+    data = [
+        {"db_id": "a", "question": "What's the \"max\", [1, 2]?", "query": "SELECT 1"},
+        12345,
+        [1.5, None, True],
+        "a string with , and ] inside",
+        {"nested": {"list": [{"x": 1}]}},
+    ]
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps(data, indent=2))
+
+    assert list(iter_json_array(str(path), chunk_size=chunk_size)) == data
+
+@pytest.mark.parametrize("text", [
+    '[123, -0.5, 1.5e3, 7]',
+    '[-0, 10.25, 1E-2, 99999999999999999999]',
+    '[ 1 , [2.5, -3] , {"n": 40.0} , 6 ]',
+    '[{"db_id": "a", "question": "Top 10?", "query": "SELECT 1"}, 3.14159, true, null, "x"]',
+])
+def test_iter_json_array_splits_numbers_at_any_offset(tmp_path, text):
+    """Test that every offset can be a chunk boundary, including inside top-level numbers."""
+    path = tmp_path / "data.json"
+    path.write_text(text)
+
+    for chunk_size in range(1, len(text) + 2):
+        assert list(iter_json_array(str(path), chunk_size=chunk_size)) == json.loads(text), chunk_size
+
+def test_iter_json_array_empty(tmp_path):
+    path = tmp_path / "empty.json"
+    path.write_text(" [ ] ")
+    assert list(iter_json_array(str(path))) == []
+
+@patch('os.getcwd')
+def test_spider_iter_data_resolves_schemas_lazily(mock_getcwd, tmp_path, mock_d_schema):
+    """Test that streaming yields items before later databases are resolved, and each database once."""
+    mock_getcwd.return_value = str(tmp_path)
+    questions = [
+        {"db_id": db_id, "question": f"{db_id} question {i}", "query": "SELECT 1"}
+        for db_id in ("db_a", "db_b") for i in range(3)
+    ]
+    (tmp_path / "dev.json").write_text(json.dumps(questions))
+    for db_id in ("db_a", "db_b"):
+        (tmp_path / "database" / db_id).mkdir(parents=True)
+        (tmp_path / "database" / db_id / f"{db_id}.sqlite").touch()
+
+    items = SpiderLoader(str(tmp_path), num_workers=1).iter_data("dev", "ddl-schema", False)
+
+    first = next(items)
+    assert first['question'] == "db_a question 0"
+    assert mock_d_schema[0].call_count == 1
+
+    rest = list(items)
+    assert len(rest) == 5
+    assert mock_d_schema[0].call_count == 2
+
+@patch('os.getcwd')
+def test_fingerprint_changes_with_databases(mock_getcwd, loader, tmp_path):
+    mock_getcwd.return_value = str(tmp_path)
+    db_path = tmp_path / "test.db"
+    _make_db(db_path)
+    loader.list_databases = lambda split: {"test_db": str(db_path)}
+
+    before = loader.fingerprint("dev", "ddl-schema")
+    assert loader.fingerprint("dev", "ddl-schema") == before
+    assert loader.fingerprint("train", "ddl-schema") != before
+
+    con = sqlite3.connect(db_path)
+    con.execute("CREATE TABLE other (id INTEGER)")
+    con.commit()
+    con.close()
+    assert loader.fingerprint("dev", "ddl-schema") != before
+
+def _make_spider_split(tmp_path, db_ids=("db_a", "db_b"), per_db=3):
+    questions = [
+        {"db_id": db_id, "question": f"{db_id} question {i}", "query": f"SELECT {i}"}
+        for db_id in db_ids for i in range(per_db)
+    ]
+    (tmp_path / "dev.json").write_text(json.dumps(questions))
+    for db_id in db_ids:
+        (tmp_path / "database" / db_id).mkdir(parents=True, exist_ok=True)
+        _make_db(tmp_path / "database" / db_id / f"{db_id}.sqlite", table=db_id)
+
+def _spider_loader(tmp_path, generated):
+    loader = SpiderLoader(str(tmp_path), num_workers=1, dataset_cache_dir=str(tmp_path / "cache/datasets"))
+
+    def generate(db_path, schema_type):
+        generated.append(db_path)
+        return f"schema of {os.path.basename(db_path)}"
+
+    loader._generate_schema_with_d_schema = generate
+    return loader
+
+@patch('os.getcwd')
+def test_preprocessed_split_matches_iter_data(mock_getcwd, tmp_path):
+    """Test that the Arrow copy yields the loader's items, storing each schema once."""
+    mock_getcwd.return_value = str(tmp_path)
+    _make_spider_split(tmp_path)
+    generated = []
+    loader = _spider_loader(tmp_path, generated)
+
+    expected = list(loader.iter_data("dev", "ddl-schema", True))
+    preprocessed = loader.preprocessed("dev", "ddl-schema", True)
+
+    assert len(preprocessed) == 6
+    assert list(preprocessed) == expected
+    assert preprocessed[4] == expected[4]
+    assert "schema" not in preprocessed.items.column_names
+    assert preprocessed.meta["databases"] == 2
+    assert preprocessed.fingerprint == loader.fingerprint("dev", "ddl-schema")
+
+    dataset = StreamingDataset(loader, "dev", "ddl-schema", True)
+    assert list(dataset) == expected
+    assert dataset.fingerprint() == preprocessed.fingerprint
+
+@patch('os.getcwd')
+def test_preprocessed_split_rebuilds_when_sources_change(mock_getcwd, tmp_path):
+    """Test that the Arrow copy is reused until the split's JSON or a database changes."""
+    mock_getcwd.return_value = str(tmp_path)
+    _make_spider_split(tmp_path)
+    generated = []
+    loader = _spider_loader(tmp_path, generated)
+    first = loader.preprocessed("dev", "ddl-schema", False)
+    assert len(generated) == 2
+
+    # Reopening, or touching a file without changing it, does not rebuild.
+    os.utime(tmp_path / "dev.json", ns=(0, 0))
+    reopened = _spider_loader(tmp_path, generated).preprocessed("dev", "ddl-schema", False)
+    assert len(generated) == 2
+    assert reopened.fingerprint == first.fingerprint
+
+    questions = json.loads((tmp_path / "dev.json").read_text())
+    questions.append({"db_id": "db_a", "question": "A new question", "query": "SELECT 9"})
+    (tmp_path / "dev.json").write_text(json.dumps(questions))
+    edited = _spider_loader(tmp_path, generated).preprocessed("dev", "ddl-schema", False)
+    assert len(edited) == 7
+    assert len(generated) == 4
+    assert edited.fingerprint != first.fingerprint
+
+    con = sqlite3.connect(tmp_path / "database" / "db_b" / "db_b.sqlite")
+    con.execute("CREATE TABLE other (id INTEGER)")
+    con.commit()
+    con.close()
+    rebuilt = _spider_loader(tmp_path, generated).preprocessed("dev", "ddl-schema", False)
+    assert len(generated) == 6
+    assert rebuilt.fingerprint != edited.fingerprint
+    assert list(rebuilt) == list(_spider_loader(tmp_path, []).iter_data("dev", "ddl-schema", False))
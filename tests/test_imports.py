@@ -0,0 +1,49 @@
+import os
+import sys
+import json
+import subprocess
+
+HEAVY_MODULES = ["torch", "transformers", "trl", "d_schema"]
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A generous bound: CI machines are slow, but importing the ML stack takes seconds.
+IMPORT_BUDGET_SECONDS = 2.0
+
+def _run(code: str) -> dict:
+    """
+    Runs `code` in a fresh interpreter and returns the JSON it prints.
+    """
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def test_cli_import_skips_heavy_dependencies():
+    report = _run(
+        "import sys, json, time\n"
+        "start = time.perf_counter()\n"
+        "import main\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"print(json.dumps({{'elapsed': elapsed, 'loaded': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))\n"
+    )
+    assert report["loaded"] == []
+    assert report["elapsed"] < IMPORT_BUDGET_SECONDS
+
+def test_api_inference_pipeline_skips_heavy_dependencies():
+    report = _run(
+        "import sys, json\n"
+        "from sudo_sql.pipeline import get_pipeline_class\n"
+        "from sudo_sql.models import get_provider_class\n"
+        "pipeline = get_pipeline_class('infer')({'mode': 'infer', 'model': {'provider': 'openai'}})\n"
+        "get_provider_class('openai')\n"
+        f"print(json.dumps({{'loaded': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))\n"
+    )
+    assert report["loaded"] == []
+
+def test_importing_the_package_opens_no_log_file(tmp_path):
+    report = _run(
+        "import os, sys, json\n"
+        f"sys.path.insert(0, {ROOT!r})\n"
+        f"os.chdir({str(tmp_path)!r})\n"
+        "import sudo_sql.logger_config, sudo_sql.pipeline\n"
+        "print(json.dumps({'logs': os.path.exists('logs')}))\n"
+    )
+    assert report["logs"] is False
@@ -1,7 +1,7 @@
 import pytest
 import yaml
 import json
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from typer.testing import CliRunner
 import sys
 import os
@@ -40,7 +40,8 @@ def mock_logger():
 
 @pytest.fixture
 def mock_openai_provider():
-    with patch('sudo_sql.pipeline.inference.OpenAIProvider') as mock_provider_cls:
+    mock_provider_cls = MagicMock()
+    with patch('sudo_sql.pipeline.inference.get_provider_class', return_value=mock_provider_cls):
         mock_provider_instance = mock_provider_cls.return_value
         mock_provider_instance.generate.return_value = "mocked_sql_result"
         yield mock_provider_instance
@@ -49,13 +50,14 @@ def mock_openai_provider():
 def mock_data_loader():
     with patch('sudo_sql.pipeline.base.get_data_loader') as mock_get_loader:
         mock_loader_instance = MagicMock()
-        mock_loader_instance.load_data.return_value = MOCK_DATASET
+        mock_loader_instance.iter_data.side_effect = lambda *args, **kwargs: iter(MOCK_DATASET)
+        mock_loader_instance.dataset_cache_dir = None
         mock_get_loader.return_value = mock_loader_instance
         yield mock_get_loader
 
 @pytest.fixture
 def create_config(tmp_path):
-    def _create_config(save_mode):
+    def _create_config(save_mode, **inference_options):
         config_path = tmp_path / "test_config.yaml"
         config_data = {
             'mode': 'infer',
@@ -66,6 +68,7 @@ def create_config(tmp_path):
                 'split': 'dev',
                 'schema_type': 'ddl-schema',
                 'use_cache': False,
+                **inference_options,
                 'output': {
                     'save_path': str(tmp_path),
                     'save_mode': save_mode
@@ -143,3 +146,105 @@ def test_resume_mode_with_no_file(create_config, tmp_path, mock_data_loader, moc
     assert expected_file.exists()
     with open(expected_file, 'r') as f:
         assert len(f.readlines()) == 2
+
+def test_concurrent_mode_writes_results_as_they_complete(create_config, tmp_path, mock_data_loader, mock_openai_provider):
+    """Tests that max_concurrency > 1 routes through generate_many and records every result."""
+    async def fake_generate_many(prompts, max_concurrency, candidates=1):
+        prompts = list(prompts)
+        assert max_concurrency == 4
+        # Complete out of order to make sure results are matched back by index
+        for index in reversed(range(len(prompts))):
+            yield index, f"sql_{index}"
+
+    mock_openai_provider.generate_many = fake_generate_many
+    mock_openai_provider.aclose = AsyncMock()
+
+    config_file = create_config(save_mode="resume", max_concurrency=4)
+    runner = CliRunner()
+    result = runner.invoke(app, ["infer", "--config", config_file])
+
+    assert result.exit_code == 0
+    mock_openai_provider.generate.assert_not_called()
+    mock_openai_provider.aclose.assert_awaited_once()
+
+    with open(tmp_path / "test_ds_dev_TestModel.jsonl", 'r') as f:
+        results = [json.loads(line) for line in f]
+    assert [r['generated_sql'] for r in results] == ["sql_1", "sql_0"]
+    assert results[0]['question'].startswith("Question 2")
+    assert results[1]['question'].startswith("Question 1")
+
+def test_run_exports_telemetry(create_config, tmp_path, mock_data_loader, mock_openai_provider):
+    """Tests that a run writes a telemetry summary next to its results, and Prometheus metrics when asked."""
+    config_path = create_config("overwrite")
+    with open(config_path) as f:
+        config = yaml.safe_load(f)
+    config['telemetry'] = {'prometheus_path': str(tmp_path / "metrics.prom")}
+    with open(config_path, 'w') as f:
+        yaml.dump(config, f)
+
+    result = CliRunner().invoke(app, ["infer", "--config", config_path])
+    assert result.exit_code == 0
+
+    summary_files = list(tmp_path.glob("*.telemetry.json"))
+    assert len(summary_files) == 1
+    summary = json.loads(summary_files[0].read_text())
+    assert summary['counters']['items.completed'] == len(MOCK_DATASET)
+    assert summary['spans']['results.write']['count'] == len(MOCK_DATASET)
+    assert summary['spans']['dataset.next']['count'] == len(MOCK_DATASET)
+    assert 'sudo_sql_items_completed_total 2' in (tmp_path / "metrics.prom").read_text()
+
+def test_sharded_runs_partition_the_split_and_merge(create_config, tmp_path, mock_data_loader, mock_openai_provider):
+    """Tests that every shard writes its own resumable file and that merging restores split order."""
+    config_file = create_config(save_mode="resume")
+    runner = CliRunner()
+    for shard_index in (1, 0):
+        result = runner.invoke(app, ["infer", "--config", config_file, "--shard-index", str(shard_index), "--num-shards", "2"])
+        assert result.exit_code == 0
+
+    shard_files = [tmp_path / f"test_ds_dev_TestModel.shard-00{i}-of-002.jsonl" for i in range(2)]
+    for shard_file, question in zip(shard_files, ["Question 1", "Question 2"]):
+        with open(shard_file) as f:
+            results = [json.loads(line) for line in f]
+        assert len(results) == 1 and results[0]['question'].startswith(question)
+
+    merged = tmp_path / "merged.jsonl"
+    result = runner.invoke(app, ["merge", *map(str, reversed(shard_files)), "--output", str(merged)])
+    assert result.exit_code == 0
+    assert "Merged 2 results from 2 files" in result.output
+    with open(merged) as f:
+        assert [json.loads(line)['question'][:10] for line in f] == ["Question 1", "Question 2"]
+
+def test_invalid_shard_is_rejected(create_config, mock_data_loader, mock_openai_provider):
+    config_file = create_config(save_mode="resume")
+    result = CliRunner().invoke(app, ["infer", "--config", config_file, "--shard-index", "2", "--num-shards", "2"])
+    assert result.exit_code != 0
+    assert isinstance(result.exception, ValueError)
+
+def test_length_balanced_shards():
+    from sudo_sql.pipeline.sharding import balance_by_length, shard_filter
+
+    lengths = [10, 90, 40, 60, 50, 50]
+    shards = balance_by_length(lengths, 2)
+    assert shards == balance_by_length(lengths, 2)
+    assert [sum(length for length, shard in zip(lengths, shards) if shard == s) for s in range(2)] == [150, 150]
+
+    dataset = [{'question': 'q', 'schema': 'x' * length} for length in lengths]
+    filters = [shard_filter(dataset, s, 2, balance="length") for s in range(2)]
+    assert all(filters[0](i) != filters[1](i) for i in range(len(lengths)))
+    assert shard_filter(dataset, 0, 1) is None
+
+def test_voting_samples_candidates_and_stores_the_vote(create_config, tmp_path, mock_data_loader, mock_openai_provider):
+    """Tests that inference.voting samples several candidates per question and records the vote."""
+    mock_openai_provider.generate_candidates.return_value = ["SELECT 1", "select 1;", "SELECT 2"]
+
+    config_file = create_config(save_mode="resume", voting={'candidates': 3, 'timeout': 1})
+    result = CliRunner().invoke(app, ["infer", "--config", config_file])
+
+    assert result.exit_code == 0
+    mock_openai_provider.generate.assert_not_called()
+    assert mock_openai_provider.generate_candidates.call_args.args[1] == 3
+    with open(tmp_path / "test_ds_dev_TestModel.jsonl", 'r') as f:
+        results = [json.loads(line) for line in f]
+    # The mock databases do not exist, so the most frequent query wins.
+    assert [r['generated_sql'] for r in results] == ["SELECT 1", "SELECT 1"]
+    assert results[0]['votes'] == 2 and results[0]['candidates'] == 3 and results[0]['distinct_candidates'] == 2
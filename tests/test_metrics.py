@@ -0,0 +1,375 @@
+import os
+import sys
+import json
+import sqlite3
+import threading
+import pytest
+from typer.testing import CliRunner
+
+from sudo_sql.database import ConnectionManager, QueryExecutor, get_connection, get_executor, has_order_by
+from sudo_sql.evaluation.metrics import execution_accuracy, execution_outcome, exact_match_score
+from sudo_sql.environments.sql_execution import SQLExecutionEnvironment
+
+sys.path.insert(0, ".")
+from sudo_sql.evaluation.runner import evaluate_results, _indexed_shards, _scanned_shards
+from sudo_sql.results import ResultsStore, make_item_id
+from main import app
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "singers.sqlite"
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE singer (id INTEGER PRIMARY KEY, name TEXT, age INTEGER)")
+    con.executemany("INSERT INTO singer (name, age) VALUES (?, ?)", [("Ann", 30), ("Bob", 41), ("Cid", 30)])
+    con.commit()
+    con.close()
+    return str(path)
+
+def test_exact_match_ignores_case_whitespace_and_semicolon():
+    assert exact_match_score("SELECT  count(*)\nFROM singer;", "select count(*) from singer") == 1
+    assert exact_match_score("SELECT name FROM singer", "SELECT age FROM singer") == 0
+
+def test_execution_accuracy(db_path):
+    assert execution_accuracy("SELECT name FROM singer WHERE age = 30", "SELECT name FROM singer WHERE age < 40", db_path) == 1
+    assert execution_accuracy("SELECT name FROM singer", "SELECT name FROM singer WHERE age = 30", db_path) == 0
+    assert execution_accuracy("SELECT nope FROM singer", "SELECT name FROM singer", db_path) == 0
+
+def test_generated_sql_cannot_modify_database(db_path):
+    assert execution_accuracy("DROP TABLE singer", "SELECT 1", db_path) == 0
+    observation, reward = SQLExecutionEnvironment(db_path).step("UPDATE singer SET age = 0")
+    assert reward == -1.0
+
+    con = sqlite3.connect(db_path)
+    assert con.execute("SELECT count(*) FROM singer WHERE age > 0").fetchone() == (3,)
+    con.close()
+
+def test_attach_is_denied(db_path, tmp_path):
+    con = ConnectionManager().get(db_path)
+    with pytest.raises(sqlite3.DatabaseError):
+        con.execute(f"ATTACH DATABASE '{tmp_path / 'other.sqlite'}' AS other")
+
+def test_connections_are_pooled_per_thread(db_path):
+    manager = ConnectionManager()
+    con = manager.get(db_path)
+    assert manager.get(db_path) is con
+
+    other_thread = {}
+    thread = threading.Thread(target=lambda: other_thread.setdefault("con", manager.get(db_path)))
+    thread.start()
+    thread.join()
+    assert other_thread["con"] is not con
+
+    manager.close()
+    assert manager.get(db_path) is not con
+
+def test_missing_database_raises(tmp_path):
+    with pytest.raises(sqlite3.OperationalError):
+        get_connection(str(tmp_path / "missing.sqlite"))
+
+INFINITE_QUERY = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT count(*) FROM c"
+
+def test_runaway_query_times_out(db_path):
+    executor = QueryExecutor(timeout=0.2)
+
+    result = executor.execute(db_path, INFINITE_QUERY)
+
+    assert result.status == "timeout"
+    assert result.elapsed < 2
+    # The pooled connection is still usable afterwards
+    assert executor.execute(db_path, "SELECT count(*) FROM singer").rows == [(3,)]
+
+def test_timeouts_are_reported_distinctly(db_path):
+    executor = QueryExecutor(timeout=0.2)
+    assert execution_outcome(INFINITE_QUERY, "SELECT 1", db_path, executor) == "timeout"
+    assert execution_outcome("SELECT nope", "SELECT 1", db_path, executor) == "error"
+    assert execution_outcome("SELECT 1", "SELECT nope", db_path, executor) == "gold_error"
+
+    env = SQLExecutionEnvironment(db_path, executor=executor, timeout_reward=-0.5)
+    observation, reward = env.step(INFINITE_QUERY)
+    assert observation.startswith("Timeout")
+    assert reward == -0.5
+    assert env.timeouts == 1
+
+def test_results_compare_as_multisets_unless_the_gold_query_is_ordered(db_path):
+    assert execution_outcome("SELECT age FROM singer", "SELECT DISTINCT age FROM singer", db_path) == "incorrect"
+    assert execution_outcome("SELECT age FROM singer ORDER BY age", "SELECT age FROM singer", db_path) == "correct"
+    assert execution_outcome("SELECT age FROM singer ORDER BY age", "SELECT age FROM singer ORDER BY age DESC", db_path) == "incorrect"
+    assert execution_outcome("SELECT 1", "SELECT 1.0", db_path) == "correct"
+
+@pytest.mark.parametrize("sql, ordered", [
+    ("SELECT name FROM singer ORDER BY age", True),
+    ("select name from singer order  by age limit 1", True),
+    ("SELECT * FROM (SELECT name FROM singer ORDER BY age LIMIT 2)", False),
+    ("SELECT name FROM singer WHERE name = 'x order by y'", False),
+])
+def test_has_order_by_only_considers_the_outer_query(sql, ordered):
+    assert has_order_by(sql) == ordered
+
+def test_comparison_stops_once_row_counts_diverge(db_path):
+    huge = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c LIMIT 50000000) SELECT x FROM c"
+    comparison = QueryExecutor(timeout=5).compare(db_path, huge, "SELECT age FROM singer")
+
+    assert comparison.status == comparison.gold_status == "ok"
+    assert not comparison.match
+    assert comparison.gold_rows == 3 and comparison.predicted_rows <= 1000
+    assert comparison.elapsed < 1
+
+def test_large_results_are_compared_by_streaming(db_path):
+    numbers = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c LIMIT 5000) SELECT x, x % 7 FROM c"
+    executor = QueryExecutor()
+
+    comparison = executor.compare(db_path, numbers + " ORDER BY x DESC", numbers)
+    assert comparison.match and comparison.predicted_rows == comparison.gold_rows == 5000
+
+    comparison = executor.compare(db_path, numbers + " ORDER BY x DESC", numbers + " ORDER BY x", ordered=True)
+    assert not comparison.match and comparison.predicted_rows <= 1000
+
+    assert not executor.compare(db_path, numbers.replace("x % 7", "x % 5"), numbers).match
+
+def test_large_results_differing_by_colliding_values_do_not_match(db_path):
+    # CPython hashes -1 and -2 alike; the row digests must not.
+    numbers = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c LIMIT 5000) SELECT {} FROM c"
+    executor = QueryExecutor()
+
+    comparison = executor.compare(db_path, numbers.format(-2), numbers.format(-1))
+    assert not comparison.match and comparison.predicted_rows == comparison.gold_rows == 5000
+    assert executor.compare(db_path, numbers.format("x * 1.0"), numbers.format("x")).match
+
+def test_each_compared_query_gets_its_own_timeout(db_path):
+    executor = QueryExecutor(timeout=0.2)
+    assert execution_outcome("SELECT 1", INFINITE_QUERY, db_path, executor) == "gold_error"
+    # The pooled connection is still usable afterwards
+    assert execution_outcome("SELECT count(*) FROM singer", "SELECT 3", db_path, executor) == "correct"
+
+def test_row_limit_truncates_results(db_path):
+    result = QueryExecutor(max_rows=2).execute(db_path, "SELECT * FROM singer")
+    assert result.status == "row_limit"
+    assert len(result.rows) == 2
+
+def test_subprocess_executor_recycles_workers(db_path):
+    executor = get_executor({"subprocess": True, "timeout": 0.5, "num_workers": 1, "max_tasks_per_worker": 2})
+    try:
+        assert executor.execute(db_path, "SELECT count(*) FROM singer").rows == [(3,)]
+        assert executor.execute(db_path, INFINITE_QUERY).status == "timeout"
+        assert executor.execute(db_path, "SELECT name FROM singer WHERE id = 1").rows == [("Ann",)]
+        assert execution_outcome("SELECT name FROM singer", "SELECT name FROM singer ORDER BY id", db_path, executor) == "correct"
+        assert execution_outcome(INFINITE_QUERY, "SELECT 1", db_path, executor) == "timeout"
+    finally:
+        executor.close()
+
+SLOW_QUERY = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c LIMIT 300000) SELECT count(*) FROM c"
+
+def test_subprocess_timeouts_only_kill_their_own_worker(db_path):
+    executor = get_executor({"subprocess": True, "timeout": 1.0, "grace_period": 0.1, "num_workers": 2})
+    timed_out = threading.Event()
+    statuses = []
+
+    def run_queries():
+        while not timed_out.is_set():
+            try:
+                # Long enough to be running whenever the other query is killed.
+                statuses.append(executor.execute(db_path, SLOW_QUERY).status)
+            except Exception as e:
+                statuses.append(repr(e))
+
+    thread = threading.Thread(target=run_queries)
+    assert executor.execute(db_path, "SELECT 1").status == "ok"
+    thread.start()
+    try:
+        assert executor.execute(db_path, INFINITE_QUERY).status == "timeout"
+    finally:
+        timed_out.set()
+        thread.join()
+        executor.close()
+
+    assert statuses and set(statuses) == {"ok"}
+
+def _copy_db(db_path, tmp_path, name):
+    copy = tmp_path / f"{name}.sqlite"
+    copy.write_bytes(open(db_path, "rb").read())
+    return str(copy)
+
+def test_replicas_serve_queries_from_memory(db_path):
+    manager = ConnectionManager(replica_bytes=10 * 1024 * 1024)
+    executor = QueryExecutor(manager=manager)
+
+    assert executor.execute(db_path, "SELECT count(*) FROM singer").rows == [(3,)]
+    assert manager.replica_stats()["databases"] == [os.path.abspath(db_path)]
+    # The source file is no longer read.
+    os.remove(db_path)
+    assert executor.execute(db_path, "SELECT name FROM singer WHERE id = 1").rows == [("Ann",)]
+    assert executor.execute(db_path, "DELETE FROM singer").status == "error"
+
+@pytest.mark.parametrize("write", [
+    "DELETE FROM singer",
+    "CREATE TEMP TABLE t AS SELECT 1",
+    "BEGIN",
+    "PRAGMA user_version = 7",
+    "PRAGMA main.query_only = 0",
+])
+def test_replicas_cannot_be_modified(db_path, write):
+    executor = QueryExecutor(replica_bytes=10 * 1024 * 1024)
+    try:
+        # Turning query_only off must not re-enable writes to the shared replica.
+        assert executor.execute(db_path, "PRAGMA query_only = 0").status == "error"
+        assert executor.execute(db_path, write).status == "error"
+        assert executor.execute(db_path, "DELETE FROM singer").status == "error"
+
+        results = []
+        thread = threading.Thread(target=lambda: results.append(executor.execute(db_path, "SELECT count(*) FROM singer")))
+        thread.start()
+        thread.join()
+        assert results[0].rows == [(3,)]
+        assert executor.execute(db_path, "PRAGMA table_info(singer)").status == "ok"
+    finally:
+        executor.close()
+
+def test_replicas_are_evicted_least_recently_used_first(db_path, tmp_path):
+    paths = [_copy_db(db_path, tmp_path, name) for name in "abc"]
+    size = os.path.getsize(paths[0])
+    manager = ConnectionManager(replica_bytes=2 * size)
+
+    for path in (paths[0], paths[1], paths[0], paths[2]):
+        assert manager.get(path).execute("SELECT count(*) FROM singer").fetchone() == (3,)
+
+    stats = manager.replica_stats()
+    assert stats["databases"] == [os.path.abspath(paths[0]), os.path.abspath(paths[2])]
+    assert stats["bytes"] == 2 * size
+    # The evicted database is loaded again, and still reads correctly.
+    assert manager.get(paths[1]).execute("SELECT count(*) FROM singer").fetchone() == (3,)
+    assert manager.replica_stats()["databases"] == [os.path.abspath(paths[2]), os.path.abspath(paths[1])]
+
+def test_replicas_survive_concurrent_eviction(db_path, tmp_path):
+    paths = [_copy_db(db_path, tmp_path, name) for name in "abc"]
+    executor = QueryExecutor(replica_bytes=os.path.getsize(paths[0]))
+    results = []
+
+    def worker(offset):
+        for step in range(60):
+            results.append(executor.execute(paths[(offset + step) % 3], "SELECT count(*) FROM singer").rows)
+
+    threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    executor.close()
+
+    assert results == [[(3,)]] * 240
+
+def test_databases_larger_than_the_budget_are_read_from_disk(db_path):
+    manager = ConnectionManager(replica_bytes=1024)
+    assert manager.get(db_path).execute("SELECT count(*) FROM singer").fetchone() == (3,)
+    assert manager.replica_stats()["databases"] == []
+
+def test_subprocess_workers_keep_their_own_replicas(db_path):
+    executor = get_executor({"subprocess": True, "num_workers": 1, "replica_bytes": 10 * 1024 * 1024})
+    try:
+        assert executor.execute(db_path, "SELECT count(*) FROM singer").rows == [(3,)]
+        assert execution_outcome("SELECT age FROM singer", "SELECT age FROM singer ORDER BY id", db_path, executor) == "correct"
+    finally:
+        executor.close()
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_evaluate_command_scores_results(db_path, tmp_path, workers):
+    results_path = tmp_path / "run.jsonl"
+    records = [
+        {"db_id": "singers", "db_path": db_path, "difficulty": "simple",
+         "generated_sql": "SELECT count(*) FROM singer", "ground_truth_sql": "select count(*) from singer;"},
+        {"db_id": "singers", "db_path": db_path, "difficulty": "simple",
+         "generated_sql": "SELECT name FROM singer WHERE age = 30", "ground_truth_sql": "SELECT name FROM singer WHERE age < 40"},
+        {"db_id": "singers", "db_path": db_path, "difficulty": "hard",
+         "generated_sql": "SELECT nope FROM singer", "ground_truth_sql": "SELECT name FROM singer"},
+        {"db_id": "other", "db_path": db_path, "difficulty": "hard",
+         "generated_sql": INFINITE_QUERY, "ground_truth_sql": "SELECT 1"},
+    ]
+    results_path.write_text("".join(json.dumps(r) + "\n" for r in records))
+
+    result = CliRunner().invoke(app, ["evaluate", "--results", str(results_path), "--workers", str(workers), "--timeout", "0.2"])
+
+    assert result.exit_code == 0, result.output
+    summary = json.loads((tmp_path / "run.summary.json").read_text())
+    assert summary["count"] == 4
+    assert summary["em"] == 0.25
+    assert summary["ex"] == 0.5
+    assert summary["outcomes"] == {"correct": 2, "error": 1, "timeout": 1}
+    assert summary["by_difficulty"]["simple"]["ex"] == 1.0
+    assert summary["by_db"]["other"]["count"] == 1
+
+    # Scored records are grouped by database, in the order the shards finish.
+    scored = [json.loads(line) for line in (tmp_path / "run.scored.jsonl").read_text().splitlines()]
+    assert sorted((r["generated_sql"], r["ex_outcome"]) for r in scored) == sorted(
+        (r["generated_sql"], outcome) for r, outcome in zip(records, ["correct", "correct", "error", "timeout"])
+    )
+
+def test_evaluate_shards_records_by_their_index_offsets(db_path, tmp_path):
+    results_path = str(tmp_path / "run.jsonl")
+    with ResultsStore(results_path).open() as store:
+        for index, (db_id, sql) in enumerate([("a:b", "SELECT 1"), ("c", "SELECT 2"), ("a:b", "SELECT 3")]):
+            store.write({"item_id": make_item_id(db_id, sql, index), "db_id": db_id, "db_path": db_path,
+                         "question": sql, "generated_sql": sql, "ground_truth_sql": "SELECT 1"})
+
+    shards = _indexed_shards(results_path, os.path.getsize(results_path))
+    assert shards == _scanned_shards(results_path)
+    assert [len(ranges) for ranges in shards.values()] == [2, 1]
+    # An index that does not cover the whole file is not trusted.
+    with open(results_path, "a") as f:
+        f.write(json.dumps({"db_id": "c", "db_path": db_path, "generated_sql": "SELECT 1", "ground_truth_sql": "SELECT 1"}) + "\n")
+    assert _indexed_shards(results_path, os.path.getsize(results_path)) is None
+
+    summary = evaluate_results(results_path, num_workers=1)
+    assert summary["count"] == 4
+    assert summary["by_db"] == {"a:b": {"count": 2, "em": 0.5, "ex": 0.5}, "c": {"count": 2, "em": 0.5, "ex": 0.5}}
+
+def test_evaluate_skips_records_without_a_db_id(db_path, tmp_path):
+    record = {"db_id": "singers", "db_path": db_path, "generated_sql": "SELECT 1", "ground_truth_sql": "SELECT 1"}
+    results_path = tmp_path / "run.jsonl"
+    results_path.write_text("".join(json.dumps(r) + "\n" for r in [
+        record, {k: v for k, v in record.items() if k != "db_id"}, "not a record", record,
+    ]) + "{broken\n")
+    assert evaluate_results(str(results_path), num_workers=1)["count"] == 2
+
+    # Indexed records are checked when their shard reads them.
+    indexed_path = str(tmp_path / "indexed.jsonl")
+    with ResultsStore(indexed_path).open() as store:
+        store.write({"item_id": make_item_id("singers", "q", 0), **record})
+        store.write({"item_id": make_item_id("singers", "q", 1), "db_path": db_path, "generated_sql": "SELECT 1"})
+    summary = evaluate_results(indexed_path, num_workers=1)
+    assert summary["count"] == 1 and summary["by_db"]["singers"]["ex"] == 1.0
+
+def test_correct_results_above_max_rows_are_rewarded(db_path):
+    numbers = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c LIMIT 5000) SELECT x FROM c"
+    env = SQLExecutionEnvironment(executor=QueryExecutor(max_rows=1000))
+    try:
+        _, rewards = env.step_batch([
+            (numbers + " ORDER BY x DESC", db_path, numbers),
+            (numbers + " WHERE x > 1", db_path, numbers),
+        ])
+        assert rewards == [1.0, 0.0]
+        assert execution_accuracy(numbers + " ORDER BY x DESC", numbers, db_path) == 1
+    finally:
+        env.close()
+    assert env._pool is None
+
+def test_step_batch_scores_across_databases(db_path, tmp_path):
+    other_path = tmp_path / "other.sqlite"
+    con = sqlite3.connect(other_path)
+    con.execute("CREATE TABLE t (x INTEGER)")
+    con.execute("INSERT INTO t VALUES (7)")
+    con.commit()
+    con.close()
+
+    env = SQLExecutionEnvironment(executor=QueryExecutor(timeout=0.2), timeout_reward=-0.5)
+    observations, rewards = env.step_batch([
+        ("SELECT count(*) FROM singer", db_path, "SELECT count(*) FROM singer"),
+        ("SELECT x FROM t", str(other_path), "SELECT 8"),
+        ("SELECT nope FROM t", str(other_path), "SELECT x FROM t"),
+        (INFINITE_QUERY, db_path, "SELECT 1"),
+        ("SELECT name FROM singer WHERE id = 2", db_path, None),
+    ])
+
+    assert rewards == [1.0, 0.0, -1.0, -0.5, 1.0]
+    assert observations[0] == "The 1 rows match the ground truth."
+    assert observations[4] == "[('Bob',)]"
+    assert env.timeouts == 1
+    assert len(env._pool.environments) == 2
@@ -0,0 +1,208 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+
+from sudo_sql.models.base import BaseModelProvider
+from sudo_sql.models.cached import CachedProvider
+from sudo_sql.models.openai import OpenAIProvider
+from sudo_sql.models.sql_stream import SQLStreamParser, extract_sql
+from sudo_sql.telemetry import telemetry
+
+@pytest.fixture
+def provider():
+    with patch('sudo_sql.models.openai.OpenAI'):
+        yield OpenAIProvider(model="TestModel", base_url="http://localhost:1/v1")
+
+def test_generate_many_bounds_in_flight_requests(provider):
+    """Tests that generate_many never exceeds max_concurrency and returns every result."""
+    in_flight = 0
+    peak = 0
+
+    async def fake_generate_async(prompt):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return prompt.upper()
+
+    provider.generate_async = fake_generate_async
+
+    async def collect():
+        return [r async for r in provider.generate_many((f"p{i}" for i in range(20)), max_concurrency=3)]
+
+    results = asyncio.run(collect())
+
+    assert peak == 3
+    assert sorted(results) == sorted((i, f"P{i}") for i in range(20))
+
+def test_generate_many_rejects_invalid_concurrency(provider):
+    async def collect():
+        return [r async for r in provider.generate_many(["p"], max_concurrency=0)]
+
+    with pytest.raises(ValueError):
+        asyncio.run(collect())
+
+class CountingProvider(BaseModelProvider):
+    provider_name = "counting"
+
+    def __init__(self, deterministic=True, temperature=0):
+        self.calls = 0
+        self.deterministic = deterministic
+        self.temperature = temperature
+
+    def generate(self, prompt):
+        self.calls += 1
+        return f"SELECT '{prompt}' -- {self.calls}"
+
+    def cache_identity(self):
+        return {"provider": self.provider_name, "model": "m", "params": {"temperature": self.temperature}}
+
+    def is_deterministic(self):
+        return self.deterministic
+
+def test_cached_provider_serves_repeated_prompts_from_disk(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    inner = CountingProvider()
+    first = CachedProvider(inner, path=path)
+    assert first.generate("q1") == "SELECT 'q1' -- 1"
+    first.close()
+
+    # A new run with the same settings reuses the stored response.
+    second = CachedProvider(inner, path=path)
+    assert second.generate("q1") == "SELECT 'q1' -- 1"
+    assert second.generate("q2") == "SELECT 'q2' -- 2"
+    assert second.stats() == {"hits": 1, "misses": 1, "bypassed": 0}
+
+    # Other generation parameters do not share entries.
+    other = CachedProvider(CountingProvider(temperature=0.0001), path=path)
+    assert other.generate("q1") == "SELECT 'q1' -- 1"
+    assert other.stats()["misses"] == 1
+
+def test_cached_provider_bypasses_sampling_providers(tmp_path):
+    inner = CountingProvider(deterministic=False)
+    cached = CachedProvider(inner, path=str(tmp_path / "responses.sqlite"))
+
+    assert cached.generate("q") != cached.generate("q")
+    assert cached.stats() == {"hits": 0, "misses": 0, "bypassed": 2}
+    assert len(cached.store) == 0
+
+def test_cached_provider_generate_many_uses_cache(tmp_path):
+    inner = CountingProvider()
+    cached = CachedProvider(inner, path=str(tmp_path / "responses.sqlite"))
+
+    async def collect(prompts):
+        return sorted([r async for r in cached.generate_many(prompts, max_concurrency=2)])
+
+    asyncio.run(collect(["a", "b"]))
+    results = asyncio.run(collect(["a", "b", "c"]))
+
+    assert inner.calls == 3
+    assert [text for _, text in results][:2] == ["SELECT 'a' -- 1", "SELECT 'b' -- 2"]
+
+def test_openai_provider_is_deterministic_only_at_temperature_zero():
+    with patch('sudo_sql.models.openai.OpenAI'):
+        assert not OpenAIProvider(model="m").is_deterministic()
+        assert OpenAIProvider(model="m", params={"temperature": 0}).is_deterministic()
+
+def test_openai_provider_cache_identity_includes_endpoint():
+    with patch('sudo_sql.models.openai.OpenAI'):
+        local = OpenAIProvider(model="m", base_url="http://localhost:8192/v1", params={"temperature": 0})
+        hosted = OpenAIProvider(model="m", base_url="https://api.openai.com/v1", params={"temperature": 0})
+
+    assert local.cache_identity() != hosted.cache_identity()
+
+def test_openai_provider_records_latency_and_token_usage(provider):
+    response = MagicMock()
+    response.choices[0].message.content = "SELECT 1"
+    response.usage.prompt_tokens = 12
+    response.usage.completion_tokens = 3
+    provider.client.chat.completions.create.return_value = response
+
+    telemetry.reset()
+    provider.generate("p")
+    provider.generate("q")
+
+    summary = telemetry.summary()
+    assert summary['counters'] == {"tokens.prompt": 24, "tokens.completion": 6}
+    assert summary['spans']['model.request']['count'] == 2
+
+@pytest.mark.parametrize("text, expected", [
+    ("```sql\nSELECT a FROM t WHERE b = ';'\n```\nThis query returns...", "SELECT a FROM t WHERE b = ';'"),
+    ("Sure! SELECT \"x;y\" FROM t /* ; */ WHERE a = 1; Explanation: ...", "SELECT \"x;y\" FROM t /* ; */ WHERE a = 1"),
+    ("SELECT name FROM t -- pick; names\nWHERE id = 1;\n", "SELECT name FROM t -- pick; names\nWHERE id = 1"),
+    ("Let me select the columns:\n```\nselect a from t\n```", "select a from t"),
+    ("with x as (select 1) select * from x", "with x as (select 1) select * from x"),
+    ("I cannot answer that.", "I cannot answer that."),
+])
+def test_sql_stream_parser_extracts_the_first_statement(text, expected):
+    assert extract_sql(text) == expected
+    # Fed one character at a time, the parser finds the same statement.
+    parser = SQLStreamParser()
+    for char in text:
+        if parser.feed(char):
+            break
+    assert parser.result() == expected
+
+def test_sql_stream_parser_waits_for_split_markers():
+    parser = SQLStreamParser()
+    assert not parser.feed("SELECT a FROM t WHERE b = 1 -")
+    assert not parser.feed("- c;\n")
+    assert parser.feed("AND d = 2;")
+    assert parser.result() == "SELECT a FROM t WHERE b = 1 -- c;\nAND d = 2"
+
+def fake_chunk(content, index=0):
+    return SimpleNamespace(choices=[SimpleNamespace(index=index, delta=SimpleNamespace(content=content))])
+
+class FakeStream:
+    def __init__(self, pieces):
+        # A piece is the delta of choice 0, or a (choice index, delta) tuple.
+        self.pieces = pieces
+        self.consumed = 0
+        self.closed = False
+
+    def __iter__(self):
+        for piece in self.pieces:
+            self.consumed += 1
+            yield fake_chunk(piece[1], piece[0]) if isinstance(piece, tuple) else fake_chunk(piece)
+
+    def close(self):
+        self.closed = True
+
+def test_openai_streaming_stops_at_complete_sql(provider):
+    pieces = ["Here", " you go:\n```sql\n", "SELECT", " a FROM", " t", "\n```", "\nThis", " query"] + [" more"] * 50
+    stream = FakeStream(pieces)
+    provider.client.chat.completions.create.return_value = stream
+    provider.stream = True
+    provider.params = {"max_tokens": 100}
+
+    telemetry.reset()
+    assert provider.generate("p") == "SELECT a FROM t"
+
+    assert provider.client.chat.completions.create.call_args.kwargs["stream"] is True
+    assert stream.consumed == 6 and stream.closed
+    counters = telemetry.summary()["counters"]
+    assert counters["stream.early_stops"] == 1
+    assert counters["tokens.saved_upper_bound"] == 94
+
+def test_openai_generate_candidates_requests_n_choices(provider):
+    response = MagicMock()
+    response.choices = [
+        SimpleNamespace(index=1, message=SimpleNamespace(content=" SELECT 2 ")),
+        SimpleNamespace(index=0, message=SimpleNamespace(content="SELECT 1")),
+    ]
+    provider.client.chat.completions.create.return_value = response
+
+    assert provider.generate_candidates("p", 2) == ["SELECT 1", "SELECT 2"]
+    assert provider.client.chat.completions.create.call_count == 1
+    assert provider.client.chat.completions.create.call_args.kwargs["n"] == 2
+
+def test_openai_streaming_candidates_stop_once_every_choice_is_complete(provider):
+    pieces = [(0, "SELECT a FROM t;"), (1, "SELECT"), (1, " b FROM t"), (0, " more"), (1, ";"), (0, " more"), (1, " more")]
+    stream = FakeStream(pieces)
+    provider.client.chat.completions.create.return_value = stream
+    provider.stream = True
+
+    assert provider.generate_candidates("p", 2) == ["SELECT a FROM t", "SELECT b FROM t"]
+    assert stream.consumed == 5 and stream.closed
@@ -1,11 +1,13 @@
 import pytest
 import yaml
-from unittest.mock import patch
+import torch
+from unittest.mock import patch, MagicMock
 
 from sudo_sql.pipeline import get_pipeline
 from sudo_sql.pipeline.inference import InferencePipeline
 from sudo_sql.pipeline.sft import SFTPipeline
 from sudo_sql.pipeline.rl import RLPipeline
+from sudo_sql.environments.sft import SFTEnvironment
 
 @pytest.fixture
 def mock_config(tmp_path):
@@ -36,3 +38,75 @@ def test_get_pipeline_unknown(mock_config):
     config_path = mock_config("unknown")
     with pytest.raises(ValueError):
         get_pipeline(config_path)
+
+class _WordTokenizer:
+    def encode(self, text, return_tensors=None):
+        return torch.arange(len(text.split())).unsqueeze(0)
+
+    def batch_decode(self, sequences, skip_special_tokens):
+        return [f"SELECT {len(seq)}" for seq in sequences]
+
+def test_train_loop_steps_once_per_length_bucketed_batch():
+    config = {'mode': 'sft', 'model': {}, 'ppo': {'batch_size': 2}, 'training': {'epochs': 2}}
+    pipeline = SFTPipeline(config)
+    dataset = [
+        {'question': ' '.join(['word'] * length), 'schema': 's', 'sql': f"SELECT {length + 8}", 'db_path': None}
+        for length in (5, 1, 4, 2, 3)
+    ]
+    ppo_trainer = MagicMock()
+    ppo_trainer.tokenizer = _WordTokenizer()
+    ppo_trainer.generate.side_effect = lambda queries, gen_len, batch_size: queries
+    env = SFTEnvironment()
+
+    pipeline._train_loop(ppo_trainer, env, dataset)
+
+    # 5 items in batches of 2 -> 3 steps per epoch
+    assert ppo_trainer.step.call_count == 6
+    batch_sizes = [call.kwargs['batch_size'] for call in ppo_trainer.generate.call_args_list]
+    assert batch_sizes == [2, 2, 1] * 2
+    first_step = ppo_trainer.step.call_args_list[0].kwargs
+    # The two shortest prompts (9 and 10 tokens) are batched together and rewarded against their own SQL
+    assert first_step['responses'] == ["SELECT 9", "SELECT 10"]
+    assert [score.item() for score in first_step['scores']] == [1.0, 1.0]
+
+class _PretokenizingWordTokenizer(_WordTokenizer):
+    name_or_path = "words"
+
+    def __call__(self, texts):
+        return {"input_ids": [self.encode(text)[0].tolist() for text in texts]}
+
+    def __len__(self):
+        return 1000
+
+class _FakeStreamingDataset(list):
+    loader = type("Loader", (), {"dataset_name": "test_ds"})()
+    split = "dev"
+    schema_type = "ddl-schema"
+
+    def fingerprint(self):
+        return "v1"
+
+def test_train_loop_builds_pretokenized_prompts_once(tmp_path):
+    config = {
+        'mode': 'sft', 'model': {}, 'ppo': {'batch_size': 2}, 'training': {'epochs': 3},
+        'generation': {'tokenized_cache_dir': str(tmp_path)},
+        'schema_pruning': {'enabled': True, 'top_k_tables': 1},
+    }
+    pipeline = SFTPipeline(config)
+    schema = "CREATE TABLE singer (name TEXT);\nCREATE TABLE stadium (location TEXT);"
+    dataset = _FakeStreamingDataset(
+        {'question': f"name of singer {index}", 'schema': schema, 'sql': "SELECT 1", 'db_path': None}
+        for index in range(5)
+    )
+    ppo_trainer = MagicMock()
+    ppo_trainer.tokenizer = _PretokenizingWordTokenizer()
+    ppo_trainer.generate.side_effect = lambda queries, gen_len, batch_size: queries
+
+    with patch("sudo_sql.pipeline.base.StreamingDataset", _FakeStreamingDataset), \
+            patch.object(pipeline, "_build_prompt", wraps=pipeline._build_prompt) as build_prompt:
+        pipeline._train_loop(ppo_trainer, SFTEnvironment(), dataset)
+
+    # Prompts are built and pruned while pretokenizing only; epochs read the cached ids.
+    assert build_prompt.call_count == 5
+    assert ppo_trainer.step.call_count == 9
+    assert pipeline.schema_pruner.stats()['questions'] == 5
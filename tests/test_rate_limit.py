@@ -0,0 +1,193 @@
+import json
+import time
+import asyncio
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sudo_sql.models.openai import OpenAIProvider
+from sudo_sql.models.rate_limit import TokenBucket, RateLimiter, RetryPolicy, AdaptiveConcurrency, retry_after
+
+class StubEndpoint:
+    """
+    A local chat completions endpoint. `script` lists the status of successive
+    requests (200 once it runs out); with `max_concurrent`, requests beyond that
+    many in flight are throttled.
+    """
+    def __init__(self, script=(), retry_after="0", max_concurrent=None, latency=0.0):
+        self.script = list(script)
+        self.retry_after = retry_after
+        self.max_concurrent = max_concurrent
+        self.latency = latency
+        self.requests = 0
+        self.in_flight = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                with stub.lock:
+                    stub.requests += 1
+                    stub.in_flight += 1
+                    status = stub.script.pop(0) if stub.script else 200
+                    if stub.max_concurrent is not None and stub.in_flight > stub.max_concurrent:
+                        status = 429
+                    if status == 429:
+                        stub.throttled += 1
+                try:
+                    time.sleep(stub.latency)
+                    if status == 200:
+                        body = {
+                            "id": "x", "object": "chat.completion", "created": 0, "model": "stub",
+                            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": " SELECT 1 "}}],
+                            "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+                        }
+                    else:
+                        body = {"error": {"message": f"status {status}", "type": "error"}}
+                    payload = json.dumps(body).encode()
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    if status == 429 and stub.retry_after is not None:
+                        self.send_header("Retry-After", stub.retry_after)
+                    self.end_headers()
+                    self.wfile.write(payload)
+                finally:
+                    with stub.lock:
+                        stub.in_flight -= 1
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def endpoint():
+    endpoints = []
+
+    def _endpoint(**options):
+        endpoints.append(StubEndpoint(**options))
+        return endpoints[-1]
+
+    yield _endpoint
+    for stub in endpoints:
+        stub.close()
+
+def test_token_bucket_reserves_in_arrival_order():
+    now = [0.0]
+    bucket = TokenBucket(rate=2.0, capacity=2.0, clock=lambda: now[0])
+
+    assert bucket.reserve(1) == 0.0
+    assert bucket.reserve(1) == 0.0
+    assert bucket.reserve(1) == pytest.approx(0.5)
+    assert bucket.reserve(3) == pytest.approx(2.0)
+    now[0] = 10.0
+    assert bucket.reserve(2) == 0.0
+
+def test_rate_limiter_paces_requests_and_tokens():
+    now = [0.0]
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=6000, clock=lambda: now[0])
+
+    assert limiter.reserve(50) == 0.0
+    # The request bucket holds one second of requests.
+    assert limiter.reserve(10) == pytest.approx(1.0)
+    # 100 tokens per second: a 400 token request waits for the token bucket.
+    assert limiter.reserve(400) == pytest.approx(3.6)
+    # Requests that used fewer tokens than estimated give them back.
+    limiter.settle(400, 40)
+    assert limiter.tokens.level == pytest.approx(0.0)
+
+def test_retry_policy_honours_retry_after():
+    class Response:
+        headers = {"retry-after": "7"}
+
+    class Throttled(Exception):
+        status_code = 429
+        response = Response()
+
+    policy = RetryPolicy(initial_delay=1.0, max_delay=30.0)
+    assert retry_after(Throttled()) == 7.0
+    assert policy.delay(0, Throttled()) == 7.0
+    assert policy.is_retryable(Throttled()) and policy.is_throttle(Throttled())
+    assert all(0 <= policy.delay(3) <= 8.0 for _ in range(100))
+    assert RetryPolicy(jitter=False, max_delay=30.0).delay(10) == 30.0
+
+def test_adaptive_concurrency_aimd():
+    concurrency = AdaptiveConcurrency(initial=8, minimum=1, maximum=10)
+
+    async def run():
+        await concurrency.acquire()
+        started = time.perf_counter()
+        concurrency.release(started, congested=True)
+        assert concurrency.limit == 4
+        # A second failure of a request sent before the decrease does not count again.
+        await concurrency.acquire()
+        concurrency.release(started, congested=True)
+        assert concurrency.limit == 4
+        for _ in range(4):
+            await concurrency.acquire()
+            concurrency.release(time.perf_counter())
+        assert 4.9 < concurrency.limit < 5.1
+
+    asyncio.run(run())
+
+def test_generate_retries_throttled_and_failed_requests(endpoint):
+    stub = endpoint(script=[429, 503, 429])
+    provider = OpenAIProvider(model="stub", base_url=stub.base_url, retry={"initial_delay": 0.01})
+
+    assert provider.generate("question") == "SELECT 1"
+    assert stub.requests == 4
+
+def test_generate_gives_up_on_client_errors_and_after_max_retries(endpoint):
+    from openai import BadRequestError, RateLimitError
+
+    stub = endpoint(script=[400])
+    provider = OpenAIProvider(model="stub", base_url=stub.base_url, retry={"initial_delay": 0.01})
+    with pytest.raises(BadRequestError):
+        provider.generate("question")
+    assert stub.requests == 1
+
+    stub = endpoint(script=[429] * 10)
+    provider = OpenAIProvider(model="stub", base_url=stub.base_url, retry={"max_retries": 2, "initial_delay": 0.01})
+    with pytest.raises(RateLimitError):
+        provider.generate("question")
+    assert stub.requests == 3
+
+def test_generate_waits_as_long_as_retry_after_asks(endpoint):
+    stub = endpoint(script=[429], retry_after="0.3")
+    provider = OpenAIProvider(model="stub", base_url=stub.base_url, retry={"initial_delay": 0.01})
+
+    start = time.perf_counter()
+    provider.generate("question")
+    assert time.perf_counter() - start >= 0.3
+
+def test_concurrent_requests_adapt_to_a_throttling_endpoint(endpoint):
+    stub = endpoint(max_concurrent=2, latency=0.02)
+    provider = OpenAIProvider(
+        model="stub",
+        base_url=stub.base_url,
+        retry={"max_retries": 20, "initial_delay": 0.01, "max_delay": 0.05},
+        adaptive_concurrency={"initial": 8, "maximum": 8},
+        connection_pool={"max_connections": 8, "max_keepalive_connections": 8, "timeout": 10},
+    )
+
+    async def collect():
+        try:
+            return [result async for result in provider.generate_many((f"q{i}" for i in range(30)), max_concurrency=8)]
+        finally:
+            await provider.aclose()
+
+    results = asyncio.run(collect())
+
+    assert sorted(index for index, _ in results) == list(range(30))
+    assert stub.throttled > 0
+    assert provider.concurrency.limit < 8
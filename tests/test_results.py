@@ -0,0 +1,123 @@
+import os
+import json
+import pytest
+
+from sudo_sql.results import ResultsStore, make_item_id, item_index, merge_results
+
+def _record(db_id, question, index, sql="SELECT 1"):
+    return {
+        "item_id": make_item_id(db_id, question, index),
+        "db_id": db_id,
+        "question": question,
+        "generated_sql": sql,
+        "ground_truth_sql": sql,
+    }
+
+@pytest.fixture
+def results_path(tmp_path):
+    return str(tmp_path / "results" / "run.jsonl")
+
+def test_item_ids_distinguish_repeated_questions():
+    assert make_item_id("db_a", "How many rows?", 0) != make_item_id("db_b", "How many rows?", 1)
+    assert make_item_id("db_a", "How many rows?", 0) == make_item_id("db_a", "How many rows?", 0)
+
+def test_records_are_buffered_until_flush(results_path):
+    store = ResultsStore(results_path, flush_every=10, flush_interval=3600).open()
+    store.write(_record("db", "q1", 0))
+
+    with open(results_path) as f:
+        assert f.read() == ""
+
+    store.close()
+    with open(results_path) as f:
+        assert [json.loads(line)["question"] for line in f] == ["q1"]
+
+def test_resume_reads_index_instead_of_results(results_path):
+    with ResultsStore(results_path, flush_every=1).open() as store:
+        store.write(_record("db_a", "same question", 0))
+        store.write(_record("db_b", "same question", 1))
+
+    # Replace the results with garbage of the same length: resume must not need to parse it.
+    with open(results_path, "rb") as f:
+        size = len(f.read())
+    with open(results_path, "wb") as f:
+        f.write(b"x" * (size - 1) + b"\n")
+
+    store = ResultsStore(results_path).open(resume=True)
+    assert len(store) == 2
+    assert make_item_id("db_b", "same question", 1) in store
+    assert make_item_id("db_b", "same question", 2) not in store
+    store.close()
+
+def test_resume_recovers_torn_last_line_and_unindexed_tail(results_path):
+    with ResultsStore(results_path, flush_every=1).open() as store:
+        store.write(_record("db", "q1", 0))
+
+    # A result written without its index entry, then a torn write.
+    with open(results_path, "a") as f:
+        f.write(json.dumps(_record("db", "q2", 1)) + "\n")
+        f.write('{"item_id": "db:torn')
+
+    with ResultsStore(results_path).open(resume=True) as store:
+        assert len(store) == 2
+        assert make_item_id("db", "q2", 1) in store
+        store.write(_record("db", "q3", 2))
+
+    with open(results_path) as f:
+        assert [json.loads(line)["question"] for line in f] == ["q1", "q2", "q3"]
+    with open(results_path + ".idx") as f:
+        assert len(f.readlines()) == 3
+
+def test_resume_matches_legacy_records_on_question(results_path):
+    legacy = {"db_id": "db", "question": "q1", "generated_sql": "", "ground_truth_sql": ""}
+    os.makedirs(os.path.dirname(results_path))
+    with open(results_path, "w") as f:
+        f.write(json.dumps(legacy) + "\n")
+
+    with ResultsStore(results_path).open(resume=True) as store:
+        assert store.is_completed(make_item_id("db", "q1", 7), "db", "q1")
+        assert not store.is_completed(make_item_id("other_db", "q1", 7), "other_db", "q1")
+
+def _write_lines(path, records):
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+def test_merge_orders_shards_and_drops_duplicates(tmp_path):
+    shard_0 = tmp_path / "run.shard-000-of-002.jsonl"
+    shard_1 = tmp_path / "run.shard-001-of-002.jsonl"
+    # Concurrent runs write out of order; index 4 is missing from both shards.
+    _write_lines(shard_0, [_record("db", "q2", 2), _record("db", "q0", 0)])
+    _write_lines(shard_1, [_record("db", "q1", 1), _record("db", "q3", 3), _record("db", "q5", 5),
+                           _record("db", "q1", 1), _record("db", "q3", 3, sql="SELECT 2")])
+    output = str(tmp_path / "merged" / "run.jsonl")
+
+    stats = merge_results([str(shard_0), str(shard_1)], output)
+
+    assert stats == {"files": 2, "records": 7, "duplicates": 2, "conflicts": 1, "written": 5, "missing": 1}
+    with open(output) as f:
+        merged = [json.loads(line) for line in f]
+    assert [record["question"] for record in merged] == ["q0", "q1", "q2", "q3", "q5"]
+    assert merged[3]["generated_sql"] == "SELECT 1"
+    with ResultsStore(output).open(resume=True) as store:
+        assert len(store) == 5
+
+def test_merge_keeps_legacy_records_and_refuses_to_overwrite_inputs(tmp_path):
+    shard = tmp_path / "shard.jsonl"
+    legacy = {"db_id": "db", "question": "old", "generated_sql": "", "ground_truth_sql": ""}
+    _write_lines(shard, [legacy, _record("db", "q0", 0)])
+
+    with pytest.raises(ValueError):
+        merge_results([str(shard)], str(shard))
+
+    output = str(tmp_path / "merged.jsonl")
+    merge_results([str(shard)], output)
+    with open(output) as f:
+        merged = [json.loads(line) for line in f]
+    assert [record["question"] for record in merged] == ["q0", "old"]
+    with ResultsStore(output).open(resume=True) as store:
+        assert store.is_completed(make_item_id("db", "old", 9), "db", "old")
+
+def test_item_index():
+    assert item_index(make_item_id("db", "q", 12)) == 12
+    assert item_index("no-index") is None
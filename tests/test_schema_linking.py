@@ -0,0 +1,86 @@
+import sqlite3
+import time
+import pytest
+
+from sudo_sql.schema_linking import SchemaIndex, SchemaPruner
+
+TEXT_SCHEMA = """# Table: singer
+[
+(singer_id, Primary Key, the id of the singer. Value examples: [1, 2].)
+(name, the name of the singer. Value examples: ['Joe Sharp'].)
+(country, the country of the singer. Value examples: ['Netherlands'].)
+(age, the age of the singer. Value examples: [52].)
+]
+
+# Table: concert
+[
+(concert_id, Primary Key, the id of the concert. Value examples: [1].)
+(concert_name, the name of the concert. Value examples: ['Auditions'].)
+(stadium_id, the stadium of the concert, Maps to stadium(stadium_id).)
+(year, the year of the concert. Value examples: ['2014'].)
+]
+
+# Table: stadium
+[
+(stadium_id, Primary Key, the id of the stadium.)
+(location, the location of the stadium. Value examples: ['Raith Rovers'].)
+(capacity, the capacity of the stadium. Value examples: [52500].)
+]"""
+
+DDL_SCHEMA = """CREATE TABLE singer (
+  singer_id INTEGER PRIMARY KEY,
+  name TEXT,
+  country TEXT,
+  age INTEGER
+);
+CREATE TABLE stadium (
+  stadium_id INTEGER PRIMARY KEY,
+  location TEXT,
+  capacity INTEGER
+);"""
+
+def test_prune_keeps_relevant_tables_and_key_columns():
+    pruned = SchemaIndex(TEXT_SCHEMA).prune("What is the capacity of each stadium?", top_k_tables=1, top_k_columns=1)
+
+    assert "# Table: stadium" in pruned
+    assert "(capacity," in pruned
+    assert "(stadium_id," in pruned  # key column
+    assert "(location," not in pruned
+    assert "singer" not in pruned and "concert" not in pruned
+    assert "\n\n\n" not in pruned
+
+def test_prune_ddl_keeps_statements_valid():
+    pruned = SchemaIndex(DDL_SCHEMA).prune("How many singers are from each country?", top_k_tables=1, top_k_columns=1)
+
+    con = sqlite3.connect(":memory:")
+    con.executescript(pruned)
+    tables = {name: [row[1] for row in con.execute(f"PRAGMA table_info({name})")] for name, in con.execute("SELECT name FROM sqlite_master")}
+    assert tables == {"singer": ["singer_id", "country"]}
+
+def test_sample_values_link_questions_to_columns(tmp_path):
+    db_path = tmp_path / "concert_singer.sqlite"
+    con = sqlite3.connect(db_path)
+    con.executescript(DDL_SCHEMA)
+    con.execute("INSERT INTO stadium VALUES (1, 'Glasgow', 1000)")
+    con.commit()
+    con.close()
+
+    pruned = SchemaIndex(DDL_SCHEMA, str(db_path)).prune("Which ones are in Glasgow?", top_k_tables=1, top_k_columns=1)
+    assert "location TEXT" in pruned and "singer" not in pruned
+
+def test_unrecognized_schema_is_returned_unchanged():
+    assert SchemaIndex("free-form description").prune("anything", 1, 1) == "free-form description"
+
+def test_pruner_reports_token_counts_and_is_fast():
+    pruner = SchemaPruner(top_k_tables=1, top_k_columns=2)
+    pruner.prune("Show the name of every concert", TEXT_SCHEMA)
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        pruner.prune("Show the name of every concert", TEXT_SCHEMA)
+    per_question = (time.perf_counter() - start) / 1000
+
+    stats = pruner.stats()
+    assert stats["questions"] == 1001
+    assert 0 < stats["schema_tokens_after"] < stats["schema_tokens_before"]
+    assert per_question < 1e-3
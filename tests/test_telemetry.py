@@ -0,0 +1,45 @@
+from sudo_sql.telemetry import Telemetry, percentile
+
+def test_percentile_uses_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([], 50) == 0.0
+
+def test_summary_and_exports(tmp_path):
+    telemetry = Telemetry()
+    for value in (0.1, 0.2, 0.3, 0.4):
+        telemetry.observe("model.request", value)
+    with telemetry.span("results.write"):
+        pass
+    assert list(telemetry.iterate([1, 2, 3], "dataset.next")) == [1, 2, 3]
+    telemetry.count("tokens.prompt", 100)
+
+    summary = telemetry.summary()
+    assert summary["spans"]["model.request"]["count"] == 4
+    assert summary["spans"]["model.request"]["p50"] == 0.2
+    assert summary["spans"]["dataset.next"]["count"] == 3
+    assert summary["counters"] == {"tokens.prompt": 100}
+    assert summary["throughput"]["tokens.prompt_per_second"] > 0
+
+    telemetry.write_prometheus(str(tmp_path / "metrics.prom"), summary)
+    text = (tmp_path / "metrics.prom").read_text()
+    assert 'sudo_sql_span_seconds{span="model.request",quantile="0.5"} 0.2' in text
+    assert 'sudo_sql_span_seconds_count{span="model.request"} 4' in text
+    assert "sudo_sql_tokens_prompt_total 100" in text
+
+    telemetry.reset()
+    assert telemetry.summary()["spans"] == {}
+
+def test_histograms_keep_a_bounded_sample_but_exact_totals():
+    telemetry = Telemetry(reservoir_size=100)
+    for value in range(1, 10001):
+        telemetry.observe("model.request", float(value))
+
+    assert len(telemetry.histograms["model.request"].samples) == 100
+    stats = telemetry.summary()["spans"]["model.request"]
+    assert stats["count"] == 10000
+    assert stats["total"] == 10000 * 10001 / 2
+    assert stats["mean"] == 5000.5
+    assert stats["max"] == 10000.0
+    assert 3000 < stats["p50"] < 7000
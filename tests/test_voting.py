@@ -0,0 +1,90 @@
+import sqlite3
+import threading
+import pytest
+
+from sudo_sql.database import QueryExecutor
+from sudo_sql.pipeline.voting import CandidateVoter, result_fingerprint
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "singers.sqlite"
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE singer (name TEXT, age INTEGER)")
+    con.executemany("INSERT INTO singer VALUES (?, ?)", [("Joe", 25), ("Ann", 32), ("Bob", 41)])
+    con.commit()
+    con.close()
+    return str(path)
+
+class CountingExecutor(QueryExecutor):
+    def __init__(self):
+        super().__init__(timeout=5)
+        self.executed = []
+        self._lock = threading.Lock()
+
+    def execute(self, db_path, sql):
+        with self._lock:
+            self.executed.append(sql)
+        return super().execute(db_path, sql)
+
+def test_result_fingerprint_ignores_row_order_but_not_repetitions():
+    assert result_fingerprint([(1, "a"), (2, "b")]) == result_fingerprint([(2, "b"), (1, "a")])
+    assert result_fingerprint([(1, "a"), (2, "b")]) != result_fingerprint([(2, "b"), (1, "a"), (1, "a")])
+    assert result_fingerprint([(1, "a")]) != result_fingerprint([("1", "a")])
+    assert result_fingerprint([(-1,)]) != result_fingerprint([(-2,)])
+
+def test_results_equal_under_execution_accuracy_vote_together(db_path):
+    voter = CandidateVoter(QueryExecutor(timeout=5), candidates=2)
+
+    vote = voter.select(["SELECT age FROM singer", "SELECT age * 1.0 FROM singer"], db_path)
+
+    assert (vote.votes, vote.distinct, vote.executed) == (2, 2, 2)
+    assert result_fingerprint([(1,), (2.5,)]) == result_fingerprint([(1.0,), (2.5,)])
+
+def test_each_distinct_candidate_is_executed_once(db_path):
+    executor = CountingExecutor()
+    voter = CandidateVoter(executor, max_workers=4)
+    candidates = [
+        "SELECT name FROM singer WHERE age > 30",
+        "select name from singer where age > 30;",
+        "SELECT  name\nFROM singer WHERE age > 30",
+        "SELECT name FROM singer",
+        "SELECT name FROM singer;",
+    ]
+    vote = voter.select(candidates, db_path)
+    voter.close()
+
+    assert len(executor.executed) == 2
+    assert vote.sql == "SELECT name FROM singer WHERE age > 30"
+    assert (vote.votes, vote.candidates, vote.distinct, vote.executed) == (3, 5, 2, 2)
+
+def test_equivalent_queries_pool_their_votes(db_path):
+    voter = CandidateVoter(QueryExecutor())
+    candidates = [
+        "SELECT name FROM singer",
+        "SELECT name FROM singer",
+        "SELECT name FROM singer WHERE age > 30",
+        "SELECT name FROM singer WHERE age >= 31",
+        "SELECT name FROM singer WHERE age BETWEEN 31 AND 99",
+    ]
+    vote = voter.select(candidates, db_path)
+    voter.close()
+
+    assert vote.votes == 3
+    # The earliest query of the winning result wins among equally frequent ones.
+    assert vote.sql == "SELECT name FROM singer WHERE age > 30"
+
+def test_ties_go_to_the_earliest_result_and_failures_do_not_vote(db_path):
+    voter = CandidateVoter(QueryExecutor())
+    vote = voter.select(["SELECT nme FROM singer", "SELECT age FROM singer", "SELECT name FROM singer"], db_path)
+    voter.close()
+
+    assert vote.sql == "SELECT age FROM singer"
+    assert (vote.votes, vote.executed) == (1, 2)
+
+def test_most_frequent_query_wins_when_nothing_executes(tmp_path):
+    voter = CandidateVoter(QueryExecutor())
+    vote = voter.select(["SELECT a FROM t", "SELECT b FROM t", "select b from t", ""], str(tmp_path / "missing.sqlite"))
+    voter.close()
+
+    assert vote.sql == "SELECT b FROM t"
+    assert (vote.votes, vote.candidates, vote.distinct, vote.executed, vote.fingerprint) == (2, 4, 2, 0, None)